@@ -0,0 +1,317 @@
+"""
+asyncio API of the transpiler.
+
+Transpiling is CPU work that would block the event loop, so it is sent to a
+bounded pool of worker threads. Streams collect their lines as they arrive
+and validate and transpile them in batches in a worker, handing the output
+to the consumer through a bounded queue, so a slow consumer stops the stream
+from reading more of its source.
+"""
+
+from __future__ import annotations
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
+import asyncio
+import os
+import weakref
+
+from transpiler import (
+    DEFAULT_TRANSPILER,
+    SegmentValidator,
+    TemplateCarry,
+    TranspileContext,
+    Transpiler,
+    TranspileStats,
+)
+
+T = TypeVar("T")
+
+DEFAULT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+# Output chunks a stream may hold before it stops reading its source
+DEFAULT_QUEUE_SIZE = 8
+# Preprocessed code a stream collects before transpiling it in one go, a
+# single segment is too little work to be worth a trip to a worker
+BATCH_SIZE = 64 * 1024
+
+# Marks the end of a stream in its queue
+_END = object()
+
+Source = Union[AsyncIterable[Union[str, bytes]], Iterable[Union[str, bytes]]]
+
+
+def _read_lines(lines: Iterator[Union[str, bytes]], size: int) -> List[str]:
+    """Read lines until they hold size characters, fewer at the end"""
+    batch = []
+    for line in lines:
+        batch.append(line.decode("utf-8") if isinstance(line, bytes) else line)
+        size -= len(line)
+        if size <= 0:
+            break
+    return batch
+
+
+class AsyncTranspiler:
+    """
+    Transpiles Rogalang without blocking the event loop.
+
+    At most max_workers transpilations run at once, further calls wait for a
+    free worker without queueing their input in the executor. One instance
+    can be shared by any number of coroutines and event loops.
+    """
+
+    def __init__(
+        self,
+        transpiler: Optional[Transpiler] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        executor: Optional[Executor] = None,
+        batch_size: int = BATCH_SIZE,
+    ):
+        """
+        Args:
+            transpiler: Transpiler to use, defaults to the default semantics
+            max_workers: Number of transpilations that may run at once
+            queue_size: Output chunks a stream may hold for its consumer
+            executor: Executor to run transpilations in, defaults to a pool
+                of max_workers threads owned by this instance
+            batch_size: Characters of code a stream collects before
+                transpiling them
+        """
+        self.transpiler = transpiler or DEFAULT_TRANSPILER
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="rogalang"
+        )
+        # asyncio primitives belong to a single event loop
+        self._slots: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def close(self) -> None:
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> AsyncTranspiler:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_workers)
+        async with slots:
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    async def transpile(
+        self,
+        content: str,
+        stats: Optional[TranspileStats] = None,
+        dialect: Optional[str] = None,
+        minify: bool = False,
+    ) -> str:
+        """
+        Transpile Rogalang code to JavaScript in a worker.
+
+        Args:
+            content: The preprocessed Rogalang code to transpile
+            stats: Profile to record the transpilation in
+            dialect: Name of the dialect to transpile with
+            minify: Whether to drop the whitespace and comments the
+                JavaScript does not need
+
+        Returns:
+            The transpiled JavaScript code
+
+        Raises:
+            ValueError: If there is no such dialect
+        """
+        return await self._run(
+            self.transpiler.transpile, content, stats, dialect, minify
+        )
+
+    async def transpile_stream(
+        self,
+        source: Source,
+        stats: Optional[TranspileStats] = None,
+        dialect: Optional[str] = None,
+        minify: bool = False,
+    ) -> AsyncIterator[str]:
+        """
+        Validate and transpile Rogalang source as its lines arrive.
+
+        The source is read by a separate task, which validates and
+        transpiles its lines in batches in a worker and stops reading while
+        queue_size chunks are waiting for the consumer. A synchronous source is read in a
+        worker, as reading it may block.
+
+        Args:
+            source: Lines of the Rogalang source, e.g. an aiohttp
+                StreamReader or an open file. Bytes are decoded as UTF-8
+            stats: Profile to record the transpilation in
+            dialect: Name of the dialect to transpile with, every batch is
+                transpiled with its semantics at the start of the stream
+            minify: Whether to drop the whitespace and comments the
+                JavaScript does not need
+
+        Yields:
+            Transpiled JavaScript, in order
+
+        Raises:
+            ValueError: If validation fails or there is no such dialect
+        """
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        producer = asyncio.create_task(
+            self._produce(source, queue, stats, dialect, minify)
+        )
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is _END:
+                    break
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            if not producer.done():
+                producer.cancel()
+                try:
+                    await producer
+                except asyncio.CancelledError:
+                    pass
+
+    async def _iter_batches(self, source: Source) -> AsyncIterator[List[str]]:
+        """
+        Iterate over the lines of a synchronous or asynchronous source, in
+        batches holding batch_size characters, fewer at the end
+        """
+        if not hasattr(source, "__aiter__"):
+            lines = iter(source)
+            while True:
+                batch = await self._run(_read_lines, lines, self.batch_size)
+                if not batch:
+                    return
+                yield batch
+        batch = []
+        size = 0
+        async for line in source:
+            batch.append(line.decode("utf-8") if isinstance(line, bytes) else line)
+            size += len(line)
+            if size >= self.batch_size:
+                yield batch
+                batch = []
+                size = 0
+        if batch:
+            yield batch
+
+    async def _produce(
+        self,
+        source: Source,
+        queue: asyncio.Queue,
+        stats: Optional[TranspileStats],
+        dialect: Optional[str],
+        minify: bool,
+    ) -> None:
+        try:
+            semantics, memo = await self._run(self.transpiler._resolve, dialect)
+
+            def transpile(content: str) -> str:
+                context = TranspileContext(semantics, stats, memo, minify=minify)
+                return context.transpile(content)
+
+            validator = SegmentValidator()
+            carry = TemplateCarry(semantics)
+            async for lines in self._iter_batches(source):
+                chunk = await self._run(
+                    self._transpile_lines, validator, carry, lines, transpile
+                )
+                if chunk:
+                    await queue.put(chunk)
+            chunk = await self._run(self._finish, validator, carry, transpile)
+            if chunk:
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_END)
+
+    @staticmethod
+    def _transpile_lines(
+        validator: SegmentValidator,
+        carry: TemplateCarry,
+        lines: List[str],
+        transpile: Callable[[str], str],
+    ) -> str:
+        """
+        Validate a batch of source lines and transpile the segments they
+        complete, leaving the template literal still open in carry
+        """
+        code: List[str] = []
+        for line in lines:
+            segment = validator.feed(line)
+            if segment is not None:
+                code.extend(segment)
+        content = carry.feed("".join(code)) if code else ""
+        return transpile(content) if content else ""
+
+    @staticmethod
+    def _finish(
+        validator: SegmentValidator,
+        carry: TemplateCarry,
+        transpile: Callable[[str], str],
+    ) -> str:
+        """Transpile the last segment and whatever is left in carry"""
+        segment = validator.close()
+        content = carry.feed("".join(segment)) if segment else ""
+        chunk = transpile(content) if content else ""
+        pending = carry.finish()
+        return chunk + transpile(pending) if pending else chunk
+
+
+_default: Optional[AsyncTranspiler] = None
+
+
+def _default_transpiler() -> AsyncTranspiler:
+    global _default
+    if _default is None:
+        _default = AsyncTranspiler()
+    return _default
+
+
+async def transpile_async(
+    content: str,
+    stats: Optional[TranspileStats] = None,
+    dialect: Optional[str] = None,
+    minify: bool = False,
+) -> str:
+    """
+    Transpile Rogalang code to JavaScript with the default semantics without
+    blocking the event loop. See AsyncTranspiler.transpile.
+    """
+    return await _default_transpiler().transpile(content, stats, dialect, minify)
+
+
+def transpile_stream_async(
+    source: Source,
+    stats: Optional[TranspileStats] = None,
+    dialect: Optional[str] = None,
+    minify: bool = False,
+) -> AsyncIterator[str]:
+    """
+    Validate and transpile Rogalang source as its lines arrive with the
+    default semantics. See AsyncTranspiler.transpile_stream.
+    """
+    return _default_transpiler().transpile_stream(source, stats, dialect, minify)
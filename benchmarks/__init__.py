@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Rogalang transpiler.
+
+Run with: python -m benchmarks.run --sizes 1KB,1MB,10MB
+"""
@@ -0,0 +1,138 @@
+"""
+Generator of synthetic, valid Rogalang programs.
+
+The programs keep the herliga london cadence, mix comment lines with jille
+lines and use keywords and operators from the semantics table, with template
+literals nested to a chosen depth.
+"""
+
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional
+import random
+import re
+
+from transpiler import MAX_LINES_BETWEEN_HERLIGA_LONDON, get_semantics
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+IDENTIFIERS = ["tall", "navn", "liste", "svar", "teller", "verdi", "melding"]
+WORDS = ["hei", "verden", "herliga", "fjord", "sild", "regn", "Stavanger"]
+
+# JavaScript sides of the semantics table used to build statements
+BINARY_OPERATORS = ["+", "-", "*", "/", "%", "&&", "||"]
+COMPARISONS = ["==", "===", "!=", "!==", ">", "<", ">=", "<="]
+STATEMENT_KEYWORDS = ["return", "break", "continue", "throw", "delete", "typeof"]
+
+
+def parse_size(size: str) -> int:
+    """Parse sizes like '100MB' or '1KB' into a number of bytes"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Invalid size: {size!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or "B"])
+
+
+def format_size(size: int) -> str:
+    """Format a number of bytes like parse_size expects it"""
+    for unit in ("GB", "MB", "KB"):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return f"{size}B"
+
+
+class CorpusGenerator:
+    """Generates random Rogalang programs from the semantics table"""
+
+    def __init__(self, template_depth: int = 2, seed: Optional[int] = 0):
+        self.template_depth = template_depth
+        self.random = random.Random(seed)
+
+        # Pick the Rogalang spelling of every JavaScript construct we use
+        rogalang: Dict[str, List[str]] = {}
+        for token, js in get_semantics().table.items():
+            rogalang.setdefault(js, []).append(token)
+        self.rogalang = rogalang
+        self.binary_operators = self._tokens(BINARY_OPERATORS)
+        self.comparisons = self._tokens(COMPARISONS)
+        self.statement_keywords = self._tokens(STATEMENT_KEYWORDS)
+
+    def _tokens(self, js_tokens: List[str]) -> List[str]:
+        return [token for js in js_tokens for token in self.rogalang.get(js, [])]
+
+    def _keyword(self, js: str) -> str:
+        return self.random.choice(self.rogalang.get(js, [js]))
+
+    def _expression(self) -> str:
+        rnd = self.random
+        # Tokens ending in a space need a delimiter after them
+        return (
+            f"{rnd.choice(IDENTIFIERS)} {rnd.choice(self.binary_operators)} "
+            f"{rnd.randint(0, 1000)}"
+        )
+
+    def _template(self, depth: int) -> str:
+        rnd = self.random
+        if depth <= 0:
+            return f"`{rnd.choice(WORDS)} ${{{self._expression()}}}`"
+        return (
+            f"`{rnd.choice(WORDS)} ${{{self._template(depth - 1)}}} "
+            f"og ${{{rnd.choice(IDENTIFIERS)}}}`"
+        )
+
+    def _string(self) -> str:
+        rnd = self.random
+        quote = rnd.choice(["'", '"'])
+        return f"{quote}{rnd.choice(WORDS)} {rnd.choice(WORDS)}{quote}"
+
+    def statement(self) -> str:
+        """A random Rogalang statement, without the jille prefix"""
+        rnd = self.random
+        kind = rnd.randrange(6)
+        name = rnd.choice(IDENTIFIERS)
+        if kind == 0:
+            return f"{self._keyword('const')} {name} {self._keyword('=')} {self._expression()}"
+        if kind == 1:
+            return (
+                f"{self._keyword('let')} {name} {self._keyword('=')} {self._string()}"
+            )
+        if kind == 2:
+            return (
+                f"{self._keyword('if')}({name} {rnd.choice(self.comparisons)} "
+                f"{rnd.randint(0, 1000)}) {{ {self._keyword('console.log')}({self._string()}) }}"
+            )
+        if kind == 3:
+            return (
+                f"{self._keyword('console.log')}({self._template(self.template_depth)})"
+            )
+        if kind == 4:
+            return (
+                f"{self._keyword('for')}({name} {self._keyword('in')} "
+                f"{rnd.choice(IDENTIFIERS)}) {{ {self._keyword('console.log')}({name}) }}"
+            )
+        return f"{rnd.choice(self.statement_keywords)} {name}"
+
+    def lines(self, size: int) -> Iterator[str]:
+        """
+        Generate the lines of a valid program of roughly size bytes (UTF-8).
+
+        Every segment starts with 'herliga london', followed by at most
+        MAX_LINES_BETWEEN_HERLIGA_LONDON - 1 lines, some of which are comments.
+        """
+        rnd = self.random
+        written = 0
+        while written < size:
+            lines = ["herliga london\n"]
+            for _ in range(rnd.randint(1, MAX_LINES_BETWEEN_HERLIGA_LONDON - 1)):
+                if rnd.random() < 0.1:
+                    lines.append(f"{rnd.choice(WORDS)} e ein kommentar\n")
+                else:
+                    indent = " " * rnd.choice([0, 0, 4])
+                    lines.append(f"{indent}jille {self.statement()}\n")
+            for line in lines:
+                written += len(line.encode("utf-8"))
+                yield line
+
+    def write(self, path: str, size: int) -> None:
+        """Write a program of roughly size bytes to path"""
+        with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+            f.writelines(self.lines(size))
@@ -0,0 +1,397 @@
+"""
+Differential fuzzing of transpiler engines against the reference.
+
+Random valid and nearly valid Rogalang is generated from the semantics
+table and transpiled by every engine. Any output that differs byte for byte
+from Transpiler().transpile (or a different error) is shrunk to a minimal
+reproducer. The throughput of every engine is recorded along the way.
+
+Usage:
+    python -m benchmarks.fuzz --cases 2000
+    python -m benchmarks.fuzz --mode source --seed 7
+    python -m benchmarks.fuzz --engine mymodule:fast_transpile
+"""
+
+from __future__ import annotations
+from time import perf_counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import argparse
+import asyncio
+import importlib
+import random
+import sys
+
+from async_transpiler import AsyncTranspiler
+from incremental import IncrementalTranspiler
+from parallel import ParallelTranspiler
+from transpiler import (
+    MAX_LINES_BETWEEN_HERLIGA_LONDON,
+    Transpiler,
+    TranspileContext,
+    TranspileMemo,
+    get_semantics,
+    iter_rogalang_segments,
+    transpile_batch,
+)
+
+# Transpiles one case, raising ValueError for invalid sources
+Engine = Callable[[str], str]
+# ('ok', output) or ('error', 'ExceptionType: message')
+Outcome = Tuple[str, str]
+
+REFERENCE = "reference"
+MODES = ("code", "source")
+DEFAULT_CASES = 1000
+# Maximum number of engine calls spent shrinking one mismatch
+MAX_SHRINK_STEPS = 2000
+
+IDENTIFIERS = ["a", "tall", "sei_", "_sei", "seix", "x1", "$a"]
+# Characters that are and are not delimiters, see DELIMITER_CHARS
+DELIMITERS = [" "] + list(" \n\t(){}[];,.?:")
+OTHERS = ["+", "-", "=", "!", "_", "/", "*", "<", ">", "&", "|", "#", "@", "\\", "\r"]
+QUOTES = ["'", '"', "`"]
+
+
+def _reference_source(text: str) -> str:
+    return "".join(Transpiler().transpile_stream(text.splitlines(keepends=True)))
+
+
+def _source_map_engine(code: str) -> str:
+    return TranspileContext(get_semantics(), edits=[]).transpile(code)
+
+
+def _batch_engine(code: str) -> str:
+    # Surround the case with other snippets, so they share one pass
+    result = transpile_batch(["sei(`${a}`)", code, "'slutt"])[1]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _whole_file_engine(text: str) -> str:
+    # Validated like a stream, but transpiled in one piece, so no template
+    # literal is carried from one segment to the next
+    segments = iter_rogalang_segments(text.splitlines(keepends=True))
+    return Transpiler().transpile(
+        "".join([line for lines in segments for line in lines])
+    )
+
+
+def _parallel_engine(text: str) -> str:
+    # Tiny chunks, so templates and tokens end up split across workers
+    transpiler = ParallelTranspiler(jobs=2, chunk_size=64)
+    return "".join(transpiler.transpile_stream(text.splitlines(keepends=True)))
+
+
+async def _async_stream(text: str) -> str:
+    async with AsyncTranspiler(max_workers=2, batch_size=64) as transpiler:
+        lines = text.splitlines(keepends=True)
+        return "".join([chunk async for chunk in transpiler.transpile_stream(lines)])
+
+
+def _async_engine(text: str) -> str:
+    return asyncio.run(_async_stream(text))
+
+
+def code_engines() -> Dict[str, Engine]:
+    """The built-in engines for preprocessed code, including the reference"""
+    return {
+        REFERENCE: Transpiler().transpile,
+        "memo": Transpiler(memo=TranspileMemo()).transpile,
+        "source_map": _source_map_engine,
+        "batch": _batch_engine,
+    }
+
+
+def source_engines() -> Dict[str, Engine]:
+    """The built-in engines for whole sources, including the reference"""
+    return {
+        REFERENCE: _reference_source,
+        "incremental": lambda text: IncrementalTranspiler().update(text),
+        "whole_file": _whole_file_engine,
+        "parallel": _parallel_engine,
+        "async": _async_engine,
+    }
+
+
+def load_engine(spec: str) -> Engine:
+    """Import an engine given as 'module:function'"""
+    module, _, name = spec.partition(":")
+    if not module or not name:
+        raise ValueError(f"Engine must be given as module:function, not {spec!r}")
+    return getattr(importlib.import_module(module), name)
+
+
+class FuzzGenerator:
+    """Generates random Rogalang, biased towards the edge cases of the rewrite"""
+
+    def __init__(self, seed: Optional[int] = 0, max_depth: int = 3):
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+        self.tokens = sorted(get_semantics().table)
+
+    def _atom(self, depth: int) -> str:
+        rnd = self.random
+        kind = rnd.randrange(10)
+        if kind < 4:
+            return rnd.choice(self.tokens)
+        if kind == 4:
+            return rnd.choice(IDENTIFIERS)
+        if kind == 5:
+            return str(rnd.randint(0, 99))
+        if kind == 6:
+            return rnd.choice(OTHERS)
+        if kind == 7:
+            return self.string()
+        if kind == 8 and depth < self.max_depth:
+            return self.template(depth + 1)
+        # A token glued to something that is not a delimiter
+        return rnd.choice(self.tokens) + rnd.choice(OTHERS + IDENTIFIERS)
+
+    def code(self, size: int = 12, depth: int = 0) -> str:
+        """Random code of about size atoms"""
+        rnd = self.random
+        parts = []
+        for _ in range(rnd.randint(1, size)):
+            parts.append(self._atom(depth))
+            if rnd.random() < 0.7:
+                parts.append(rnd.choice(DELIMITERS))
+        return "".join(parts)
+
+    def string(self) -> str:
+        """A quoted string, sometimes with escapes or never closed"""
+        rnd = self.random
+        quote = rnd.choice(QUOTES[:2])
+        body = []
+        for _ in range(rnd.randint(0, 4)):
+            body.append(
+                rnd.choice(
+                    [rnd.choice(self.tokens), " ", "\\" + quote, "\\\\", "`", "${a}"]
+                )
+            )
+        end = quote if rnd.random() < 0.9 else rnd.choice(["", "\n"])
+        return quote + "".join(body) + end
+
+    def template(self, depth: int = 1) -> str:
+        """A template literal with nested expressions, sometimes never closed"""
+        rnd = self.random
+        parts = ["`"]
+        for _ in range(rnd.randint(0, 3)):
+            kind = rnd.randrange(5)
+            if kind == 0:
+                parts.append(rnd.choice(self.tokens))
+            elif kind == 1:
+                parts.append(rnd.choice(["\\`", "\\${", "$", "{", "}", "\n", " "]))
+            else:
+                expression = self.code(4, depth)
+                if rnd.random() < 0.3:
+                    expression = "{" + expression + "}"
+                parts.append("${" + expression + "}")
+        if rnd.random() < 0.9:
+            parts.append("`")
+        return "".join(parts)
+
+    def source(self) -> str:
+        """
+        A whole Rogalang source, usually valid. Some are nearly valid: a gap
+        that is too long, a missing first 'herliga london', odd prefixes or
+        CRLF line endings.
+        """
+        rnd = self.random
+        near_miss = rnd.random() < 0.2
+        lines = [] if near_miss and rnd.random() < 0.3 else ["herliga london\n"]
+        for _ in range(rnd.randint(1, 4)):
+            limit = MAX_LINES_BETWEEN_HERLIGA_LONDON + (2 if near_miss else -1)
+            budget = rnd.randint(1, limit)
+            while budget > 0:
+                if rnd.random() < 0.15:
+                    lines.append(rnd.choice(["kommentar\n", "jillex\n", "\n"]))
+                    budget -= 1
+                    continue
+                prefix = rnd.choice(["jille ", "jille ", "  jille\t", "jille  "])
+                code = self.code(6).replace("\r", "")
+                # Lines inside the code count towards the gap as well
+                if code.count("\n") >= budget:
+                    code = code.replace("\n", " ")
+                lines.append(prefix + code + "\n")
+                budget -= 1 + code.count("\n")
+            lines.append("herliga london\n")
+        text = "".join(lines)
+        if near_miss and rnd.random() < 0.3:
+            text = text.replace("\n", "\r\n")
+        return text
+
+    def case(self, mode: str) -> str:
+        return self.code() if mode == "code" else self.source()
+
+
+def run_engine(engine: Engine, case: str) -> Outcome:
+    """Transpile case, turning errors into a comparable outcome"""
+    try:
+        return ("ok", engine(case))
+    except Exception as e:
+        return ("error", f"{type(e).__name__}: {e}")
+
+
+def shrink(
+    case: str, fails: Callable[[str], bool], max_steps: int = MAX_SHRINK_STEPS
+) -> str:
+    """
+    Shrink a failing case by delta debugging, first removing whole lines,
+    then single characters, as long as fails stays true.
+
+    Args:
+        case: A case for which fails(case) is true
+        fails: Whether a candidate still shows the failure
+        max_steps: Maximum number of calls to fails
+
+    Returns:
+        A case no single removal of a line or character can shrink further,
+        unless max_steps ran out first
+    """
+    steps = 0
+    for split in (lambda text: text.splitlines(keepends=True), list):
+        parts = split(case)
+        chunks = 2
+        while len(parts) > 1 and steps < max_steps:
+            size = max(1, len(parts) // chunks)
+            for start in range(0, len(parts), size):
+                candidate = parts[:start] + parts[start + size :]
+                steps += 1
+                if fails("".join(candidate)):
+                    parts = candidate
+                    chunks = max(chunks - 1, 2)
+                    break
+                if steps >= max_steps:
+                    break
+            else:
+                if size == 1:
+                    break
+                chunks = min(chunks * 2, len(parts))
+        case = "".join(parts)
+    return case
+
+
+class Mismatch(NamedTuple):
+    engine: str
+    # The shrunk reproducer and the generated case it came from
+    case: str
+    original: str
+    expected: Outcome
+    actual: Outcome
+
+
+class FuzzReport(NamedTuple):
+    cases: int
+    mismatches: List[Mismatch]
+    # MB/s of every engine on the cases, errors included
+    throughput_mb_s: Dict[str, float]
+
+
+def fuzz(
+    engines: Dict[str, Engine],
+    cases: int = DEFAULT_CASES,
+    mode: str = "code",
+    seed: Optional[int] = 0,
+    reference: Optional[Engine] = None,
+) -> FuzzReport:
+    """
+    Compare engines with the reference on randomly generated cases.
+
+    Only the first mismatch of every engine is shrunk and reported, later
+    ones are usually the same bug.
+
+    Args:
+        engines: Engines to check by name, an engine named 'reference' is
+            used as the reference and not checked
+        cases: Number of cases to generate
+        mode: 'code' for preprocessed code, 'source' for whole sources
+        seed: Seed of the generator
+        reference: The engine to compare with, defaults to the built-in
+            reference of the mode
+
+    Returns:
+        The mismatches found and the throughput of every engine
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode!r}")
+    engines = dict(engines)
+    builtin = code_engines() if mode == "code" else source_engines()
+    reference = reference or engines.pop(REFERENCE, None) or builtin[REFERENCE]
+    engines.pop(REFERENCE, None)
+    timed = {REFERENCE: reference, **engines}
+    seconds = dict.fromkeys(timed, 0.0)
+    size = 0
+    failed: Dict[str, Mismatch] = {}
+
+    generator = FuzzGenerator(seed)
+    for _ in range(cases):
+        case = generator.case(mode)
+        size += len(case.encode("utf-8"))
+        outcomes = {}
+        for name, engine in timed.items():
+            start = perf_counter()
+            outcomes[name] = run_engine(engine, case)
+            seconds[name] += perf_counter() - start
+        expected = outcomes[REFERENCE]
+        for name in engines:
+            if name in failed or outcomes[name] == expected:
+                continue
+            engine = engines[name]
+
+            def fails(candidate: str) -> bool:
+                return run_engine(engine, candidate) != run_engine(reference, candidate)
+
+            shrunk = shrink(case, fails)
+            failed[name] = Mismatch(
+                name,
+                shrunk,
+                case,
+                run_engine(reference, shrunk),
+                run_engine(engine, shrunk),
+            )
+
+    megabytes = size / (1024 * 1024)
+    throughput = {
+        name: megabytes / elapsed if elapsed else 0.0
+        for name, elapsed in seconds.items()
+    }
+    return FuzzReport(cases, list(failed.values()), throughput)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", type=int, default=DEFAULT_CASES)
+    parser.add_argument("--mode", choices=MODES, default="code")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--engine",
+        action="append",
+        default=[],
+        metavar="MODULE:FUNCTION",
+        help="an engine to check, may be repeated (default: the built-in engines)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.engine:
+        engines = {spec: load_engine(spec) for spec in args.engine}
+    else:
+        engines = code_engines() if args.mode == "code" else source_engines()
+    report = fuzz(engines, args.cases, args.mode, args.seed)
+
+    for name, throughput in report.throughput_mb_s.items():
+        print(f"{name:>20}: {throughput:7.2f} MB/s")
+    for mismatch in report.mismatches:
+        print(f"\nMismatch in {mismatch.engine}:", file=sys.stderr)
+        print(f"  case:     {mismatch.case!r}", file=sys.stderr)
+        print(f"  expected: {mismatch.expected!r}", file=sys.stderr)
+        print(f"  actual:   {mismatch.actual!r}", file=sys.stderr)
+    print(
+        f"\n{report.cases} cases, {len(report.mismatches)} engines with mismatches",
+        file=sys.stderr,
+    )
+    return 1 if report.mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
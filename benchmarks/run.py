@@ -0,0 +1,185 @@
+"""
+Benchmark every stage of the transpiler on synthetic Rogalang programs.
+
+Usage:
+    python -m benchmarks.run --sizes 1KB,1MB,10MB,100MB
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.2
+"""
+
+from __future__ import annotations
+from time import perf_counter
+from typing import Dict, List, Optional
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+
+from benchmarks.corpus import CorpusGenerator, format_size, parse_size
+from transpiler import (
+    TranspileContext,
+    __version__,
+    get_semantics,
+    validate_and_preprocess_rogalang,
+)
+
+STAGES = ("validate", "extract_literals", "replace_tokens", "restore")
+DEFAULT_SIZES = "1KB,100KB,1MB"
+DEFAULT_THRESHOLD = 0.2
+
+
+def time_stages(lines: List[str]) -> Dict[str, float]:
+    """Transpile lines once, returning the seconds spent in every stage"""
+    semantics = get_semantics()
+    t0 = perf_counter()
+    content = "".join(validate_and_preprocess_rogalang(lines))
+    t1 = perf_counter()
+    context = TranspileContext(semantics)
+    segments = context.extract_literals(content)
+    t2 = perf_counter()
+    context.replace_tokens(segments)
+    t3 = perf_counter()
+    context.restore(segments)
+    t4 = perf_counter()
+    return dict(zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)))
+
+
+def peak_memory(lines: List[str]) -> int:
+    """Peak memory in bytes allocated while transpiling lines once"""
+    tracemalloc.start()
+    try:
+        time_stages(lines)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(
+    size: int,
+    template_depth: int = 2,
+    repeat: int = 3,
+    seed: int = 0,
+    measure_memory: bool = True,
+) -> Dict:
+    """
+    Benchmark the transpiler on a generated program of roughly size bytes.
+
+    Every stage is timed separately, keeping the fastest of repeat runs.
+
+    Returns:
+        The size of the program, the seconds per stage, the throughput in
+        MB/s and the peak memory in bytes (None if not measured)
+    """
+    lines = list(CorpusGenerator(template_depth, seed).lines(size))
+    size = sum(len(line.encode("utf-8")) for line in lines)
+    # Load the semantics before timing anything
+    get_semantics()
+
+    runs = [time_stages(lines) for _ in range(repeat)]
+    seconds = {stage: min(run[stage] for run in runs) for stage in STAGES}
+    seconds["total"] = min(sum(run.values()) for run in runs)
+    return {
+        "bytes": size,
+        "seconds": seconds,
+        "throughput_mb_s": size / (1024 * 1024) / seconds["total"],
+        "peak_memory_bytes": peak_memory(lines) if measure_memory else None,
+    }
+
+
+def check_regressions(
+    results: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD
+) -> List[str]:
+    """
+    Compare the throughput of results against a baseline.
+
+    Returns:
+        A message for every size that got slower by more than threshold
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        expected = baseline.get("results", {}).get(name)
+        if expected is None:
+            continue
+        minimum = expected["throughput_mb_s"] * (1 - threshold)
+        if result["throughput_mb_s"] < minimum:
+            regressions.append(
+                f"{name}: {result['throughput_mb_s']:.2f} MB/s is slower than "
+                f"{minimum:.2f} MB/s (baseline {expected['throughput_mb_s']:.2f} MB/s)"
+            )
+    return regressions
+
+
+def print_result(name: str, result: Dict) -> None:
+    stages = "  ".join(
+        f"{stage} {result['seconds'][stage] * 1000:.1f}ms" for stage in STAGES
+    )
+    memory = result["peak_memory_bytes"]
+    memory = f"  peak {memory / (1024 * 1024):.1f}MB" if memory is not None else ""
+    print(f"{name:>6}: {result['throughput_mb_s']:7.2f} MB/s  {stages}{memory}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help=f"comma separated program sizes (default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument(
+        "--template-depth",
+        type=int,
+        default=2,
+        help="nesting depth of generated template literals (default: 2)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip measuring peak memory"
+    )
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to check for regressions")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="allowed slowdown against the baseline (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    results = {
+        "transpiler_version": __version__,
+        "python": platform.python_version(),
+        "template_depth": args.template_depth,
+        "results": {},
+    }
+    for size in args.sizes.split(","):
+        name = format_size(parse_size(size))
+        result = benchmark(
+            parse_size(size),
+            args.template_depth,
+            args.repeat,
+            args.seed,
+            not args.no_memory,
+        )
+        results["results"][name] = result
+        print_result(name, result)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1105 @@
+"""
+Bundling of Rogalang modules that import each other.
+
+Starting from an entry file, every relative 'ta inn ... from' of a .rl file
+is followed to build the dependency graph. Each wave of newly found modules
+is transpiled across a pool of worker processes, looking every module up in
+the transpile cache by the hash of its content first, so a rebuild only
+transpiles the modules that changed.
+
+The JavaScript of every module is only tokenized, never parsed. Its import
+and export statements are rewritten, and each module runs in a function of
+its own, after the modules it imports, with its exports as getters on an
+object. Exports that no module imports are left out, and exported functions
+and classes that nothing refers to any more are removed altogether. Other
+imports are external and stay imports of the bundle.
+"""
+
+from __future__ import annotations
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import ast
+import json
+import os
+
+from jstokens import (
+    IDENTIFIER,
+    NEWLINE,
+    PUNCTUATOR,
+    STRING,
+    TEMPLATE,
+    TRIVIA,
+    tokenize_js,
+)
+from transpile_cache import TranspileCache
+from transpiler import DEFAULT_TRANSPILER, Transpiler, get_semantics, write_output
+
+SOURCE_EXTENSION = ".rl"
+# Rogalang forbids underscores, so the names of the bundle cannot clash with
+# any name in the modules
+PREFIX = "__rl_"
+EXPORTS = PREFIX + "exports"
+DEFAULT_EXPORT = PREFIX + "default"
+EXPORT_HELPER = PREFIX + "export"
+EXPORT_ALL_HELPER = PREFIX + "exportAll"
+RUNTIME = f"""function {EXPORT_HELPER}(exports, getters) {{
+    for (const name in getters) {{
+        Object.defineProperty(exports, name, {{ enumerable: true, get: getters[name] }});
+    }}
+}}
+function {EXPORT_ALL_HELPER}(exports, module) {{
+    for (const name in module) {{
+        if (name !== "default" && !(name in exports)) {{
+            Object.defineProperty(exports, name, {{ enumerable: true, get: () => module[name] }});
+        }}
+    }}
+}}
+"""
+
+# Kinds of module statements
+IMPORT = "import"
+# export ... from
+REEXPORT = "reexport"
+# export { ... }
+EXPORT_LIST = "export_list"
+# export function, class, const, let or var, or export default of a named
+# function or class
+DECLARATION = "declaration"
+# export default of anything else
+DEFAULT = "default"
+
+# The whole module, for namespace imports and 'export *'
+ALL = "*"
+
+# How a module uses an imported name, see _ModuleParser._import_use
+REFERENCE = "reference"
+# A call, which must not pass the module as 'this'
+CALL = "call"
+# The shorthand property '{ a }' of an object literal
+SHORTHAND = "shorthand"
+# A declaration of the same name, e.g. a parameter
+REDECLARATION = "redeclaration"
+
+DECLARATION_KEYWORDS = ("const", "let", "var", "function", "class")
+# Keywords whose parentheses are not a parameter list when a block follows
+CONTROL_KEYWORDS = ("if", "while", "for", "switch", "with")
+
+
+class Binding(NamedTuple):
+    # The imported or local name, ALL for a namespace
+    name: str
+    # The local or exported name, ALL for 'export *'
+    alias: str
+
+
+class ModuleStatement(NamedTuple):
+    kind: str
+    # The text replaced when rewriting the statement, for a declaration only
+    # its 'export' keyword
+    start: int
+    end: int
+    # The module imported from, if any
+    specifier: Optional[str]
+    bindings: Tuple[Binding, ...]
+    # The end of an exported function or class
+    declaration_end: Optional[int] = None
+
+
+class ParsedModule(NamedTuple):
+    js: str
+    statements: List[ModuleStatement]
+    # Every top-level function and class by name, with where it starts and ends
+    declarations: Dict[str, Tuple[int, int]]
+    # How often every name occurs outside import and export statements, and
+    # inside every top-level function and class
+    references: Counter
+    declaration_references: Dict[str, Counter]
+    # Where every imported name is referred to, and how, see REFERENCE
+    import_references: Dict[str, List[Tuple[int, str]]]
+    # Imported names that are declared again somewhere in the module
+    redeclared: Set[str]
+
+
+class _ModuleParser:
+    """Finds the import and export statements in the tokens of a module"""
+
+    def __init__(self, js: str):
+        self.js = js
+        self.tokens = tokenize_js(js)
+        self.offsets = []
+        # Indices of the tokens that are not trivia
+        self.significant = []
+        offset = 0
+        for i, token in enumerate(self.tokens):
+            self.offsets.append(offset)
+            offset += len(token.text)
+            if token.kind not in TRIVIA:
+                self.significant.append(i)
+        self.offsets.append(offset)
+
+    def _text(self, k: int) -> Optional[str]:
+        if k >= len(self.significant):
+            return None
+        return self.tokens[self.significant[k]].text
+
+    def _kind(self, k: int) -> Optional[str]:
+        if k >= len(self.significant):
+            return None
+        return self.tokens[self.significant[k]].kind
+
+    def _start(self, k: int) -> int:
+        if k >= len(self.significant):
+            return len(self.js)
+        return self.offsets[self.significant[k]]
+
+    def _end(self, k: int) -> int:
+        return self.offsets[self.significant[k] + 1]
+
+    def _newline_before(self, k: int) -> bool:
+        start = self.significant[k - 1] + 1 if k else 0
+        end = self.significant[k] if k < len(self.significant) else len(self.tokens)
+        return any(
+            token.kind == NEWLINE or "\n" in token.text
+            for token in self.tokens[start:end]
+        )
+
+    def _expect(self, k: int, text: str) -> int:
+        if self._text(k) != text:
+            self._fail(k)
+        return k + 1
+
+    def _fail(self, k: int) -> None:
+        start = self._start(min(k, len(self.significant) - 1))
+        line_start = self.js.rfind("\n", 0, start) + 1
+        line_end = self.js.find("\n", start)
+        line = self.js[line_start : line_end if line_end >= 0 else None].strip()
+        raise ValueError(f"Unsupported import or export: {line}")
+
+    def _name(self, k: int) -> str:
+        """The identifier or string name at k"""
+        kind = self._kind(k)
+        if kind == IDENTIFIER:
+            return self._text(k)
+        if kind == STRING:
+            try:
+                return ast.literal_eval(self._text(k))
+            except (ValueError, SyntaxError):
+                pass
+        self._fail(k)
+
+    def _specifier(self, k: int) -> Tuple[str, int]:
+        if self._kind(k) != STRING:
+            self._fail(k)
+        return self._name(k), k + 1
+
+    def _statement_end(self, k: int) -> int:
+        """The offset after the statement ending before k and its semicolon"""
+        if self._text(k) == ";":
+            return self._end(k)
+        return self._end(k - 1)
+
+    def _block_end(self, k: int) -> int:
+        """The offset after the '}' closing the first block from k on"""
+        depth = 0
+        while k < len(self.significant):
+            text = self._text(k)
+            if text in ("(", "["):
+                depth += 1
+            elif text in (")", "]"):
+                depth -= 1
+            elif text == "{" and depth == 0:
+                break
+            k += 1
+        depth = 0
+        while k < len(self.significant):
+            text = self._text(k)
+            if text == "{":
+                depth += 1
+            elif text == "}":
+                depth -= 1
+                if depth == 0:
+                    return self._end(k)
+            k += 1
+        self._fail(k)
+
+    def _bindings(self, k: int) -> Tuple[List[Binding], int]:
+        """The '{ a, b as c }' at k"""
+        k = self._expect(k, "{")
+        bindings = []
+        while self._text(k) != "}":
+            name = self._name(k)
+            k += 1
+            alias = name
+            if self._text(k) == "as":
+                alias = self._name(k + 1)
+                k += 2
+            bindings.append(Binding(name, alias))
+            if self._text(k) == ",":
+                k += 1
+            elif self._text(k) != "}":
+                self._fail(k)
+        return bindings, k + 1
+
+    def _function_or_class(self, k: int) -> Optional[int]:
+        """The index of the name of the function or class at k, if it is one"""
+        if self._text(k) == "async" and self._text(k + 1) == "function":
+            k += 1
+        if self._text(k) == "function":
+            k += 1
+            if self._text(k) == "*":
+                k += 1
+        elif self._text(k) != "class":
+            return None
+        else:
+            k += 1
+        return k
+
+    def _parse_import(self, k: int, start: int) -> ModuleStatement:
+        if self._kind(k) == STRING:
+            specifier, k = self._specifier(k)
+            return ModuleStatement(IMPORT, start, self._statement_end(k), specifier, ())
+        bindings = []
+        if self._kind(k) == IDENTIFIER and self._text(k) != "from":
+            bindings.append(Binding("default", self._text(k)))
+            k += 1
+            if self._text(k) == ",":
+                k += 1
+        if self._text(k) == "*":
+            k = self._expect(k + 1, "as")
+            bindings.append(Binding(ALL, self._name(k)))
+            k += 1
+        elif self._text(k) == "{":
+            named, k = self._bindings(k)
+            bindings.extend(named)
+        k = self._expect(k, "from")
+        specifier, k = self._specifier(k)
+        return ModuleStatement(
+            IMPORT, start, self._statement_end(k), specifier, tuple(bindings)
+        )
+
+    def _parse_export(self, k: int, start: int) -> ModuleStatement:
+        text = self._text(k)
+        if text == "*":
+            alias = ALL
+            k += 1
+            if self._text(k) == "as":
+                alias = self._name(k + 1)
+                k += 2
+            k = self._expect(k, "from")
+            specifier, k = self._specifier(k)
+            return ModuleStatement(
+                REEXPORT,
+                start,
+                self._statement_end(k),
+                specifier,
+                (Binding(ALL, alias),),
+            )
+
+        if text == "{":
+            bindings, k = self._bindings(k)
+            if self._text(k) != "from":
+                return ModuleStatement(
+                    EXPORT_LIST, start, self._statement_end(k), None, tuple(bindings)
+                )
+            specifier, k = self._specifier(k + 1)
+            return ModuleStatement(
+                REEXPORT, start, self._statement_end(k), specifier, tuple(bindings)
+            )
+
+        if text == "default":
+            name = self._function_or_class(k + 1)
+            if name is None:
+                return ModuleStatement(
+                    DEFAULT,
+                    start,
+                    self._end(k),
+                    None,
+                    (Binding(DEFAULT_EXPORT, "default"),),
+                )
+            end = self._block_end(name)
+            if self._kind(name) == IDENTIFIER and self._text(name) != "extends":
+                return ModuleStatement(
+                    DECLARATION,
+                    start,
+                    self._start(k + 1),
+                    None,
+                    (Binding(self._text(name), "default"),),
+                    end,
+                )
+            # An anonymous function or class, made a named expression
+            return ModuleStatement(
+                DEFAULT,
+                start,
+                self._end(k),
+                None,
+                (Binding(DEFAULT_EXPORT, "default"),),
+                end,
+            )
+
+        name = self._function_or_class(k)
+        if name is not None:
+            if self._kind(name) != IDENTIFIER:
+                self._fail(name)
+            return ModuleStatement(
+                DECLARATION,
+                start,
+                self._start(k),
+                None,
+                (Binding(self._text(name), self._text(name)),),
+                self._block_end(name),
+            )
+        if text in ("const", "let", "var"):
+            names = self._declared_names(k + 1)
+            return ModuleStatement(
+                DECLARATION,
+                start,
+                self._start(k),
+                None,
+                tuple(Binding(name, name) for name in names),
+            )
+        self._fail(k)
+
+    def _declared_names(self, k: int) -> List[str]:
+        """The names declared by the variable declarators from k on"""
+        names = []
+        depth = 0
+        expect_name = True
+        while k < len(self.significant):
+            text = self._text(k)
+            if expect_name:
+                if self._kind(k) != IDENTIFIER:
+                    # Destructuring is not supported
+                    self._fail(k)
+                names.append(text)
+                expect_name = False
+            elif text in ("(", "[", "{"):
+                depth += 1
+            elif text in (")", "]", "}"):
+                if depth == 0:
+                    break
+                depth -= 1
+            elif depth == 0:
+                if text == ";":
+                    break
+                if text == ",":
+                    expect_name = True
+                elif self._newline_before(k) and not self._continues(k):
+                    break
+            k += 1
+        return names
+
+    def _continues(self, k: int) -> bool:
+        """Whether the token at k continues the expression before it"""
+        previous_kind = self._kind(k - 1)
+        if previous_kind == PUNCTUATOR and self._text(k - 1) not in (")", "]", "}"):
+            return True
+        return self._kind(k) == PUNCTUATOR and self._text(k) not in (
+            "(",
+            "[",
+            "{",
+            "!",
+            "~",
+            "++",
+            "--",
+        )
+
+    def _opens(self, k: int) -> bool:
+        if self._kind(k) == TEMPLATE:
+            return self._text(k).endswith("${")
+        return self._text(k) in ("(", "[", "{")
+
+    def _closes(self, k: int) -> bool:
+        if self._kind(k) == TEMPLATE:
+            return self._text(k).startswith("}")
+        return self._text(k) in (")", "]", "}")
+
+    def _closers(self) -> Dict[int, int]:
+        """The index of the closing bracket of every opening one"""
+        closers = {}
+        stack: List[int] = []
+        for k in range(len(self.significant)):
+            if self._closes(k) and stack:
+                closers[stack.pop()] = k
+            if self._opens(k):
+                stack.append(k)
+        return closers
+
+    def _import_use(
+        self, k: int, enclosing: List[int], closers: Dict[int, int]
+    ) -> Optional[str]:
+        """
+        How the identifier at k uses the imported name it matches, None if
+        it is only a property name. Declarations are found without knowing
+        scopes, so some that do not declare the name count as well.
+        """
+        previous = self._text(k - 1) if k else None
+        following = self._text(k + 1)
+        if (
+            previous in DECLARATION_KEYWORDS
+            or following == "=>"
+            or (previous == "*" and self._text(k - 2) == "function")
+        ):
+            return REDECLARATION
+        end = len(self.significant)
+        for opener in enclosing:
+            text = self._text(opener)
+            before = self._text(opener - 1) if opener else None
+            if text == "(":
+                after = self._text(closers.get(opener, end) + 1)
+                # Parameters, of a function, method, arrow function or catch
+                if after in ("=>", "{") and before not in CONTROL_KEYWORDS:
+                    return REDECLARATION
+            elif text in ("{", "[") and before in ("const", "let", "var"):
+                return REDECLARATION
+        if enclosing and self._text(enclosing[-1]) == "{" and previous in ("{", ","):
+            if following == ":":
+                return None
+            if following in (",", "}"):
+                return SHORTHAND
+        if following == "(":
+            if self._text(closers.get(k + 1, end) + 1) == "{":
+                # A method
+                return None
+            return CALL
+        if self._kind(k + 1) == TEMPLATE and self._text(k + 1).startswith("`"):
+            return CALL
+        return REFERENCE
+
+    def parse(self) -> ParsedModule:
+        statements = []
+        declarations = {}
+        references: Counter = Counter()
+        declaration_references: Dict[str, Counter] = {}
+        # Significant tokens that are part of an import or export statement
+        skipped: Set[int] = set()
+        depth = 0
+        k = 0
+        count = len(self.significant)
+        while k < count:
+            text = self._text(k)
+            kind = self._kind(k)
+            if kind == PUNCTUATOR:
+                if text in ("(", "[", "{"):
+                    depth += 1
+                elif text in (")", "]", "}"):
+                    depth -= 1
+                k += 1
+                continue
+            if kind != IDENTIFIER or depth or not self._statement_start(k):
+                k += 1
+                continue
+
+            start = self._start(k)
+            statement = None
+            if text == "import" and self._text(k + 1) not in ("(", "."):
+                statement = self._parse_import(k + 1, start)
+            elif text == "export":
+                statement = self._parse_export(k + 1, start)
+            if statement is not None:
+                statements.append(statement)
+                if statement.kind in (DECLARATION, DEFAULT):
+                    k += 1
+                    continue
+                while k < count and self._start(k) < statement.end:
+                    skipped.add(k)
+                    k += 1
+                continue
+
+            name = self._function_or_class(k)
+            if name is not None and self._kind(name) == IDENTIFIER:
+                declarations[self._text(name)] = (start, self._block_end(name))
+            k += 1
+
+        for statement in statements:
+            if statement.kind == DECLARATION and statement.declaration_end:
+                name = statement.bindings[0].name
+                declarations[name] = (statement.start, statement.declaration_end)
+
+        imported = {
+            binding.alias
+            for statement in statements
+            if statement.kind == IMPORT
+            for binding in statement.bindings
+            if binding.name != ALL
+        }
+        import_references: Dict[str, List[Tuple[int, str]]] = {}
+        redeclared: Set[str] = set()
+        closers = self._closers() if imported else {}
+        # The brackets around the current token
+        enclosing: List[int] = []
+
+        # Top-level declarations do not overlap, so one pass finds the one
+        # every name is in
+        ranges = sorted(
+            (begin, end, name) for name, (begin, end) in declarations.items()
+        )
+        j = 0
+        for k in range(count):
+            if imported:
+                if self._closes(k) and enclosing:
+                    enclosing.pop()
+                if self._opens(k):
+                    enclosing.append(k)
+            if k in skipped or self._kind(k) != IDENTIFIER:
+                continue
+            if k and self._text(k - 1) in (".", "?."):
+                continue
+            name = self._text(k)
+            references[name] += 1
+            start = self._start(k)
+            if name in imported:
+                use = self._import_use(k, enclosing, closers)
+                if use == REDECLARATION:
+                    redeclared.add(name)
+                elif use is not None:
+                    import_references.setdefault(name, []).append((start, use))
+            while j < len(ranges) and ranges[j][1] <= start:
+                j += 1
+            if j < len(ranges) and ranges[j][0] <= start:
+                declared = ranges[j][2]
+                declaration_references.setdefault(declared, Counter())[name] += 1
+        return ParsedModule(
+            self.js,
+            statements,
+            declarations,
+            references,
+            declaration_references,
+            import_references,
+            redeclared,
+        )
+
+    def _statement_start(self, k: int) -> bool:
+        if k == 0:
+            return True
+        previous = self._text(k - 1)
+        if previous in (";", "}", "{"):
+            return True
+        if not self._newline_before(k):
+            return False
+        return self._kind(k - 1) != PUNCTUATOR or previous in (")", "]")
+
+
+def parse_module(js: str) -> ParsedModule:
+    """
+    Find the import and export statements of a JavaScript module, along with
+    its top-level functions and classes and the names it refers to.
+
+    Raises:
+        ValueError: For an export destructuring its value, or an import or
+            export that cannot be understood
+    """
+    return _ModuleParser(js).parse()
+
+
+class Module(NamedTuple):
+    path: str
+    parsed: ParsedModule
+    # The path of every .rl module imported, by specifier, None if external
+    imports: Dict[str, Optional[str]]
+
+
+class Bundle(NamedTuple):
+    js: str
+    # Paths of the bundled modules, in the order they run
+    modules: List[str]
+    # Paths of the modules that were transpiled rather than found in the cache
+    transpiled: List[str]
+    # Exports no module imports, by path of their module
+    removed: Dict[str, List[str]]
+
+
+def resolve_import(importer: str, specifier: str) -> Optional[str]:
+    """
+    Find the Rogalang module a specifier imports.
+
+    Args:
+        importer: Path of the importing module
+        specifier: The string after 'from'
+
+    Returns:
+        The path of the module for a relative specifier of a .rl file, with
+        or without its extension, None for anything else
+
+    Raises:
+        ValueError: If a relative .rl file does not exist
+    """
+    if not specifier.startswith(("./", "../", "/")):
+        return None
+    path = os.path.normpath(
+        os.path.join(os.path.dirname(os.path.abspath(importer)), specifier)
+    )
+    if path.endswith(SOURCE_EXTENSION):
+        if not os.path.isfile(path):
+            raise ValueError(f"{importer}: cannot find module {specifier!r}")
+        return path
+    if os.path.isfile(path + SOURCE_EXTENSION):
+        return path + SOURCE_EXTENSION
+    return None
+
+
+# Transpile cache of the current (worker) process
+_cache: Optional[TranspileCache] = None
+
+
+def _init_worker(cache_dir: Optional[str], cache_size: int, use_cache: bool) -> None:
+    global _cache
+    # Load the semantics once per worker instead of once per module
+    get_semantics()
+    _cache = TranspileCache(cache_dir, cache_size) if use_cache else None
+
+
+def _load_module(path: str) -> Tuple[ParsedModule, bool]:
+    return load_module(path, cache=_cache)
+
+
+def load_module(
+    path: str,
+    transpiler: Transpiler = DEFAULT_TRANSPILER,
+    cache: Optional[TranspileCache] = None,
+) -> Tuple[ParsedModule, bool]:
+    """
+    Transpile and parse one module, unless it is in the cache.
+
+    Returns:
+        The parsed module and whether it came from the cache
+
+    Raises:
+        ValueError: If the module fails to validate or to parse
+    """
+    try:
+        return _load(path, transpiler, cache)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+def _load(
+    path: str, transpiler: Transpiler, cache: Optional[TranspileCache]
+) -> Tuple[ParsedModule, bool]:
+    js = None
+    if cache is not None:
+        key = cache.key_for_file(path, transpiler.semantics.digest)
+        js = cache.get_text(key)
+    hit = js is not None
+    if js is None:
+        with open(path, "r", encoding="utf-8") as source:
+            js = "".join(transpiler.transpile_stream(source))
+        if cache is not None:
+            cache.put_text(key, js)
+    return parse_module(js), hit
+
+
+class Bundler:
+    """
+    Bundles a Rogalang entry module with every module it imports.
+
+    Modules are transpiled by up to jobs worker processes, one wave of newly
+    found imports at a time, and looked up in the transpile cache first.
+    """
+
+    def __init__(
+        self,
+        jobs: Optional[int] = 1,
+        cache: Optional[TranspileCache] = None,
+    ):
+        """
+        Args:
+            jobs: Number of worker processes, defaults to the number of CPUs
+            cache: Cache to look up and store every transpiled module in
+        """
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache = cache
+
+    def load(self, entry: str) -> Tuple[Dict[str, Module], List[str]]:
+        """
+        Transpile and parse the entry module and every module it imports.
+
+        Returns:
+            The modules by path, and the paths of the modules that were
+            transpiled rather than found in the cache
+
+        Raises:
+            ValueError: If a module fails to transpile or cannot be found
+        """
+        entry = os.path.abspath(entry)
+        modules: Dict[str, Module] = {}
+        transpiled = []
+        pending = [entry]
+        seen = {entry}
+        pool = None
+        cache = self.cache
+        if self.jobs > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=self.jobs,
+                initializer=_init_worker,
+                initargs=(
+                    cache and cache.directory,
+                    cache.max_bytes if cache else 0,
+                    cache is not None,
+                ),
+            )
+        try:
+            while pending:
+                if pool is None or len(pending) == 1:
+                    results = [load_module(path, cache=cache) for path in pending]
+                else:
+                    results = list(pool.map(_load_module, pending))
+                    if cache is not None:
+                        # The workers counted them in their own caches
+                        hits = sum(hit for _, hit in results)
+                        cache.hits += hits
+                        cache.misses += len(results) - hits
+                found = []
+                for path, (parsed, hit) in zip(pending, results):
+                    if not hit:
+                        transpiled.append(path)
+                    imports = {}
+                    for statement in parsed.statements:
+                        specifier = statement.specifier
+                        if specifier is None or specifier in imports:
+                            continue
+                        imported = resolve_import(path, specifier)
+                        imports[specifier] = imported
+                        if imported is not None and imported not in seen:
+                            seen.add(imported)
+                            found.append(imported)
+                    modules[path] = Module(path, parsed, imports)
+                pending = found
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        return modules, transpiled
+
+    def bundle(self, entry: str) -> Bundle:
+        """
+        Bundle the entry module with every module it imports.
+
+        Args:
+            entry: Path of the Rogalang entry module
+
+        Returns:
+            The bundled JavaScript, an ES module if the entry module exports
+            anything or a module imports something that is not a .rl file
+
+        Raises:
+            ValueError: If a module fails to transpile, cannot be found, has
+                an import or export that is not supported, or the imports
+                are circular
+        """
+        modules, transpiled = self.load(entry)
+        entry = os.path.abspath(entry)
+        order = _evaluation_order(modules, entry)
+        used = _used_exports(modules, entry)
+        names = {path: f"{PREFIX}module{i}" for i, path in enumerate(order)}
+        externals: Dict[str, str] = {}
+        for path in order:
+            for specifier, imported in modules[path].imports.items():
+                if imported is None and specifier not in externals:
+                    externals[specifier] = f"{PREFIX}external{len(externals)}"
+
+        root = os.path.dirname(entry)
+        output = [f"// Bundle of {os.path.relpath(entry, root)}\n"]
+        for specifier, name in externals.items():
+            output.append(f"import * as {name} from {json.dumps(specifier)};\n")
+        output.append(RUNTIME)
+        removed: Dict[str, List[str]] = {}
+        for path in order:
+            module = modules[path]
+            code, unused = _rewrite(module, modules, used[path], names, externals)
+            if unused:
+                removed[path] = unused
+            output.append(f"// {os.path.relpath(path, root)}\n")
+            output.append(f"const {names[path]} = {{}};\n")
+            output.append(f'(function ({EXPORTS}) {{\n"use strict";\n')
+            output.append(code)
+            if not code.endswith("\n"):
+                output.append("\n")
+            output.append(f"}})({names[path]});\n")
+
+        exported = sorted(_export_names(modules, entry))
+        plain = [name for name in exported if name != "default" and name.isidentifier()]
+        if plain:
+            output.append(f"export const {{ {', '.join(plain)} }} = {names[entry]};\n")
+        if "default" in exported:
+            output.append(f"export default {names[entry]}.default;\n")
+        return Bundle("".join(output), order, transpiled, removed)
+
+
+def _evaluation_order(modules: Dict[str, Module], entry: str) -> List[str]:
+    """Every module after the modules it imports, like ES modules run"""
+    order: List[str] = []
+    done: Set[str] = set()
+    stack: List[str] = []
+
+    def visit(path: str) -> None:
+        if path in done:
+            return
+        if path in stack:
+            cycle = stack[stack.index(path) :] + [path]
+            root = os.path.dirname(entry)
+            raise ValueError(
+                "Circular import: "
+                + " -> ".join(os.path.relpath(p, root) for p in cycle)
+            )
+        stack.append(path)
+        for imported in modules[path].imports.values():
+            if imported is not None:
+                visit(imported)
+        stack.pop()
+        done.add(path)
+        order.append(path)
+
+    visit(entry)
+    return order
+
+
+def _local_exports(module: Module) -> Set[str]:
+    return {
+        binding.alias
+        for statement in module.parsed.statements
+        if statement.kind in (EXPORT_LIST, DECLARATION, DEFAULT)
+        for binding in statement.bindings
+    }
+
+
+def _export_names(
+    modules: Dict[str, Module], path: str, visited: Optional[Set[str]] = None
+) -> Set[str]:
+    """Every name a module exports, as far as it is known before running it"""
+    visited = visited if visited is not None else set()
+    visited.add(path)
+    module = modules[path]
+    names = _local_exports(module)
+    for statement in module.parsed.statements:
+        if statement.kind != REEXPORT:
+            continue
+        for binding in statement.bindings:
+            if binding.alias != ALL:
+                names.add(binding.alias)
+                continue
+            imported = module.imports[statement.specifier]
+            if imported is not None and imported not in visited:
+                names |= _export_names(modules, imported, visited) - {"default"}
+    return names
+
+
+def _used_exports(
+    modules: Dict[str, Module], entry: str
+) -> Dict[str, Optional[Set[str]]]:
+    """
+    The exports of every module that some module imports, None for all of
+    them. Every export of the entry module is an export of the bundle.
+    """
+    used: Dict[str, Optional[Set[str]]] = {path: set() for path in modules}
+    used[entry] = None
+    pending = list(modules)
+
+    def use(path: Optional[str], names: Optional[Set[str]]) -> None:
+        if path is None:
+            return
+        current = used[path]
+        if current is None:
+            return
+        if names is None:
+            used[path] = None
+        elif names <= current:
+            return
+        else:
+            current |= names
+        pending.append(path)
+
+    while pending:
+        path = pending.pop()
+        module = modules[path]
+        names = used[path]
+        local = _local_exports(module)
+        for statement in module.parsed.statements:
+            imported = module.imports.get(statement.specifier)
+            if statement.kind == IMPORT:
+                for binding in statement.bindings:
+                    use(imported, None if binding.name == ALL else {binding.name})
+            elif statement.kind == REEXPORT:
+                for binding in statement.bindings:
+                    if binding.alias == ALL:
+                        use(imported, None if names is None else names - local)
+                    elif names is None or binding.alias in names:
+                        use(imported, None if binding.name == ALL else {binding.name})
+    return used
+
+
+def _rewrite(
+    module: Module,
+    modules: Dict[str, Module],
+    used: Optional[Set[str]],
+    names: Dict[str, str],
+    externals: Dict[str, str],
+) -> Tuple[str, List[str]]:
+    """
+    Rewrite the import and export statements of a module.
+
+    Returns:
+        The JavaScript to run in the function of the module, and the
+        exports that were left out
+    """
+    parsed = module.parsed
+    js = parsed.js
+
+    def source(specifier: str) -> str:
+        imported = module.imports[specifier]
+        return externals[specifier] if imported is None else names[imported]
+
+    def is_used(alias: str) -> bool:
+        return used is None or alias in used
+
+    edits: List[Tuple[int, int, str]] = []
+    getters: Dict[str, str] = {}
+    export_all: List[str] = []
+    unused: List[str] = []
+    # Exported functions and classes that no module imports
+    removable: Set[str] = set()
+    references = parsed.references.copy()
+    # Imported names are read from their module wherever they are used, so
+    # they change with it like the live bindings of ES modules
+    imports: Dict[str, str] = {}
+    for statement in parsed.statements:
+        if statement.kind != IMPORT:
+            continue
+        target = source(statement.specifier)
+        for name, alias in statement.bindings:
+            if name == ALL or alias in parsed.redeclared:
+                continue
+            if name.isidentifier():
+                imports[alias] = f"{target}.{name}"
+            else:
+                imports[alias] = f"{target}[{json.dumps(name)}]"
+            for start, use in parsed.import_references.get(alias, ()):
+                value = imports[alias]
+                if use == CALL:
+                    value = f"(0, {value})"
+                elif use == SHORTHAND:
+                    value = f"{alias}: {value}"
+                edits.append((start, start + len(alias), value))
+        code = _import_code(statement, target, parsed.redeclared)
+        edits.append((statement.start, statement.end, code))
+
+    for statement in parsed.statements:
+        kind = statement.kind
+        if kind == IMPORT:
+            continue
+        if kind == REEXPORT:
+            edits.append((statement.start, statement.end, ""))
+            for name, alias in statement.bindings:
+                if alias == ALL:
+                    imported = module.imports[statement.specifier]
+                    if imported is None:
+                        export_all.append(source(statement.specifier))
+                        continue
+                    for star in sorted(_export_names(modules, imported)):
+                        if star != "default" and is_used(star):
+                            getters.setdefault(
+                                star, f"{names[imported]}[{json.dumps(star)}]"
+                            )
+                elif is_used(alias):
+                    target = source(statement.specifier)
+                    getters[alias] = (
+                        target if name == ALL else f"{target}[{json.dumps(name)}]"
+                    )
+                else:
+                    unused.append(alias)
+            continue
+
+        if kind == DEFAULT:
+            edits.append((statement.start, statement.end, f"const {DEFAULT_EXPORT} ="))
+            if statement.declaration_end is not None:
+                edits.append(
+                    (statement.declaration_end, statement.declaration_end, ";")
+                )
+        elif kind == EXPORT_LIST:
+            edits.append((statement.start, statement.end, ""))
+        for name, alias in statement.bindings:
+            if is_used(alias):
+                getters[alias] = imports.get(name, name)
+                references[name] += 1
+            else:
+                unused.append(alias)
+                if name in parsed.declarations:
+                    removable.add(name)
+        if kind == DECLARATION:
+            edits.append((statement.start, statement.end, ""))
+
+    # Remove what is left unused, which can leave more unused
+    removed: Set[str] = set()
+    changed = True
+    while changed:
+        changed = False
+        for name in sorted(removable - removed):
+            inside = parsed.declaration_references.get(name, Counter())
+            if references[name] > inside[name]:
+                continue
+            removed.add(name)
+            references.subtract(inside)
+            changed = True
+    for name in removed:
+        start, end = parsed.declarations[name]
+        edits = [edit for edit in edits if not start <= edit[0] < end]
+        edits.append((start, end, ""))
+
+    output = []
+    pos = 0
+    for start, end, replacement in sorted(edits):
+        output.append(js[pos:start])
+        output.append(replacement)
+        pos = max(pos, end)
+    output.append(js[pos:])
+    if getters:
+        entries = ", ".join(
+            f"{json.dumps(alias)}: () => {value}" for alias, value in getters.items()
+        )
+        output.append(f"\n{EXPORT_HELPER}({EXPORTS}, {{ {entries} }});")
+    for name in export_all:
+        output.append(f"\n{EXPORT_ALL_HELPER}({EXPORTS}, {name});")
+    return "".join(output), unused
+
+
+def _import_code(statement: ModuleStatement, target: str, redeclared: Set[str]) -> str:
+    """
+    The declarations replacing an import statement, for namespaces and for
+    the names the module declares again, which are copied once
+    """
+    declarations = []
+    named = []
+    for name, alias in statement.bindings:
+        if name == ALL:
+            declarations.append(f"const {alias} = {target};")
+        elif alias not in redeclared:
+            continue
+        elif name == alias:
+            named.append(alias)
+        else:
+            named.append(f"{json.dumps(name)}: {alias}")
+    if named:
+        declarations.insert(0, f"const {{ {', '.join(named)} }} = {target};")
+    return " ".join(declarations)
+
+
+def bundle_file(
+    entry: str,
+    output_path: Optional[str],
+    jobs: Optional[int] = 1,
+    cache: Optional[TranspileCache] = None,
+) -> Bundle:
+    """
+    Bundle a Rogalang entry module with every module it imports into one
+    JavaScript file. See Bundler.bundle.
+
+    Args:
+        entry: Path of the Rogalang entry module
+        output_path: Path of the JavaScript file to write, None to only
+            return the bundle
+        jobs: Number of worker processes, defaults to the number of CPUs
+        cache: Cache to look up and store every transpiled module in
+    """
+    bundle = Bundler(jobs, cache).bundle(entry)
+    if output_path is not None:
+        write_output(output_path, [bundle.js])
+    return bundle
@@ -0,0 +1,622 @@
+"""
+Command line interface for the Rogalang transpiler.
+
+Usage:
+    python cli.py [file] [-j 4]               Transpile one file to stdout
+    python cli.py build src/ -o dist/ -j 4    Transpile all .rl files in src/
+    python cli.py serve [--socket PATH]       Answer NDJSON transpile requests
+        [--dialect NAME=CSV]                  with hot-reloaded dialects
+    python cli.py check src/ [--fail-fast]    Report every validation error
+    python cli.py bundle main.rl -o app.js    Bundle main.rl with its imports
+
+Add --profile to either command to print where the time went to stderr,
+--source-map to emit a Source Map v3 for every JavaScript file,
+--optimize to fold constants and turn if-ladders into switch statements, or
+--minify to drop the whitespace and comments the JavaScript does not need.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import argparse
+import os
+import sys
+
+from sourcemap import SOURCE_MAP_KINDS, SourceMapBuilder
+from transpile_cache import DEFAULT_MAX_BYTES, TranspileCache
+from transpiler import (
+    DEFAULT_RELOAD_INTERVAL,
+    DEFAULT_TRANSPILER,
+    DIALECTS,
+    Transpiler,
+    TranspileMemo,
+    TranspileStats,
+    get_semantics,
+    optimize_chunks,
+    validate_file,
+)
+
+COMMANDS = ("transpile", "build", "serve", "check", "bundle")
+SOURCE_EXTENSION = ".rl"
+OUTPUT_EXTENSION = ".js"
+
+
+def find_sources(source: str, output: str) -> List[Tuple[str, str]]:
+    """
+    Find all Rogalang files below source and the JavaScript file for each.
+
+    Args:
+        source: A Rogalang file or a directory to search recursively
+        output: Directory to write the JavaScript files to, the directory
+            structure below source is kept
+
+    Returns:
+        Sorted pairs of (source path, output path)
+
+    Raises:
+        FileNotFoundError: If source does not exist
+    """
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"{source} does not exist")
+    if os.path.isfile(source):
+        name = os.path.splitext(os.path.basename(source))[0]
+        return [(source, os.path.join(output, name + OUTPUT_EXTENSION))]
+
+    pairs = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(SOURCE_EXTENSION):
+                continue
+            relative = os.path.relpath(os.path.join(root, name), source)
+            pairs.append(
+                (
+                    os.path.join(root, name),
+                    os.path.join(
+                        output, os.path.splitext(relative)[0] + OUTPUT_EXTENSION
+                    ),
+                )
+            )
+    return pairs
+
+
+# Transpile cache of the current (worker) process
+_cache: Optional[TranspileCache] = None
+# Whether the current (worker) process profiles its transpilations
+_profile = False
+# Transpiler of the current (worker) process
+_transpiler = DEFAULT_TRANSPILER
+# Source map kind written by the current (worker) process
+_source_map: Optional[str] = None
+# Whether the current (worker) process optimizes its output
+_optimize = False
+# Whether the current (worker) process minifies its output
+_minify = False
+
+
+def _make_transpiler(memo: bool) -> Transpiler:
+    return Transpiler(memo=TranspileMemo()) if memo else DEFAULT_TRANSPILER
+
+
+def _init_worker(
+    cache_dir: Optional[str],
+    cache_size: int,
+    use_cache: bool,
+    profile: bool = False,
+    memo: bool = False,
+    source_map: Optional[str] = None,
+    optimize: bool = False,
+    minify: bool = False,
+) -> None:
+    global _cache, _profile, _transpiler, _source_map, _optimize, _minify
+    # Load the semantics once per worker instead of once per file
+    get_semantics()
+    _cache = TranspileCache(cache_dir, cache_size) if use_cache else None
+    _profile = profile
+    _transpiler = _make_transpiler(memo)
+    _source_map = source_map
+    _optimize = optimize
+    _minify = minify
+
+
+def _build_file(
+    source_path: str, output_path: str
+) -> Tuple[Optional[str], int, Optional[TranspileStats]]:
+    """
+    Transpile one file, returning an error message instead of raising, the
+    number of cache hits and the profile of the file if profiling
+    """
+    hits = _cache.hits if _cache is not None else 0
+    stats = TranspileStats() if _profile else None
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        _transpiler.transpile_file(
+            source_path,
+            output_path,
+            _cache,
+            stats,
+            _source_map,
+            optimize=_optimize,
+            minify=_minify,
+        )
+    except (ValueError, OSError) as e:
+        return f"{source_path}: {e}", 0, stats
+    return None, (_cache.hits - hits if _cache is not None else 0), stats
+
+
+def build(
+    source: str,
+    output: str,
+    jobs: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    cache_size: int = DEFAULT_MAX_BYTES,
+    use_cache: bool = True,
+    profile: bool = False,
+    memo: bool = False,
+    source_map: Optional[str] = None,
+    optimize: bool = False,
+    minify: bool = False,
+) -> int:
+    """
+    Transpile all Rogalang files below source into output.
+
+    A file that fails to validate or transpile is reported on stderr without
+    stopping the rest of the build.
+
+    Args:
+        source: A Rogalang file or a directory to search recursively
+        output: Directory to write the JavaScript files to
+        jobs: Number of worker processes, defaults to the number of CPUs
+        cache_dir: Directory of the transpile cache
+        cache_size: Maximum size of the transpile cache in bytes
+        use_cache: Whether to reuse output of unchanged files
+        profile: Whether to print a profile of all transpilations to stderr
+        memo: Whether to memoize repeated lines and template expressions
+        source_map: 'inline' or 'file' to write a source map for every
+            file, which bypasses the cache
+        optimize: Whether to fold constants and compact if-ladders
+        minify: Whether to drop the whitespace and comments the JavaScript
+            does not need
+
+    Returns:
+        The number of files that failed, 1 if source does not exist
+    """
+    try:
+        pairs = find_sources(source, output)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if not pairs:
+        print(f"No {SOURCE_EXTENSION} files found in {source}", file=sys.stderr)
+        return 0
+
+    jobs = min(jobs or os.cpu_count() or 1, len(pairs))
+    sources = [source_path for source_path, _ in pairs]
+    outputs = [output_path for _, output_path in pairs]
+    worker_args = (
+        cache_dir,
+        cache_size,
+        use_cache,
+        profile,
+        memo,
+        source_map,
+        optimize,
+        minify,
+    )
+    if jobs == 1:
+        _init_worker(*worker_args)
+        results = list(map(_build_file, sources, outputs))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=worker_args
+        ) as pool:
+            chunksize = max(1, len(pairs) // (jobs * 4))
+            results = list(pool.map(_build_file, sources, outputs, chunksize=chunksize))
+
+    failed = [error for error, _, _ in results if error is not None]
+    for error in failed:
+        print(error, file=sys.stderr)
+    print(
+        f"Built {len(pairs) - len(failed)} of {len(pairs)} files into {output}",
+        file=sys.stderr,
+    )
+    if use_cache:
+        hits = sum(hits for _, hits, _ in results)
+        misses = len(pairs) - len(failed) - hits
+        evicted = TranspileCache(cache_dir, cache_size).prune()
+        print(
+            f"Cache: {hits} hits, {misses} misses, {evicted} evicted",
+            file=sys.stderr,
+        )
+    if profile:
+        stats = TranspileStats()
+        for _, _, file_stats in results:
+            stats.merge(file_stats)
+        print(stats.report(), file=sys.stderr)
+    return len(failed)
+
+
+def transpile(
+    path: str,
+    profile: bool = False,
+    memo: bool = False,
+    jobs: int = 1,
+    source_map: bool = False,
+    optimize: bool = False,
+    minify: bool = False,
+) -> None:
+    """
+    Transpile one Rogalang file to stdout, in jobs worker processes if more
+    than one, ending with an inline source map if source_map. With optimize,
+    the output is only written once the whole file was transpiled. With
+    minify, whitespace and comments are dropped as tokens are replaced
+    """
+    transpiler = _make_transpiler(memo)
+    stats = TranspileStats() if profile else None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            # Validate and transpile the source, one segment at a time
+            if source_map:
+                builder = SourceMapBuilder(path)
+                chunks = transpiler.transpile_stream(f, stats, builder)
+            elif jobs != 1:
+                # Imported where needed, so that commands which do not use
+                # them do not pay for loading them
+                from parallel import ParallelTranspiler
+
+                chunks = ParallelTranspiler(
+                    transpiler, jobs, minify=minify
+                ).transpile_stream(f, stats)
+            else:
+                chunks = transpiler.transpile_stream(f, stats, minify=minify)
+            if optimize:
+                chunks = optimize_chunks(chunks, stats)
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+        sys.stdout.write("\n")
+        if source_map:
+            sys.stdout.write(builder.inline_comment())
+    finally:
+        if stats is not None:
+            print(stats.report(), file=sys.stderr)
+
+
+def check(sources: List[str], fail_fast: bool = False) -> int:
+    """
+    Validate Rogalang files, printing every issue as path:line: message.
+
+    Args:
+        sources: Rogalang files or directories to search recursively
+        fail_fast: Only report the first issue of every file
+
+    Returns:
+        The number of invalid files and sources that do not exist
+    """
+    paths = []
+    invalid = 0
+    for source in sources:
+        try:
+            paths += [path for path, _ in find_sources(source, "")]
+        except FileNotFoundError as e:
+            print(e)
+            invalid += 1
+    for path in paths:
+        try:
+            issues = validate_file(path, fail_fast)
+        except (ValueError, OSError) as e:
+            print(f"{path}: {e}")
+            invalid += 1
+            continue
+        for issue in issues:
+            print(f"{path}:{issue.line}: {issue.message}")
+        invalid += bool(issues)
+    print(f"Checked {len(paths)} files, {invalid} invalid", file=sys.stderr)
+    return invalid
+
+
+def bundle(
+    entry: str,
+    output: Optional[str] = None,
+    jobs: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    cache_size: int = DEFAULT_MAX_BYTES,
+    use_cache: bool = True,
+) -> None:
+    """
+    Bundle a Rogalang entry module with every module it imports, see
+    bundler.py.
+
+    Args:
+        entry: Path of the Rogalang entry module
+        output: Path of the JavaScript file to write, stdout if None
+        jobs: Number of worker processes, defaults to the number of CPUs
+        cache_dir: Directory of the transpile cache
+        cache_size: Maximum size of the transpile cache in bytes
+        use_cache: Whether to reuse output of unchanged modules
+
+    Raises:
+        ValueError: If a module fails to transpile or cannot be bundled
+    """
+    from bundler import bundle_file
+
+    cache = TranspileCache(cache_dir, cache_size) if use_cache else None
+    result = bundle_file(entry, output, jobs, cache)
+    if output is None:
+        sys.stdout.write(result.js)
+    removed = sum(map(len, result.removed.values()))
+    print(
+        f"Bundled {len(result.modules)} modules into {output or 'stdout'}, "
+        f"transpiled {len(result.transpiled)}, removed {removed} unused exports",
+        file=sys.stderr,
+    )
+    if cache is not None:
+        cache.prune()
+
+
+def parse_dialect(spec: str) -> Tuple[str, str]:
+    """Parse a NAME=CSV dialect argument"""
+    name, sep, path = spec.partition("=")
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError(
+            f"dialect must be given as NAME=CSV, not {spec!r}"
+        )
+    return name, path
+
+
+def serve(
+    socket_path: Optional[str] = None,
+    jobs: Optional[int] = None,
+    dialects: Optional[List[Tuple[str, str]]] = None,
+    reload_interval: float = DEFAULT_RELOAD_INTERVAL,
+) -> None:
+    """Answer transpile requests on stdin/stdout or a Unix socket"""
+    from server import TranspileServer
+
+    for name, path in dialects or []:
+        DIALECTS.register(name, path)
+    server = TranspileServer(max_workers=jobs, reload_interval=reload_interval)
+    try:
+        if socket_path is None:
+            sys.stdin.reconfigure(encoding="utf-8")
+            server.serve_stream(sys.stdin, sys.stdout)
+        else:
+            print(f"Listening on {socket_path}", file=sys.stderr)
+            server.serve_unix(socket_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Transpiling a single file is the default command
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["transpile"] + argv
+
+    parser = argparse.ArgumentParser(
+        prog="rogalang", description="Transpile Rogalang to JavaScript"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    transpile_parser = commands.add_parser(
+        "transpile", help="transpile one file to stdout"
+    )
+    transpile_parser.add_argument("file", nargs="?", default="helloWorld.rl")
+    transpile_parser.add_argument(
+        "--profile", action="store_true", help="print a profile to stderr"
+    )
+    transpile_parser.add_argument(
+        "--memo", action="store_true", help="memoize repeated lines and expressions"
+    )
+    transpile_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="split the file across this many worker processes, 0 for one "
+        "per CPU (default: 1)",
+    )
+    transpile_parser.add_argument(
+        "--source-map",
+        action="store_true",
+        help="append an inline source map, runs in a single process",
+    )
+    transpile_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="fold constants and turn if-ladders into switch statements",
+    )
+    transpile_parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="drop whitespace and comments the JavaScript does not need",
+    )
+
+    build_parser = commands.add_parser(
+        "build", help="transpile all .rl files in a directory"
+    )
+    build_parser.add_argument("source", help="a .rl file or directory of .rl files")
+    build_parser.add_argument(
+        "-o", "--output", default="dist", help="output directory (default: dist)"
+    )
+    build_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    build_parser.add_argument(
+        "--cache-dir", default=None, help="directory of the transpile cache"
+    )
+    build_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="maximum size of the transpile cache in MB (default: %(default)s)",
+    )
+    build_parser.add_argument(
+        "--no-cache", action="store_true", help="always transpile every file"
+    )
+    build_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print a profile of all transpiled files to stderr",
+    )
+    build_parser.add_argument(
+        "--memo",
+        action="store_true",
+        help="memoize repeated lines and expressions in every worker",
+    )
+    build_parser.add_argument(
+        "--source-map",
+        choices=SOURCE_MAP_KINDS,
+        default=None,
+        help="write a source map inline or to a .js.map file next to every "
+        "file, bypassing the cache",
+    )
+    build_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="fold constants and turn if-ladders into switch statements",
+    )
+    build_parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="drop whitespace and comments the JavaScript does not need",
+    )
+
+    serve_parser = commands.add_parser(
+        "serve", help="answer NDJSON transpile requests on stdin or a socket"
+    )
+    serve_parser.add_argument(
+        "--socket", default=None, help="listen on this Unix socket instead of stdin"
+    )
+    serve_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of threads handling requests",
+    )
+    serve_parser.add_argument(
+        "--dialect",
+        type=parse_dialect,
+        action="append",
+        default=[],
+        metavar="NAME=CSV",
+        help="add a dialect that requests can pick, may be repeated",
+    )
+    serve_parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=DEFAULT_RELOAD_INTERVAL,
+        metavar="SECONDS",
+        help="how often to check the semantics CSVs for changes, 0 to never "
+        f"reload them (default: {DEFAULT_RELOAD_INTERVAL:g})",
+    )
+
+    check_parser = commands.add_parser(
+        "check", help="report every validation error in .rl files"
+    )
+    check_parser.add_argument(
+        "sources", nargs="+", help=".rl files or directories of .rl files"
+    )
+    check_parser.add_argument(
+        "--fail-fast", action="store_true", help="stop at the first error of a file"
+    )
+
+    bundle_parser = commands.add_parser(
+        "bundle", help="bundle a .rl file with every .rl file it imports"
+    )
+    bundle_parser.add_argument("entry", help="the .rl file to start from")
+    bundle_parser.add_argument(
+        "-o", "--output", default=None, help="file to write (default: stdout)"
+    )
+    bundle_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    bundle_parser.add_argument(
+        "--cache-dir", default=None, help="directory of the transpile cache"
+    )
+    bundle_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="maximum size of the transpile cache in MB (default: %(default)s)",
+    )
+    bundle_parser.add_argument(
+        "--no-cache", action="store_true", help="always transpile every module"
+    )
+
+    args = parser.parse_args(argv)
+    if getattr(args, "optimize", False) and args.source_map:
+        parser.error("--optimize cannot be combined with --source-map")
+    if getattr(args, "minify", False) and args.source_map:
+        parser.error("--minify cannot be combined with --source-map")
+
+    if args.command == "build":
+        failed = build(
+            args.source,
+            args.output,
+            args.jobs,
+            cache_dir=args.cache_dir,
+            cache_size=args.cache_size * 1024 * 1024,
+            use_cache=not args.no_cache,
+            profile=args.profile,
+            memo=args.memo,
+            source_map=args.source_map,
+            optimize=args.optimize,
+            minify=args.minify,
+        )
+        return 1 if failed else 0
+
+    if args.command == "check":
+        return 1 if check(args.sources, args.fail_fast) else 0
+
+    if args.command == "bundle":
+        try:
+            bundle(
+                args.entry,
+                args.output,
+                args.jobs,
+                cache_dir=args.cache_dir,
+                cache_size=args.cache_size * 1024 * 1024,
+                use_cache=not args.no_cache,
+            )
+        except (ValueError, OSError) as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+
+    if args.command == "serve":
+        try:
+            serve(args.socket, args.jobs, args.dialect, args.reload_interval)
+        except OSError as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+
+    try:
+        transpile(
+            args.file,
+            args.profile,
+            args.memo,
+            args.jobs,
+            args.source_map,
+            args.optimize,
+            args.minify,
+        )
+    except (ValueError, OSError) as e:
+        print(f"{args.file}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
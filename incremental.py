@@ -0,0 +1,315 @@
+"""
+Incremental transpilation of Rogalang files that are being edited.
+
+'herliga london' lines split a file into segments of at most
+MAX_LINES_BETWEEN_HERLIGA_LONDON lines. The output of every segment is kept,
+so after an edit only the segments it touched are validated and transpiled
+again, together with the segments a template literal carries over into.
+"""
+
+from __future__ import annotations
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from transpiler import (
+    DEFAULT_TRANSPILER,
+    JILLE_PREFIX,
+    MAX_LINES_BETWEEN_HERLIGA_LONDON,
+    Transpiler,
+    TemplateCarry,
+    TranspileStats,
+)
+
+# The raw lines of a segment, starting with its 'herliga london' line
+SegmentLines = Tuple[str, ...]
+# Carried code shorter than this is checked for a closed template literal
+# after every segment, so the segments after a short literal can be reused
+EAGER_CARRY_SIZE = 4096
+
+
+def _is_herliga_london(line: str) -> bool:
+    return line.rstrip("\r\n") == "herliga london"
+
+
+def _code(lines: SegmentLines) -> str:
+    """The preprocessed code of a segment"""
+    return "".join(
+        [JILLE_PREFIX.sub("", line) for line in lines if JILLE_PREFIX.match(line)]
+    )
+
+
+def split_segments(lines: Iterable[str]) -> List[SegmentLines]:
+    """
+    Split Rogalang source at its 'herliga london' lines.
+
+    Args:
+        lines: Lines of the Rogalang source, including line endings
+
+    Returns:
+        The lines of every segment. Only the first segment can lack a
+        'herliga london' line, when the source does not start with one
+    """
+    segments = []
+    current: List[str] = []
+    for line in lines:
+        if current and _is_herliga_london(line):
+            segments.append(tuple(current))
+            current = []
+        current.append(line)
+    if current:
+        segments.append(tuple(current))
+    return segments
+
+
+def validate_segments(
+    segments: Sequence[SegmentLines],
+    start: int = 0,
+    stop: Optional[int] = None,
+    line: int = 0,
+) -> None:
+    """
+    Validate the 'herliga london' spacing of split source.
+
+    Reports the same errors as iter_rogalang_segments, but only looks at the
+    length of every segment instead of at every line.
+
+    Args:
+        segments: The split source
+        start: First segment to check the length of, when the segments
+            before it are known to be valid
+        stop: Segment after the last one to check, defaults to all
+        line: 0-based line the segment at start begins on
+
+    Raises:
+        ValueError: If validation fails
+    """
+    if not segments or not _is_herliga_london(segments[0][0]):
+        if len(segments) > 1:
+            raise ValueError("First line must be 'herliga london'")
+        raise ValueError("No 'herliga london' found in source file")
+
+    last = len(segments) - 1
+    stop = len(segments) if stop is None else min(stop, len(segments))
+    for i in range(start, stop):
+        segment = segments[i]
+        if i < last and len(segment) > MAX_LINES_BETWEEN_HERLIGA_LONDON:
+            raise ValueError(
+                f"Gap of {len(segment)} lines between 'herliga london' at lines {line + 1} and {line + len(segment) + 1}"
+            )
+        if i == last and len(segment) - 1 > MAX_LINES_BETWEEN_HERLIGA_LONDON:
+            raise ValueError(
+                f"Last 'herliga london' at line {line + 1} is more than {MAX_LINES_BETWEEN_HERLIGA_LONDON} lines from end"
+            )
+        line += len(segment)
+
+
+def _offsets(segments: Iterable[SegmentLines], line: int = 0) -> List[int]:
+    """The line every segment starts on, followed by the line after the last"""
+    return list(accumulate((len(segment) for segment in segments), initial=line))
+
+
+class _Segment(NamedTuple):
+    lines: SegmentLines
+    # The transpiled JavaScript of the segment
+    output: str
+    # Length of the code carried over to the next segment while a template
+    # literal in it may still be open. It is the end of the code of this and
+    # the segments before, so the carried code is not kept
+    carried: int
+
+
+class IncrementalTranspiler:
+    """
+    Transpiles a Rogalang file that changes over time, e.g. in an editor.
+
+    Every update reuses the output of the segments that did not change, so
+    its cost depends on the size of the edit instead of the size of the
+    file. The output always equals that of transpile_stream on the whole
+    source.
+    """
+
+    def __init__(self, transpiler: Optional[Transpiler] = None):
+        """
+        Args:
+            transpiler: Transpiler to use, defaults to the default semantics
+        """
+        self.transpiler = transpiler or DEFAULT_TRANSPILER
+        self._segments: List[_Segment] = []
+        # The line every segment starts on, followed by the number of lines
+        self._offsets = [0]
+        # The output of a template literal still open at the end
+        self._tail = ""
+        self.output = ""
+        # Number of segments transpiled by the last update or edit
+        self.transpiled_segments = 0
+
+    @property
+    def lines(self) -> List[str]:
+        """The lines of the current source"""
+        return [line for segment in self._segments for line in segment.lines]
+
+    def update(
+        self,
+        source: Union[str, Iterable[str]],
+        stats: Optional[TranspileStats] = None,
+    ) -> str:
+        """
+        Replace the whole source, transpiling only the segments that changed.
+
+        Args:
+            source: The new Rogalang source, as text or lines
+            stats: Profile to record the transpilation in
+
+        Returns:
+            The transpiled JavaScript of the whole source
+
+        Raises:
+            ValueError: If validation fails, the previous source is kept
+        """
+        if isinstance(source, str):
+            source = source.splitlines(keepends=True)
+        segments = split_segments(source)
+        validate_segments(segments)
+
+        # Segments at the start and end that are unchanged
+        old = self._segments
+        limit = min(len(old), len(segments))
+        prefix = 0
+        while prefix < limit and old[prefix].lines == segments[prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < limit - prefix
+            and old[len(old) - 1 - suffix].lines == segments[-1 - suffix]
+        ):
+            suffix += 1
+        return self._apply(segments, _offsets(segments), prefix, suffix, stats)
+
+    def edit(
+        self,
+        start: int,
+        end: int,
+        new_lines: Union[str, Iterable[str]],
+        stats: Optional[TranspileStats] = None,
+    ) -> str:
+        """
+        Replace lines start to end (exclusive, 0-based) of the source.
+
+        Only the segments around the edit are split again, which makes this
+        cheaper than update for editors that report their changes.
+
+        Args:
+            start: First line to replace
+            end: Line after the last line to replace, start to insert
+            new_lines: The replacement, as text or lines
+            stats: Profile to record the transpilation in
+
+        Returns:
+            The transpiled JavaScript of the whole source
+
+        Raises:
+            ValueError: If validation fails, the previous source is kept
+            IndexError: If the lines are not in the source
+        """
+        if isinstance(new_lines, str):
+            new_lines = new_lines.splitlines(keepends=True)
+        old = self._segments
+        offsets = self._offsets
+        total = offsets[-1]
+        if not 0 <= start <= end <= total:
+            raise IndexError(f"Lines {start} to {end} are not in the source")
+        if not old:
+            return self.update(new_lines, stats)
+
+        # Find the segments containing the first and last edited line, the
+        # last one when appending to the end of the source
+        first = min(bisect_right(offsets, start), len(old)) - 1
+        last = min(bisect_left(offsets, max(end, start + 1), 1), len(old)) - 1
+        # Removing a 'herliga london' line merges a segment into the previous one
+        if first > 0:
+            first -= 1
+        first_line = offsets[first]
+
+        lines = [line for segment in old[first : last + 1] for line in segment.lines]
+        lines[start - first_line : end - first_line] = list(new_lines)
+        middle = split_segments(lines)
+        segments = [segment.lines for segment in old[:first]] + middle
+        segments += [segment.lines for segment in old[last + 1 :]]
+
+        # The lines after the edit move by the change in length
+        moved = len(lines) - (offsets[last + 1] - first_line)
+        new_offsets = offsets[:first] + _offsets(middle, first_line)
+        new_offsets += [line + moved for line in offsets[last + 2 :]]
+
+        # Only the edited segments and their neighbours can have become invalid
+        check = max(first - 1, 0)
+        validate_segments(segments, check, first + len(middle) + 1, new_offsets[check])
+        return self._apply(segments, new_offsets, first, len(old) - last - 1, stats)
+
+    def _apply(
+        self,
+        segments: List[SegmentLines],
+        offsets: List[int],
+        prefix: int,
+        suffix: int,
+        stats: Optional[TranspileStats],
+    ) -> str:
+        """
+        Transpile segments, reusing the first prefix and last suffix segments
+        of the previous source where their input did not change.
+        """
+        old = self._segments
+        carry = TemplateCarry(self.transpiler.semantics, EAGER_CARRY_SIZE)
+        carry.hold(self._carried_code(prefix))
+        result = old[:prefix]
+        transpiled = 0
+        reusable_from = len(segments) - suffix
+        shift = len(old) - len(segments)
+        for i in range(prefix, len(segments)):
+            if not carry:
+                # The output of a segment only depends on its lines when no
+                # template literal is carried into it
+                if i >= reusable_from and (
+                    i + shift == 0 or not old[i + shift - 1].carried
+                ):
+                    result.extend(old[i + shift :])
+                    break
+                if (
+                    i < len(old)
+                    and old[i].lines == segments[i]
+                    and (i == 0 or not old[i - 1].carried)
+                ):
+                    # E.g. the segment before an edit, which is split again
+                    segment = old[i]
+                    if segment.carried:
+                        carry.hold(_code(segment.lines)[-segment.carried :])
+                    result.append(segment)
+                    continue
+            content = carry.feed(_code(segments[i]))
+            output = self.transpiler.transpile(content, stats) if content else ""
+            result.append(_Segment(segments[i], output, len(carry)))
+            transpiled += 1
+        else:
+            if not prefix == len(old) == len(segments):
+                pending = carry.finish()
+                self._tail = (
+                    self.transpiler.transpile(pending, stats) if pending else ""
+                )
+
+        self._segments = result
+        self._offsets = offsets
+        self.transpiled_segments = transpiled
+        self.output = "".join([segment.output for segment in result]) + self._tail
+        return self.output
+
+    def _carried_code(self, end: int) -> str:
+        """The code carried over into segment end of the current source"""
+        size = self._segments[end - 1].carried if end else 0
+        parts = []
+        while size > 0:
+            end -= 1
+            code = _code(self._segments[end].lines)
+            parts.append(code[max(len(code) - size, 0) :])
+            size -= len(code)
+        return "".join(reversed(parts))
@@ -0,0 +1,126 @@
+"""
+Tokenizer for JavaScript, shared by the optimizer and the bundler.
+
+tokenize_js splits JavaScript into tokens without parsing it, keeping the
+whitespace and comments, so that joining the tokens gives back the source.
+It is kept apart from the optimizer so that bundling, which only needs the
+tokens, does not load the optimizing passes.
+"""
+
+from __future__ import annotations
+from typing import List, NamedTuple, Optional
+import re
+
+WHITESPACE = "ws"
+NEWLINE = "newline"
+COMMENT = "comment"
+NUMBER = "number"
+STRING = "string"
+TEMPLATE = "template"
+REGEX = "regex"
+IDENTIFIER = "ident"
+PUNCTUATOR = "punct"
+# Tokens that do not change the meaning of the code around them
+TRIVIA = (WHITESPACE, NEWLINE, COMMENT)
+
+PUNCTUATORS = sorted(
+    """>>>= ... === !== **= <<= >>= >>> &&= ||= ??= => == != <= >= && || ??
+    ?. ++ -- += -= *= /= %= &= |= ^= ** << >> { } ( ) [ ] ; , < > + - * / %
+    & | ^ ! ~ ? : = . @ #""".split(),
+    key=len,
+    reverse=True,
+)
+TOKEN_REGEX = re.compile(
+    r"""(?P<ws>[ \t\f\v\u00a0\ufeff]+)
+    |(?P<newline>\r\n|[\n\r\u2028\u2029])
+    |(?P<comment>//[^\n\r\u2028\u2029]*|/\*[\s\S]*?(?:\*/|\Z))
+    |(?P<number>(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?n?
+        |0[xXoObB][\da-fA-F_]+n?)
+    |(?P<string>'(?:\\[\s\S]|[^\\'\n\r])*'?|"(?:\\[\s\S]|[^\\"\n\r])*"?)
+    |(?P<ident>[A-Za-z_$\u0080-\uffff][\w$\u0080-\uffff]*)
+    |(?P<punct>\?\.(?!\d)|"""
+    + "|".join(
+        re.escape(punctuator) for punctuator in PUNCTUATORS if punctuator != "?."
+    )
+    + r""")""",
+    re.VERBOSE,
+)
+REGEX_LITERAL = re.compile(r"/(?:\\.|\[(?:\\.|[^\]\\\n\r])*\]|[^/\\\[\n\r])+/[A-Za-z]*")
+# Text of a template literal up to the start of an expression or its end
+TEMPLATE_TEXT = re.compile(r"(?:\\[\s\S]|\$(?!\{)|[^`\\$])*(?:`|\$\{|\Z)")
+# Keywords after which a / starts a regex rather than a division
+REGEX_KEYWORDS = {
+    "return", "typeof", "case", "do", "else", "in", "instanceof", "new",
+    "delete", "void", "throw", "yield", "await", "of",
+}  # fmt: skip
+
+
+class JsToken(NamedTuple):
+    kind: str
+    text: str
+
+
+def tokenize_js(js: str) -> List[JsToken]:
+    """
+    Split JavaScript into tokens, whitespace and comments included, so that
+    joining the texts of the tokens gives back js.
+
+    A template literal is split into its text, up to and including '${' or
+    the closing backtick, and the tokens of its expressions. A '/' starts a
+    regex unless it follows something that ends an expression.
+    """
+    tokens: List[JsToken] = []
+    append = tokens.append
+    match_token = TOKEN_REGEX.match
+    # For every open '{', whether it started a template expression
+    braces: List[bool] = []
+    previous: Optional[JsToken] = None
+    pos = 0
+    length = len(js)
+    while pos < length:
+        char = js[pos]
+        if char == "`" or (char == "}" and braces and braces[-1]):
+            if char == "}":
+                braces.pop()
+            end = TEMPLATE_TEXT.match(js, pos + 1).end()
+            token = JsToken(TEMPLATE, js[pos:end])
+            if js.endswith("${", pos, end):
+                braces.append(True)
+        elif char == "/" and _regex_allowed(previous):
+            match = REGEX_LITERAL.match(js, pos)
+            if match is None:
+                token = JsToken(PUNCTUATOR, "/")
+            else:
+                token = JsToken(REGEX, match.group())
+        else:
+            match = match_token(js, pos)
+            if match is None:
+                token = JsToken(PUNCTUATOR, char)
+            else:
+                kind = match.lastgroup
+                token = JsToken(kind, match.group())
+                if kind in TRIVIA:
+                    append(token)
+                    pos = match.end()
+                    continue
+                if char == "{":
+                    braces.append(False)
+                elif char == "}" and braces:
+                    braces.pop()
+        append(token)
+        if token.kind not in TRIVIA:
+            previous = token
+        pos += len(token.text)
+    return tokens
+
+
+def _regex_allowed(previous: Optional[JsToken]) -> bool:
+    if previous is None:
+        return True
+    if previous.kind in (NUMBER, STRING, REGEX):
+        return False
+    if previous.kind == IDENTIFIER:
+        return previous.text in REGEX_KEYWORDS
+    if previous.kind == TEMPLATE:
+        return previous.text.endswith("${")
+    return previous.text not in (")", "]")
@@ -0,0 +1,367 @@
+"""
+Streaming lexer for Rogalang source.
+
+The transpiler only ever hands out JavaScript, so tools that need to know
+what the source consists of, like syntax highlighters and linters, would
+have to scan it again with regexes of their own. tokenize yields typed
+tokens with their line and column instead, in one pass over the source.
+
+The tokens are found exactly like the transpiler finds them: lines are
+classified with the same 'herliga london' and 'jille' rules, string and
+template literals with scan_rogalang and Rogalang tokens with the compiled
+regex of the same semantics, so every KEYWORD and OPERATOR is a token the
+transpiler replaces. Joining the texts of all tokens gives back the source.
+"""
+
+from __future__ import annotations
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import re
+
+from transpiler import (
+    EXPRESSION_EVENT_REGEX,
+    JILLE_PREFIX,
+    QUOTED_STRING_REGEX,
+    TEMPLATE_EVENT_REGEX,
+    ScanResult,
+    Semantics,
+    ValidationIssue,
+    find_carry_start,
+    get_semantics,
+    scan_rogalang,
+)
+
+# A 'herliga london' line, without its line break
+HERLIGA = "herliga"
+# The 'jille' prefix of a line, including the whitespace around it
+JILLE = "jille"
+# A line that is neither, which the transpiler drops
+COMMENT = "comment"
+# A Rogalang token the semantics replace with JavaScript made of words, or
+# with nothing at all
+KEYWORD = "keyword"
+# A Rogalang token the semantics replace with a JavaScript operator
+OPERATOR = "operator"
+IDENTIFIER = "identifier"
+NUMBER = "number"
+# A single or double quoted string literal
+STRING = "string"
+# The text of a template literal up to and including '${' or its closing
+# backtick, or from the '}' closing an expression on
+TEMPLATE = "template"
+# Delimiters and JavaScript operators written as they are
+PUNCTUATION = "punctuation"
+WHITESPACE = "whitespace"
+NEWLINE = "newline"
+# Any other character
+OTHER = "other"
+
+# JavaScript written as it is, between Rogalang tokens
+CODE_TOKEN_REGEX = re.compile(
+    r"""(?P<newline>\r?\n)
+    |(?P<whitespace>[^\S\r\n]+|\r)
+    |(?P<number>0[xXoObB][\da-fA-F_]+n?|\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?n?)
+    |(?P<identifier>(?:[^\W\d]|\$)[\w$]*)
+    |(?P<punctuation>[(){}\[\];,.?:]|[-+*/%=<>!&|^~]+)
+    |(?P<other>.)""",
+    re.VERBOSE,
+)
+LINE_BREAK_REGEX = re.compile(r"\r?\n")
+
+
+class Token(NamedTuple):
+    type: str
+    text: str
+    # 1-based line and 0-based column of the first character in the source
+    line: int
+    column: int
+
+
+# A token of preprocessed code: its type, text and offset in the code
+CodeToken = Tuple[str, str, int]
+
+
+def keyword_types(semantics: Semantics) -> Dict[str, str]:
+    """The token type of every Rogalang token in the semantics table"""
+    return {
+        token: OPERATOR if js and not re.search(r"\w", js) else KEYWORD
+        for token, js in semantics.table.items()
+    }
+
+
+def _code_tokens(
+    code: str, offset: int, semantics: Semantics, types: Dict[str, str]
+) -> Iterator[CodeToken]:
+    """Tokens of code that is outside of any literal, at offset in the chunk"""
+    pos = 0
+    for match in semantics.regex.finditer(code):
+        yield from _plain_tokens(code, pos, match.start(), offset)
+        token = match.group()
+        yield types[token], token, offset + match.start()
+        pos = match.end()
+    yield from _plain_tokens(code, pos, len(code), offset)
+
+
+def _plain_tokens(code: str, pos: int, end: int, offset: int) -> Iterator[CodeToken]:
+    match_token = CODE_TOKEN_REGEX.match
+    while pos < end:
+        match = match_token(code, pos, end)
+        yield match.lastgroup, match.group(), offset + pos
+        pos = match.end()
+
+
+def _template_tokens(
+    content: str, start: int, semantics: Semantics, types: Dict[str, str]
+) -> Iterator[CodeToken]:
+    """
+    Tokens of the closed template literal at start, following the rules of
+    scan_rogalang. Code in expressions is cut at nested literals, just like
+    the transpiler cuts it.
+    """
+    # None for an open template literal, the brace depth for an expression
+    stack: List[Optional[int]] = [None]
+    text_start = start
+    code_start = pos = start + 1
+    while stack:
+        if stack[-1] is None:
+            match = TEMPLATE_EVENT_REGEX.search(content, pos)
+            event = match.group()
+            pos = match.end()
+            if event == "`":
+                stack.pop()
+            elif event == "${":
+                stack.append(0)
+            else:
+                continue
+            yield TEMPLATE, content[text_start:pos], text_start
+            code_start = pos
+            continue
+
+        match = EXPRESSION_EVENT_REGEX.search(content, pos)
+        event = match.group()
+        begin = match.start()
+        if event == "{":
+            stack[-1] += 1
+            pos = match.end()
+            continue
+        if event == "}" and stack[-1]:
+            stack[-1] -= 1
+            pos = match.end()
+            continue
+        string = None
+        if event in "'\"":
+            string = QUOTED_STRING_REGEX.match(content, begin)
+            if string is None:
+                # A quote without a closing quote is just code
+                pos = begin + 1
+                continue
+
+        if begin > code_start:
+            yield from _code_tokens(
+                content[code_start:begin], code_start, semantics, types
+            )
+        if event == "}":
+            stack.pop()
+            text_start = begin
+            pos = match.end()
+        elif event == "`":
+            stack.append(None)
+            text_start = begin
+            pos = match.end()
+        else:
+            yield STRING, string.group(), begin
+            pos = code_start = string.end()
+
+
+def tokenize_code(
+    content: str,
+    semantics: Optional[Semantics] = None,
+    scan: Optional[ScanResult] = None,
+) -> Iterator[CodeToken]:
+    """
+    Tokenize preprocessed Rogalang code, as passed to transpile_rogalang.
+
+    Args:
+        content: The Rogalang code
+        semantics: Semantics to find Rogalang tokens with, defaults to the
+            semantics of the default dialect
+        scan: The result of scan_rogalang(content), if already known
+
+    Yields:
+        The type, text and offset in content of every token. Only TEMPLATE
+        tokens can contain a line break
+    """
+    if semantics is None:
+        semantics = get_semantics()
+    return _tokenize_code(content, semantics, keyword_types(semantics), scan)
+
+
+def _tokenize_code(
+    content: str,
+    semantics: Semantics,
+    types: Dict[str, str],
+    scan: Optional[ScanResult] = None,
+) -> Iterator[CodeToken]:
+    if scan is None:
+        scan = scan_rogalang(content)
+    for start, end, expressions in scan.items:
+        if expressions is None:
+            yield from _code_tokens(content[start:end], start, semantics, types)
+        elif content[start] == "`":
+            yield from _template_tokens(content, start, semantics, types)
+        else:
+            yield STRING, content[start:end], start
+
+
+def _split_lines(token: CodeToken) -> Iterator[CodeToken]:
+    """Split a token at its line breaks, which become NEWLINE tokens"""
+    type, text, offset = token
+    pos = 0
+    for match in LINE_BREAK_REGEX.finditer(text):
+        if match.start() > pos:
+            yield type, text[pos : match.start()], offset + pos
+        yield NEWLINE, match.group(), offset + match.start()
+        pos = match.end()
+    if pos < len(text):
+        yield type, text[pos:], offset + pos
+
+
+def _line_tokens(line: str, number: int, type: str) -> List[Token]:
+    """A line without code and its line break"""
+    text = line.rstrip("\r\n")
+    tokens = []
+    if text:
+        if not text.strip():
+            type = WHITESPACE
+        tokens.append(Token(type, text, number, 0))
+    if len(text) < len(line):
+        tokens.append(Token(NEWLINE, line[len(text) :], number, len(text)))
+    return tokens
+
+
+class _Line(NamedTuple):
+    number: int
+    # Tokens before the code of the line, all of the line if it has no code
+    prefix: List[Token]
+    # Offset of the code of the line in its chunk and its column in the line
+    offset: int
+    column: int
+
+
+def tokenize(
+    lines: Iterable[str],
+    semantics: Optional[Semantics] = None,
+    dialect: Optional[str] = None,
+) -> Iterator[Token]:
+    """
+    Tokenize Rogalang source with positions, without validating it.
+
+    Lines are tokenized as soon as they are read, except that the lines of
+    a template literal spanning several lines are held back until it is
+    closed. Whether a template literal is never closed, and so is code
+    after all, is only known at its end.
+
+    Args:
+        lines: Lines of the Rogalang source, e.g. an open file
+        semantics: Semantics to find Rogalang tokens with
+        dialect: Name of the dialect whose semantics to use if semantics is
+            not given, defaults to the default dialect
+
+    Yields:
+        Every token in source order. No token but a NEWLINE contains a line
+        break, so a template literal spanning lines is split into one
+        TEMPLATE token per line
+    """
+    if semantics is None:
+        semantics = get_semantics(dialect)
+    types = keyword_types(semantics)
+    # Lines held back, with the code of the jille lines among them
+    held: List[_Line] = []
+    code: List[str] = []
+    size = scanned = 0
+
+    def flush(scan: Optional[ScanResult] = None) -> Iterator[Token]:
+        nonlocal size, scanned
+        content = "".join(code)
+        if scan is None:
+            scan = scan_rogalang(content)
+        split = find_carry_start(content, semantics, scan)
+        if not split:
+            tokens = _tokenize_code(content, semantics, types, scan)
+        else:
+            # Like transpile_stream, tokenize the code before a template
+            # literal that is never closed apart from it
+            tokens = chain(
+                _tokenize_code(content[:split], semantics, types),
+                (
+                    (type, text, split + offset)
+                    for type, text, offset in _tokenize_code(
+                        content[split:], semantics, types
+                    )
+                ),
+            )
+        tokens = (
+            piece
+            for token in tokens
+            for piece in (_split_lines(token) if token[0] == TEMPLATE else (token,))
+        )
+        token = next(tokens, None)
+        for i, line in enumerate(held):
+            yield from line.prefix
+            end = held[i + 1].offset if i + 1 < len(held) else len(content)
+            while token is not None and token[2] < end:
+                type, text, offset = token
+                yield Token(type, text, line.number, line.column + offset - line.offset)
+                token = next(tokens, None)
+        held.clear()
+        code.clear()
+        size = scanned = 0
+
+    for number, line in enumerate(lines, 1):
+        if line.rstrip("\r\n") == "herliga london":
+            prefix = _line_tokens(line, number, HERLIGA)
+        else:
+            match = JILLE_PREFIX.match(line)
+            if match is None:
+                prefix = _line_tokens(line, number, COMMENT)
+            else:
+                prefix = _line_tokens(line[: match.end()], number, JILLE)
+                held.append(_Line(number, prefix, size, match.end()))
+                code.append(line[match.end() :])
+                size += len(line) - match.end()
+                # Scan again every time the held code doubles, so the cost
+                # stays linear in the size of a long template literal
+                if size < 2 * scanned or not code[-1].endswith("\n"):
+                    continue
+                scan = scan_rogalang("".join(code))
+                scanned = size
+                if scan.open_template is None:
+                    yield from flush(scan)
+                continue
+
+        if held:
+            held.append(_Line(number, prefix, size, 0))
+        else:
+            yield from prefix
+    if held:
+        yield from flush()
+
+
+def check_camel_case(tokens: Iterable[Token]) -> List[ValidationIssue]:
+    """
+    Find identifiers with underscores, which Rogalang forbids.
+
+    Args:
+        tokens: Tokens of a Rogalang source, see tokenize
+
+    Returns:
+        An issue for every identifier with an underscore
+    """
+    return [
+        ValidationIssue(
+            token.line,
+            f"Identifier '{token.text}' at column {token.column} is not camelCase",
+        )
+        for token in tokens
+        if token.type == IDENTIFIER and "_" in token.text
+    ]
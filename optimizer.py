@@ -0,0 +1,569 @@
+"""
+Optional optimizing pass over transpiled JavaScript.
+
+The transpiler maps every Rogalang token to JavaScript one for one, so
+constant expressions and long generated if-ladders end up in the output
+as they were written. optimize folds the first and turns the second into
+switch statements. Both rewrites only apply where the result provably
+behaves the same, anything the pass is unsure about is left untouched:
+
+- Constant arithmetic (+ - * / % **) on decimal number literals and +
+  on string literals with the same quotes is folded, but only where
+  nothing next to the expression binds more tightly than it does.
+- Three or more 'if (x === C) {...}' on the same variable, chained by
+  'else' or following each other with a body that always returns or
+  throws, become 'switch (x) { case C: {...} }'. Only strict equality is
+  compacted, as switch compares with ===, while == converts its operands.
+
+The JavaScript is only tokenized, never parsed, and line breaks are kept,
+so the output still lines up with the input line for line.
+"""
+
+from __future__ import annotations
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+import math
+import re
+
+from jstokens import (
+    COMMENT,
+    IDENTIFIER,
+    NEWLINE,
+    NUMBER,
+    PUNCTUATOR,
+    REGEX_KEYWORDS,
+    STRING,
+    TEMPLATE,
+    TRIVIA,
+    WHITESPACE,
+    JsToken,
+    tokenize_js,
+)
+
+# Fewest branches worth turning into a switch
+MIN_SWITCH_CASES = 3
+
+KEYWORDS = REGEX_KEYWORDS | {
+    "break", "catch", "class", "const", "continue", "debugger", "default",
+    "export", "extends", "false", "finally", "for", "function", "if", "import",
+    "let", "null", "super", "switch", "this", "true", "try", "var", "while",
+    "with",
+}  # fmt: skip
+
+
+####################
+# Constant folding #
+####################
+
+# Binary operators that are folded, by precedence
+ARITHMETIC_PRECEDENCE = {"**": 3, "*": 2, "/": 2, "%": 2, "+": 1, "-": 1}
+# Operators binding less tightly than any arithmetic, plus the punctuation
+# that ends an expression, so folding next to them keeps the meaning
+LOOSER = {
+    "=", "+=", "-=", "*=", "/=", "%=", "**=", "<<=", ">>=", ">>>=", "&=",
+    "|=", "^=", "&&=", "||=", "??=", "=>", "?", ":", "==", "!=", "===",
+    "!==", "<", ">", "<=", ">=", "&&", "||", "??", "&", "|", "^", "<<",
+    ">>", ">>>", ",", ";",
+}  # fmt: skip
+BEFORE_CONSTANT = LOOSER | {"(", "[", "{"}
+AFTER_CONSTANT = LOOSER | {")", "]", "}"}
+# Keywords starting an expression that nothing binds to from the left
+BEFORE_CONSTANT_KEYWORDS = {"return", "case", "throw", "yield"}
+DECIMAL_NUMBER = re.compile(
+    r"(?:0|[1-9]\d*)(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?"
+)
+# Integers up to here are exact doubles
+MAX_SAFE_INTEGER = 2**53
+
+# A folded number, or a string literal as its quote and raw contents
+Constant = Union[float, Tuple[str, str]]
+
+
+class _Folder:
+    """Folds the constant expressions in the tokens of one piece of code"""
+
+    def __init__(self, tokens: List[JsToken]):
+        self.tokens = tokens
+        # Indices of the tokens that are not trivia
+        self.significant = [
+            i for i, token in enumerate(tokens) if token.kind not in TRIVIA
+        ]
+        self.pos = 0
+        self.operators = 0
+
+    def _token(self, k: int) -> Optional[JsToken]:
+        if k >= len(self.significant):
+            return None
+        return self.tokens[self.significant[k]]
+
+    def _newline_before(self, k: int) -> bool:
+        """Whether a line break comes before the k-th significant token"""
+        if k >= len(self.significant):
+            return False
+        start = self.significant[k - 1] + 1 if k else 0
+        return any(
+            token.kind == NEWLINE
+            or token.kind == COMMENT
+            and ("\n" in token.text or "\r" in token.text)
+            for token in self.tokens[start : self.significant[k]]
+        )
+
+    def _peek(self) -> Optional[JsToken]:
+        """The next token of the expression, None at its end or a line break"""
+        if self._newline_before(self.pos):
+            return None
+        return self._token(self.pos)
+
+    def fold(self) -> List[JsToken]:
+        tokens = self.tokens
+        output: List[JsToken] = []
+        copied = 0
+        k = 0
+        while k < len(self.significant):
+            folded = self._fold_at(k)
+            if folded is None:
+                k += 1
+                continue
+            text, end = folded
+            start = self.significant[k]
+            output.extend(tokens[copied:start])
+            if start and tokens[start - 1].kind in (IDENTIFIER, NUMBER):
+                # return(1 + 2) must not become return3
+                output.append(JsToken(WHITESPACE, " "))
+            output.append(JsToken(STRING if text[-1] in "'\"" else NUMBER, text))
+            copied = self.significant[end - 1] + 1
+            k = end
+        output.extend(tokens[copied:])
+        return output
+
+    def _fold_at(self, k: int) -> Optional[Tuple[str, int]]:
+        """The folded text of the expression at k and the index after it"""
+        if not self._can_start(k):
+            return None
+        self.pos = k
+        self.operators = 0
+        value = self._expression(0, top=True)
+        if value is None or not self.operators:
+            return None
+        end = self.pos
+        after = self._token(end)
+        if after is not None:
+            if self._newline_before(end):
+                # A token on the next line that continues the expression
+                if after.kind == PUNCTUATOR and after.text not in AFTER_CONSTANT:
+                    return None
+                if after.kind == TEMPLATE and not after.text.startswith("}"):
+                    return None
+            elif after.kind == TEMPLATE:
+                if not after.text.startswith("}"):
+                    return None
+            elif after.kind != PUNCTUATOR or not (
+                after.text in AFTER_CONSTANT or after.text in ARITHMETIC_PRECEDENCE
+            ):
+                return None
+        text = _format_constant(value)
+        if text is None or (text.startswith("-") and after and after.text == "**"):
+            return None
+        return text, end
+
+    def _can_start(self, k: int) -> bool:
+        token = self._token(k)
+        if token.kind not in (NUMBER, STRING) and token.text not in ("(", "-"):
+            return False
+        if k == 0:
+            return True
+        before = self._token(k - 1)
+        if before.kind == PUNCTUATOR:
+            return before.text in BEFORE_CONSTANT
+        if before.kind == TEMPLATE:
+            return before.text.endswith("${")
+        return before.kind == IDENTIFIER and before.text in BEFORE_CONSTANT_KEYWORDS
+
+    def _expression(self, min_precedence: int, top: bool = False) -> Optional[Constant]:
+        left = self._unary()
+        if left is None:
+            return None
+        while True:
+            token = self._peek()
+            if token is None or token.kind != PUNCTUATOR:
+                return left
+            precedence = ARITHMETIC_PRECEDENCE.get(token.text)
+            if precedence is None or precedence < min_precedence:
+                return left
+            operator_pos = self.pos
+            operators = self.operators
+            self.pos += 1
+            # ** is right-associative, the rest are left-associative
+            right = self._expression(
+                precedence if token.text == "**" else precedence + 1
+            )
+            value = None if right is None else _apply(token.text, left, right)
+            if value is None:
+                if not top:
+                    return None
+                # Everything so far is the left operand of this operator
+                self.pos = operator_pos
+                self.operators = operators
+                return left
+            left = value
+            self.operators += 1
+
+    def _unary(self) -> Optional[Constant]:
+        token = self._peek()
+        if token is None:
+            return None
+        if token.text == "-" and token.kind == PUNCTUATOR:
+            self.pos += 1
+            operand = self._unary()
+            next_token = self._peek()
+            if not isinstance(operand, float) or (
+                next_token is not None and next_token.text == "**"
+            ):
+                # -2 ** 2 is a syntax error
+                return None
+            return -operand
+        if token.text == "(" and token.kind == PUNCTUATOR:
+            self.pos += 1
+            value = self._expression(0)
+            closing = self._peek()
+            if value is None or closing is None or closing.text != ")":
+                return None
+            self.pos += 1
+            return value
+        if token.kind == NUMBER and DECIMAL_NUMBER.fullmatch(token.text):
+            self.pos += 1
+            return float(token.text)
+        if (
+            token.kind == STRING
+            and len(token.text) >= 2
+            and token.text[-1] == token.text[0]
+        ):
+            self.pos += 1
+            return (token.text[0], token.text[1:-1])
+        return None
+
+
+def _apply(operator: str, left: Constant, right: Constant) -> Optional[Constant]:
+    """Evaluate a binary operator like JavaScript, None if unsure"""
+    if isinstance(left, tuple) or isinstance(right, tuple):
+        # Only string + string, numbers would have to be formatted like JS.
+        # Escapes are kept apart, joined '\1' + '2' would read as '\12'
+        if (
+            operator == "+"
+            and isinstance(left, tuple)
+            and isinstance(right, tuple)
+            and left[0] == right[0]
+            and "\\" not in left[1]
+            and "\\" not in right[1]
+        ):
+            return (left[0], left[1] + right[1])
+        return None
+    try:
+        if operator == "+":
+            value = left + right
+        elif operator == "-":
+            value = left - right
+        elif operator == "*":
+            value = left * right
+        elif operator == "/":
+            value = left / right
+        elif operator == "%":
+            value = math.fmod(left, right)
+        else:
+            # pow of the C library and of JavaScript may differ in the last
+            # bit, but agree on exact integer powers
+            if not (left.is_integer() and right.is_integer() and right >= 0):
+                return None
+            value = float(int(left) ** int(right))
+            if abs(value) >= MAX_SAFE_INTEGER:
+                return None
+    except (ArithmeticError, ValueError):
+        return None
+    if math.isinf(value) or math.isnan(value):
+        return None
+    return value
+
+
+def _format_constant(value: Constant) -> Optional[str]:
+    if isinstance(value, tuple):
+        quote, contents = value
+        return quote + contents + quote
+    if value == 0 and math.copysign(1.0, value) < 0:
+        return "-0"
+    if value.is_integer() and abs(value) < MAX_SAFE_INTEGER:
+        return str(int(value))
+    # The shortest repr that round-trips is a valid JavaScript literal too
+    return repr(value)
+
+
+def fold_constants(js: str) -> str:
+    """
+    Fold constant arithmetic and string concatenation in JavaScript.
+
+    Args:
+        js: The JavaScript code, e.g. the output of the transpiler
+
+    Returns:
+        The code with every constant expression it could prove safe to
+        fold replaced by its value
+    """
+    return "".join(token.text for token in _Folder(tokenize_js(js)).fold())
+
+
+###########################
+# Branch chain compaction #
+###########################
+
+
+class _Branch(NamedTuple):
+    # Significant token indices of the 'if' and the braces of the body
+    start: int
+    body_start: int
+    body_end: int
+    constant: str
+
+
+class _Ladder(NamedTuple):
+    variable: str
+    branches: List[_Branch]
+    # Significant token indices of the 'else' before every later branch,
+    # None where the branches follow each other
+    elses: List[Optional[int]]
+    # Significant token indices of the 'else' and body of the default
+    default: Optional[Tuple[int, int, int]]
+
+
+class _Compactor:
+    """Turns if-ladders in the tokens of one piece of code into switches"""
+
+    def __init__(self, tokens: List[JsToken]):
+        self.tokens = tokens
+        self.significant = [
+            i for i, token in enumerate(tokens) if token.kind not in TRIVIA
+        ]
+        self.matching = self._match_brackets()
+
+    def _token(self, k: int) -> Optional[JsToken]:
+        if 0 <= k < len(self.significant):
+            return self.tokens[self.significant[k]]
+        return None
+
+    def _text(self, k: int) -> Optional[str]:
+        token = self._token(k)
+        return None if token is None else token.text
+
+    def _match_brackets(self) -> Dict[int, int]:
+        """The significant index of the closing bracket of every opening one"""
+        matching = {}
+        stack: List[int] = []
+        pairs = {")": "(", "]": "[", "}": "{"}
+        for k in range(len(self.significant)):
+            token = self._token(k)
+            if token.kind != PUNCTUATOR:
+                continue
+            if token.text in "([{":
+                stack.append(k)
+            elif token.text in pairs:
+                if not stack or self._text(stack[-1]) != pairs[token.text]:
+                    # Unbalanced code, leave it as it is
+                    return {}
+                matching[stack.pop()] = k
+        return matching
+
+    def _branch(self, k: int, variable: Optional[str]) -> Optional[_Branch]:
+        """The branch 'if (x === C) {' starting at k, on variable if given"""
+        if self._text(k) != "if" or self._text(k + 1) != "(":
+            return None
+        close = self.matching.get(k + 1)
+        if close != k + 5 or self._text(k + 3) != "===":
+            return None
+        left, right = self._token(k + 2), self._token(k + 4)
+        if left.kind == IDENTIFIER and right.kind in (NUMBER, STRING):
+            name, constant = left, right
+        elif right.kind == IDENTIFIER and left.kind in (NUMBER, STRING):
+            name, constant = right, left
+        else:
+            return None
+        if name.text in KEYWORDS or variable not in (None, name.text):
+            return None
+        if constant.kind == STRING and constant.text[-1:] != constant.text[0]:
+            return None
+        body_start = close + 1
+        body_end = self._body_end(body_start)
+        if body_end is None:
+            return None
+        return _Branch(k, body_start, body_end, constant.text)
+
+    def _body_end(self, k: int) -> Optional[int]:
+        """The end of the block at k, None if it could break out of a switch"""
+        if self._text(k) != "{" or k not in self.matching:
+            return None
+        end = self.matching[k]
+        for i in range(k + 1, end):
+            if self._text(i) == "break":
+                return None
+        return end
+
+    def _always_exits(self, branch: _Branch) -> bool:
+        """Whether the body of branch always returns or throws"""
+        depth = 0
+        for k in range(branch.body_start + 1, branch.body_end):
+            text = self._text(k)
+            if text in ("(", "[", "{"):
+                depth += 1
+            elif text in (")", "]", "}"):
+                depth -= 1
+            elif depth == 0 and text in ("return", "throw"):
+                before = self._text(k - 1)
+                # Not the body of an if, else, loop or do without braces
+                if before in ("{", ";", "}"):
+                    return True
+        return False
+
+    def _ladder(self, k: int) -> Optional[_Ladder]:
+        """The if-ladder starting at k, if it is long enough to compact"""
+        if self.tokens[self.significant[k]].text != "if":
+            return None
+        before = self._token(k - 1)
+        if before is not None and before.text in (")", "else", "do"):
+            return None
+        first = self._branch(k, None)
+        if first is None:
+            return None
+        variable = (
+            self._text(k + 2)
+            if self._token(k + 2).kind == IDENTIFIER
+            else self._text(k + 4)
+        )
+        branches = [first]
+        elses: List[Optional[int]] = []
+        default = None
+        # Whether every branch of the current if statement returns or throws
+        exits = self._always_exits(first)
+        while True:
+            last = branches[-1]
+            after = last.body_end + 1
+            if self._text(after) == "else":
+                branch = self._branch(after + 1, variable)
+                if branch is not None:
+                    branches.append(branch)
+                    elses.append(after)
+                    exits = exits and self._always_exits(branch)
+                    continue
+                if self._text(after + 1) == "{":
+                    body_end = self._body_end(after + 1)
+                    if body_end is None:
+                        return None
+                    default = (after, after + 1, body_end)
+                    break
+                # An 'else if' on something else, which a switch cannot hold
+                return None
+            # The next if statement only runs if no branch so far matched
+            branch = self._branch(after, variable)
+            if branch is None or not exits:
+                break
+            branches.append(branch)
+            elses.append(None)
+            exits = self._always_exits(branch)
+        if len(branches) < MIN_SWITCH_CASES:
+            return None
+        return _Ladder(variable, branches, elses, default)
+
+    def compact(self) -> str:
+        """The code with every ladder turned into a switch"""
+        tokens = self.tokens
+        significant = self.significant
+        # Texts replacing, and added after, tokens by their index in tokens
+        replaced: Dict[int, str] = {}
+        appended: Dict[int, str] = {}
+        # Branches after the first of a compacted ladder
+        consumed = set()
+        k = 0
+        while k < len(significant):
+            ladder = None if k in consumed else self._ladder(k)
+            if ladder is None:
+                k += 1
+                continue
+            consumed.update(branch.start for branch in ladder.branches)
+            for i, branch in enumerate(ladder.branches):
+                case = f"case {branch.constant}:"
+                if i == 0:
+                    case = f"switch ({ladder.variable}) {{ {case}"
+                else_k = ladder.elses[i - 1] if i else None
+                if else_k is not None and not self._always_exits(
+                    ladder.branches[i - 1]
+                ):
+                    replaced[significant[else_k]] = "break;"
+                elif else_k is not None:
+                    replaced[significant[else_k]] = ""
+                    _drop_space_after(tokens, significant[else_k], replaced)
+                # 'if', '(', variable, '===', constant and ')'
+                replaced[significant[branch.start]] = case
+                for j in range(branch.start + 1, branch.start + 6):
+                    replaced[significant[j]] = ""
+                _drop_space_between(
+                    tokens,
+                    significant[branch.start],
+                    significant[branch.start + 5],
+                    replaced,
+                )
+            if ladder.default is None:
+                end = ladder.branches[-1].body_end
+            else:
+                else_k, _, end = ladder.default
+                last = ladder.branches[-1]
+                replaced[significant[else_k]] = (
+                    "default:" if self._always_exits(last) else "break; default:"
+                )
+            appended[significant[end]] = " }"
+            # Ladders nested in the bodies are compacted too
+            k = ladder.branches[0].body_start
+        if not replaced:
+            return "".join(token.text for token in tokens)
+        output = []
+        for i, token in enumerate(tokens):
+            output.append(replaced.get(i, token.text))
+            if i in appended:
+                output.append(appended[i])
+        return "".join(output)
+
+
+def _drop_space_after(tokens: List[JsToken], i: int, replaced: Dict[int, str]) -> None:
+    if i + 1 < len(tokens) and tokens[i + 1].kind == WHITESPACE:
+        replaced[i + 1] = ""
+
+
+def _drop_space_between(
+    tokens: List[JsToken], start: int, end: int, replaced: Dict[int, str]
+) -> None:
+    """Remove the whitespace inside a condition being replaced"""
+    for i in range(start + 1, end):
+        if tokens[i].kind == WHITESPACE:
+            replaced[i] = ""
+
+
+def compact_branch_chains(js: str) -> str:
+    """
+    Turn if-ladders comparing one variable with === into switch statements.
+
+    Args:
+        js: The JavaScript code, e.g. the output of the transpiler
+
+    Returns:
+        The code with every ladder of at least MIN_SWITCH_CASES branches that
+        could safely be compacted turned into a switch
+    """
+    return _Compactor(tokenize_js(js)).compact()
+
+
+def optimize(js: str) -> str:
+    """
+    Fold constants, then compact if-ladders, in transpiled JavaScript.
+
+    Args:
+        js: The whole transpiled JavaScript of a file, optimizing it in
+            parts could fold across the cut
+
+    Returns:
+        Smaller JavaScript behaving the same
+    """
+    return _Compactor(_Folder(tokenize_js(js)).fold()).compact()
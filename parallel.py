@@ -0,0 +1,229 @@
+"""
+Parallel transpilation of a single large Rogalang file.
+
+The source is validated and cut into chunks of whole 'herliga london'
+segments, which are transpiled across a pool of worker processes and
+written back in order. A template literal can span segments, so every
+worker also reports a template that is still open at the end of its chunk.
+The chunk after such a split point started inside that literal, so it is
+transpiled again together with the carried over literal before it is used.
+"""
+
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from time import perf_counter
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+import os
+
+from transpiler import (
+    DEFAULT_TRANSPILER,
+    Semantics,
+    TemplateCarry,
+    Transpiler,
+    TranspileMemo,
+    TranspileStats,
+    find_carry_start,
+    iter_rogalang_segments,
+    write_output,
+)
+
+# Characters of preprocessed code per chunk, large enough that sending a
+# chunk to a worker costs little compared to transpiling it
+DEFAULT_CHUNK_SIZE = 1 << 20
+# Chunks per worker that may be queued before reading more of the source
+MAX_PENDING_PER_WORKER = 2
+
+# Transpiler of the current worker process
+_transpiler = DEFAULT_TRANSPILER
+# Whether the current worker process minifies its output
+_minify = False
+
+
+def _init_worker(semantics: Semantics, memo: bool, minify: bool = False) -> None:
+    global _transpiler, _minify
+    _transpiler = Transpiler(semantics, TranspileMemo() if memo else None)
+    _minify = minify
+
+
+def _transpile_chunk(
+    content: str, profile: bool
+) -> Tuple[str, str, Optional[TranspileStats]]:
+    """
+    Transpile a chunk, up to a template literal that is still open at its end.
+
+    Returns:
+        The transpiled JavaScript, the open template literal to carry over
+        and the profile of the chunk if profiling
+    """
+    stats = TranspileStats() if profile else None
+    start = perf_counter()
+    split = find_carry_start(content, _transpiler.semantics)
+    if stats is not None:
+        stats.add_time("find_open_template", perf_counter() - start)
+    if split is None:
+        pending = ""
+    else:
+        content, pending = content[:split], content[split:]
+    output = _transpiler.transpile(content, stats, minify=_minify) if content else ""
+    return output, pending, stats
+
+
+def iter_chunks(
+    source: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[str]:
+    """
+    Validate and preprocess Rogalang source, joining whole segments into
+    chunks of at least chunk_size characters (except for the last one).
+
+    Args:
+        source: Lines of the Rogalang source, e.g. an open file
+        chunk_size: Characters of preprocessed code per chunk
+
+    Yields:
+        The preprocessed code of consecutive segments
+
+    Raises:
+        ValueError: If validation fails
+    """
+    chunk: List[str] = []
+    size = 0
+    for segment in iter_rogalang_segments(source):
+        chunk.extend(segment)
+        size += sum(map(len, segment))
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield "".join(chunk)
+
+
+class ParallelTranspiler:
+    """
+    Transpiles one Rogalang file across several processes.
+
+    Validation and splitting run in the calling process while the workers
+    transpile, so the speedup grows with the number of workers until the
+    calling process can no longer validate the source fast enough.
+    """
+
+    def __init__(
+        self,
+        transpiler: Optional[Transpiler] = None,
+        jobs: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        minify: bool = False,
+    ):
+        """
+        Args:
+            transpiler: Transpiler to use, defaults to the default semantics.
+                Every worker gets its own memo if the transpiler has one
+            jobs: Number of worker processes, defaults to the number of CPUs
+            chunk_size: Characters of preprocessed code per chunk
+            minify: Whether to drop the whitespace and comments the
+                JavaScript does not need, see Transpiler.transpile
+        """
+        self.transpiler = transpiler or DEFAULT_TRANSPILER
+        self.jobs = jobs or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.minify = minify
+
+    def transpile_stream(
+        self, source: Iterable[str], stats: Optional[TranspileStats] = None
+    ) -> Iterator[str]:
+        """
+        Validate and transpile Rogalang source in parallel.
+
+        Args:
+            source: Lines of the Rogalang source, e.g. an open file
+            stats: Profile to record the transpilation in, including the
+                work done by the workers
+
+        Yields:
+            Transpiled JavaScript, one chunk at a time and in order
+
+        Raises:
+            ValueError: If validation fails
+        """
+        if self.jobs == 1:
+            yield from self.transpiler.transpile_stream(
+                source, stats, minify=self.minify
+            )
+            return
+
+        chunks = iter_chunks(source, self.chunk_size)
+        if stats is not None:
+            chunks = stats.timed(chunks, "validate")
+        pool = ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=_init_worker,
+            initargs=(
+                self.transpiler.semantics,
+                self.transpiler.memo is not None,
+                self.minify,
+            ),
+        )
+        in_flight: Deque[Tuple[str, Future]] = deque()
+        carry = TemplateCarry(self.transpiler.semantics)
+        try:
+            for chunk in chunks:
+                future = pool.submit(_transpile_chunk, chunk, stats is not None)
+                in_flight.append((chunk, future))
+                if len(in_flight) >= self.jobs * MAX_PENDING_PER_WORKER:
+                    output = self._stitch(*in_flight.popleft(), carry, stats)
+                    if output:
+                        yield output
+            while in_flight:
+                output = self._stitch(*in_flight.popleft(), carry, stats)
+                if output:
+                    yield output
+            pending = carry.finish()
+            if pending:
+                yield self.transpiler.transpile(pending, stats, minify=self.minify)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _stitch(
+        self,
+        chunk: str,
+        future: Future,
+        carry: TemplateCarry,
+        stats: Optional[TranspileStats],
+    ) -> str:
+        """
+        Take the output of a chunk, transpiling it again if the chunks
+        before it left a template literal open.
+
+        Returns:
+            The transpiled JavaScript, the template literal still open is
+            left in carry
+        """
+        output, chunk_pending, chunk_stats = future.result()
+        if not carry:
+            if stats is not None:
+                stats.merge(chunk_stats)
+            carry.hold(chunk_pending)
+            return output
+
+        # The chunk started inside the literal, so its output is of no use
+        content = carry.feed(chunk)
+        if not content:
+            return ""
+        return self.transpiler.transpile(content, stats, minify=self.minify)
+
+    def transpile_file(
+        self,
+        source_path: str,
+        output_path: str,
+        stats: Optional[TranspileStats] = None,
+    ) -> None:
+        """
+        Validate and transpile a Rogalang file into a JavaScript file in
+        parallel. See Transpiler.transpile_file.
+
+        Raises:
+            ValueError: If validation fails
+        """
+        with open(source_path, "r", encoding="utf-8") as source:
+            write_output(output_path, self.transpile_stream(source, stats), stats)
@@ -0,0 +1,287 @@
+"""
+Long-running transpile server for editor plugins and dev servers.
+
+Keeps the compiled semantics loaded and answers newline-delimited JSON
+requests over stdin/stdout or a Unix socket. Every line is one request:
+
+    {"id": 1, "source": "herliga london\\njille sei('hei')\\n"}
+    {"id": 2, "code": "sei('hei')", "dialect": "bergensk"}
+    {"id": 3, "command": "stats"}
+
+'source' is a whole Rogalang file that is validated before transpiling,
+'code' is already preprocessed Rogalang code. 'dialect' picks one of the
+dialects registered in transpiler.DIALECTS. Every response is one line
+with the id of its request, and responses are written as soon as they are
+ready, so they can arrive out of order:
+
+    {"id": 1, "ok": true, "js": "console.log('hei')\\n"}
+    {"id": 4, "ok": false, "error": "No 'herliga london' found in source file"}
+    {"id": 3, "ok": true, "requests": 2, "errors": 0, "latency_ms": {...}}
+"""
+
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from typing import IO, Any, Deque, Dict, Optional, Set
+import io
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+
+from transpiler import DIALECTS, Transpiler, TranspileMemo, TranspileStats
+
+# Number of most recent requests the latency percentiles are computed over
+LATENCY_WINDOW = 10_000
+# Requests that may be queued per worker before reading more input
+MAX_PENDING_PER_WORKER = 4
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = max(
+        0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+class TranspileServer:
+    """
+    Answers transpile requests with one warm Transpiler.
+
+    Requests are handled concurrently in a thread pool that is shared by all
+    connections, which is safe since every transpilation has its own state.
+    """
+
+    def __init__(
+        self,
+        transpiler: Optional[Transpiler] = None,
+        max_workers: Optional[int] = None,
+        reload_interval: Optional[float] = None,
+    ):
+        """
+        Args:
+            transpiler: Transpiler to use, defaults to the default semantics
+                with a memo, as editors send the same lines over and over
+            max_workers: Number of threads handling requests
+            reload_interval: Seconds between checks for changed semantics
+                CSVs of the dialects, which are reloaded without pausing
+                requests. Not checked by default
+        """
+        self.transpiler = transpiler or Transpiler(memo=TranspileMemo())
+        # Load the semantics now instead of on the first request
+        self.transpiler.semantics
+        for dialect in DIALECTS.names():
+            DIALECTS.get(dialect)
+        self.reload_interval = reload_interval
+        if reload_interval:
+            DIALECTS.watch(reload_interval)
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+
+    def close(self) -> None:
+        if self.reload_interval:
+            DIALECTS.stop()
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Request counts, latency percentiles in milliseconds and memo usage"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            requests, errors = self.requests, self.errors
+        stats = {
+            "requests": requests,
+            "errors": errors,
+            "latency_ms": {
+                "p50": percentile(latencies, 0.5) * 1000,
+                "p99": percentile(latencies, 0.99) * 1000,
+                "max": (latencies[-1] if latencies else 0.0) * 1000,
+            },
+        }
+        if self.transpiler.memo is not None:
+            stats["memo"] = self.transpiler.memo.stats()
+        if DIALECTS.errors:
+            # Dialects whose reload failed, they keep their old semantics
+            stats["dialect_errors"] = {
+                name: str(error) for name, error in DIALECTS.errors.items()
+            }
+        return stats
+
+    def handle(self, request: Any) -> Dict[str, Any]:
+        """
+        Answer a single decoded request.
+
+        Returns:
+            The response, without the id of the request
+        """
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "Request must be a JSON object"}
+        if request.get("command") == "stats":
+            return {"ok": True, **self.stats()}
+        if "command" in request:
+            return {"ok": False, "error": f"Unknown command: {request['command']!r}"}
+
+        dialect = request.get("dialect")
+        if dialect is not None and not isinstance(dialect, str):
+            return {"ok": False, "error": "'dialect' must be a string"}
+        stats = TranspileStats() if request.get("profile") else None
+        try:
+            if isinstance(request.get("source"), str):
+                lines = request["source"].splitlines(keepends=True)
+                js = "".join(
+                    self.transpiler.transpile_stream(lines, stats, dialect=dialect)
+                )
+            elif isinstance(request.get("code"), str):
+                js = self.transpiler.transpile(request["code"], stats, dialect)
+            else:
+                return {"ok": False, "error": "Request needs a 'source' or 'code'"}
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+
+        response = {"ok": True, "js": js}
+        if stats is not None:
+            response["profile"] = stats.as_dict()
+        return response
+
+    def handle_line(self, line: str, received: Optional[float] = None) -> str:
+        """
+        Answer one line of NDJSON, recording its latency.
+
+        Args:
+            line: The JSON encoded request
+            received: perf_counter() when the request arrived, defaults to now
+
+        Returns:
+            The JSON encoded response, without a trailing newline
+        """
+        received = perf_counter() if received is None else received
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            request = None
+            response = {"ok": False, "error": f"Invalid JSON: {e}"}
+        else:
+            try:
+                response = self.handle(request)
+            except Exception as e:
+                # Every request is answered, whatever went wrong with it
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+        request_id = request.get("id") if isinstance(request, dict) else None
+        encoded = json.dumps({"id": request_id, **response})
+        with self._lock:
+            self.requests += 1
+            if not response["ok"]:
+                self.errors += 1
+            self._latencies.append(perf_counter() - received)
+        return encoded
+
+    def serve_stream(self, input: IO[str], output: IO[str]) -> None:
+        """
+        Answer the requests read from input until it ends.
+
+        Responses are written by a thread of the connection's own, so a slow
+        client does not hold up the workers shared with other connections.
+        At most MAX_PENDING_PER_WORKER requests per worker are read ahead, or
+        waiting to be written, so a fast client cannot queue an unbounded
+        amount of work.
+        """
+        slots = threading.BoundedSemaphore(self.max_workers * MAX_PENDING_PER_WORKER)
+        # Finished requests in the order they finished, and None once input
+        # ended, after which the writer still answers the rest of them
+        finished: "queue.SimpleQueue[Optional[Future]]" = queue.SimpleQueue()
+        submitted = 0
+
+        def write() -> None:
+            written = 0
+            ended = False
+            while not ended or written < submitted:
+                future = finished.get()
+                if future is None:
+                    ended = True
+                    continue
+                try:
+                    output.write(future.result() + "\n")
+                    output.flush()
+                except (OSError, ValueError):
+                    # The client went away, there is nobody left to answer
+                    pass
+                finally:
+                    written += 1
+                    slots.release()
+
+        writer = threading.Thread(target=write, name="rogalang-writer", daemon=True)
+        writer.start()
+        try:
+            for line in input:
+                if not line.strip():
+                    continue
+                received = perf_counter()
+                slots.acquire()
+                future = self._executor.submit(self.handle_line, line, received)
+                submitted += 1
+                # Only hands the response over, the writer does the writing
+                future.add_done_callback(finished.put)
+        finally:
+            finished.put(None)
+            writer.join()
+
+    def serve_unix(self, path: str) -> None:
+        """
+        Answer requests on a Unix socket at path until interrupted.
+
+        A socket left at path by an earlier server that is gone is replaced.
+
+        Raises:
+            FileExistsError: If something other than a socket is at path, or
+                a server is still listening on it
+        """
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server.serve_stream(
+                    io.TextIOWrapper(self.rfile, encoding="utf-8"),
+                    io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True),
+                )
+
+        _remove_stale_socket(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+            unix_server.daemon_threads = True
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.unlink(path)
+
+
+def _remove_stale_socket(path: str) -> None:
+    """
+    Remove a socket at path that no server listens on any more.
+
+    Raises:
+        FileExistsError: If something other than a socket is at path, or a
+            server answers on it
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+        else:
+            raise FileExistsError(f"A server is already listening on {path}")
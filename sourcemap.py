@@ -0,0 +1,220 @@
+"""
+Source Map v3 generation for transpiled Rogalang.
+
+The transpiler shifts lines and columns in three ways: 'jille' prefixes are
+stripped, lines without one are dropped, and tokens are replaced by
+JavaScript of a different length. Instead of comparing the output with the
+source afterwards, the transpiler tells a SourceMapBuilder where every line
+of preprocessed code came from and which tokens it replaced, as it does so.
+"""
+
+from __future__ import annotations
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import base64
+import json
+
+# A replaced token: its offset in the transpiled content, its length and
+# the JavaScript it was replaced with
+Edit = Tuple[int, int, str]
+
+# Where transpile_file puts the source map: in a data URL at the end of the
+# JavaScript, or in a .js.map file next to it
+SOURCE_MAP_KINDS = ("inline", "file")
+
+BASE64_DIGITS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+VLQ_SHIFT = 5
+VLQ_CONTINUATION = 1 << VLQ_SHIFT
+VLQ_MASK = VLQ_CONTINUATION - 1
+
+
+def encode_vlq(value: int) -> str:
+    """Encode an integer as a Base64 VLQ, as used in source map mappings"""
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    digits = []
+    while True:
+        digit = value & VLQ_MASK
+        value >>= VLQ_SHIFT
+        if value:
+            digit |= VLQ_CONTINUATION
+        digits.append(BASE64_DIGITS[digit])
+        if not value:
+            return "".join(digits)
+
+
+def decode_mappings(mappings: str) -> List[List[Tuple[int, ...]]]:
+    """
+    Decode the mappings of a source map.
+
+    Args:
+        mappings: The 'mappings' field of a source map
+
+    Returns:
+        For every generated line, its segments with absolute values of
+        (generated column, source, original line, original column)
+    """
+    lines: List[List[Tuple[int, ...]]] = []
+    state = [0, 0, 0, 0]
+    for line in mappings.split(";"):
+        state[0] = 0
+        segments = []
+        for segment in filter(None, line.split(",")):
+            fields = []
+            value = shift = 0
+            for char in segment:
+                digit = BASE64_DIGITS.index(char)
+                value += (digit & VLQ_MASK) << shift
+                if digit & VLQ_CONTINUATION:
+                    shift += VLQ_SHIFT
+                    continue
+                fields.append(-(value >> 1) if value & 1 else value >> 1)
+                value = shift = 0
+            for i, field in enumerate(fields):
+                state[i] += field
+            segments.append(tuple(state[: len(fields)]))
+        lines.append(segments)
+    return lines
+
+
+class SourceMapBuilder:
+    """
+    Builds the source map of one transpiled file, one chunk at a time.
+
+    A mapping is recorded at the start of every line, at every replaced
+    token and right after it, so code in between maps column for column.
+    """
+
+    def __init__(self, source: str, file: Optional[str] = None):
+        """
+        Args:
+            source: Path of the Rogalang source, as it should appear in the map
+            file: Name of the generated JavaScript file
+        """
+        self.source = source
+        self.file = file
+        # Original line and column of every preprocessed line not reached yet
+        self._origins: Deque[Tuple[int, int]] = deque()
+        self._origin: Optional[Tuple[int, int]] = None
+        self._mappings: List[str] = []
+        self._gen_col = 0
+        self._src_col = 0
+        self._mark_pending = True
+        # Values of the previous segment, mappings are relative to them
+        self._prev_gen_col = 0
+        self._prev_src_line = 0
+        self._prev_src_col = 0
+        self._line_has_segment = False
+
+    def add_origin(self, line: int, column: int) -> None:
+        """
+        Record where the next line of preprocessed code came from.
+
+        Args:
+            line: 0-based line of the source
+            column: Column of the code in the line, after its 'jille' prefix
+        """
+        self._origins.append((line, column))
+
+    def add(self, content: str, edits: List[Edit]) -> None:
+        """
+        Record a transpiled chunk of preprocessed code.
+
+        Chunks must be added in order and together cover all preprocessed
+        code, though they may start and end in the middle of a line.
+
+        Args:
+            content: The preprocessed code that was transpiled
+            edits: The tokens replaced in content, in order
+        """
+        pos = 0
+        for start, length, replacement in edits:
+            self._copy(content, pos, start)
+            self._mark()
+            self._advance(replacement)
+            self._src_col += length
+            self._mark_pending = True
+            pos = start + length
+        self._copy(content, pos, len(content))
+
+    def _copy(self, content: str, start: int, end: int) -> None:
+        """Record code that was copied to the output as it is"""
+        while start < end:
+            newline = content.find("\n", start, end)
+            line_end = end if newline < 0 else newline
+            if line_end > start:
+                if self._mark_pending:
+                    self._mark()
+                self._gen_col += line_end - start
+                self._src_col += line_end - start
+            if newline < 0:
+                return
+            self._new_line()
+            if self._origin is None and self._origins:
+                # An empty line, nothing was mapped to it
+                self._origins.popleft()
+            self._origin = None
+            self._src_col = 0
+            self._mark_pending = True
+            start = newline + 1
+
+    def _advance(self, text: str) -> None:
+        """Move the generated position past text"""
+        newlines = text.count("\n")
+        if not newlines:
+            self._gen_col += len(text)
+            return
+        for _ in range(newlines):
+            self._new_line()
+        self._gen_col = len(text) - text.rfind("\n") - 1
+
+    def _new_line(self) -> None:
+        self._mappings.append(";")
+        self._gen_col = 0
+        self._prev_gen_col = 0
+        self._line_has_segment = False
+
+    def _mark(self) -> None:
+        """Map the current generated position to the current source position"""
+        self._mark_pending = False
+        if self._origin is None:
+            if not self._origins:
+                # Code that did not come from a line, e.g. nothing at all
+                return
+            self._origin = self._origins.popleft()
+        line, column = self._origin
+        column += self._src_col
+        self._mappings.append(
+            ("," if self._line_has_segment else "")
+            + encode_vlq(self._gen_col - self._prev_gen_col)
+            + "A"
+            + encode_vlq(line - self._prev_src_line)
+            + encode_vlq(column - self._prev_src_col)
+        )
+        self._line_has_segment = True
+        self._prev_gen_col = self._gen_col
+        self._prev_src_line = line
+        self._prev_src_col = column
+
+    def as_dict(self) -> Dict:
+        source_map: Dict = {"version": 3}
+        if self.file is not None:
+            source_map["file"] = self.file
+        source_map["sources"] = [self.source]
+        source_map["names"] = []
+        source_map["mappings"] = "".join(self._mappings)
+        return source_map
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), ensure_ascii=False)
+
+    def inline_comment(self) -> str:
+        """A sourceMappingURL comment embedding the map as a data URL"""
+        data = base64.b64encode(self.to_json().encode("utf-8")).decode("ascii")
+        return (
+            f"//# sourceMappingURL=data:application/json;charset=utf-8;base64,{data}\n"
+        )
+
+
+def url_comment(map_path: str) -> str:
+    """A sourceMappingURL comment pointing to a separate .js.map file"""
+    return f"//# sourceMappingURL={map_path}\n"
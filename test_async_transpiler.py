@@ -0,0 +1,181 @@
+"""
+Tests for the asyncio API of the transpiler.
+Run with: python test_async_transpiler.py
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from async_transpiler import AsyncTranspiler, transpile_async, transpile_stream_async
+from transpiler import (
+    DIALECTS,
+    SegmentValidator,
+    TranspileStats,
+    transpile_rogalang,
+    transpile_stream,
+)
+
+
+def make_source(segments):
+    lines = []
+    for i in range(segments):
+        lines.append("herliga london\n")
+        lines.append(f"jille konst a{i} æ 'streng {i}'\n")
+        lines.append(f"jille sei(`mal {i} ${{a{i}}}\n")
+        lines.append("herliga london\n")
+        lines.append(f"jille slutt {i}`)\n")
+    return lines
+
+
+async def collect(chunks):
+    return "".join([chunk async for chunk in chunks])
+
+
+class AsyncLines:
+    """An asynchronous source that counts the lines read from it"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.read = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.read == len(self.lines):
+            raise StopAsyncIteration
+        self.read += 1
+        await asyncio.sleep(0)
+        return self.lines[self.read - 1]
+
+
+class TestAsyncTranspiler(unittest.IsolatedAsyncioTestCase):
+    """Test the asyncio API."""
+
+    async def asyncSetUp(self):
+        self.transpiler = AsyncTranspiler(max_workers=2, queue_size=2, batch_size=64)
+        self.addCleanup(self.transpiler.close)
+
+    async def test_transpile_async(self):
+        code = "konst a æ `x ${sei}` + 'y'"
+        self.assertEqual(await transpile_async(code), transpile_rogalang(code))
+
+    async def test_many_concurrent_calls(self):
+        codes = [f"sei({i})" for i in range(50)]
+        results = await asyncio.gather(*map(self.transpiler.transpile, codes))
+        self.assertEqual(results, [f"console.log({i})" for i in range(50)])
+
+    async def test_stream_matches_sync_stream(self):
+        lines = make_source(100)
+        expected = "".join(transpile_stream(lines))
+        self.assertEqual(
+            await collect(self.transpiler.transpile_stream(lines)), expected
+        )
+        self.assertEqual(
+            await collect(self.transpiler.transpile_stream(AsyncLines(lines))),
+            expected,
+        )
+        self.assertEqual(await collect(transpile_stream_async(lines)), expected)
+
+    async def test_stream_decodes_bytes(self):
+        lines = [line.encode("utf-8") for line in make_source(3)]
+        self.assertEqual(
+            await collect(self.transpiler.transpile_stream(lines)),
+            "".join(transpile_stream(make_source(3))),
+        )
+
+    async def test_sync_source_is_read_in_a_worker(self):
+        threads = set()
+
+        def lines():
+            for line in make_source(20):
+                threads.add(threading.current_thread())
+                yield line
+
+        self.assertEqual(
+            await collect(self.transpiler.transpile_stream(lines())),
+            "".join(transpile_stream(make_source(20))),
+        )
+        self.assertNotIn(threading.main_thread(), threads)
+
+    async def test_async_source_is_validated_in_a_worker(self):
+        threads = set()
+        feed = SegmentValidator.feed
+
+        def record(validator, line):
+            threads.add(threading.current_thread())
+            return feed(validator, line)
+
+        with mock.patch.object(SegmentValidator, "feed", record):
+            output = await collect(
+                self.transpiler.transpile_stream(AsyncLines(make_source(20)))
+            )
+        self.assertEqual(output, "".join(transpile_stream(make_source(20))))
+        self.assertNotIn(threading.main_thread(), threads)
+
+    async def test_dialect_and_minify(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bergensk.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("js,rogalang\nconsole.log,skriv\n")
+            DIALECTS.register("bergensk", path, cache_dir=tmp)
+            self.addCleanup(DIALECTS.unregister, "bergensk")
+            lines = ["herliga london\n", "jille skriv( 1 )\n", "jille sei( 2 )\n"]
+            self.assertEqual(
+                await self.transpiler.transpile("skriv( 1 )", dialect="bergensk"),
+                "console.log( 1 )",
+            )
+            self.assertEqual(
+                await transpile_async("sei( 1 )", minify=True), "console.log(1)"
+            )
+            self.assertEqual(
+                await collect(
+                    self.transpiler.transpile_stream(
+                        lines, dialect="bergensk", minify=True
+                    )
+                ),
+                "console.log(1)\nsei(2)\n",
+            )
+            with self.assertRaisesRegex(ValueError, "Unknown dialect"):
+                await collect(transpile_stream_async(lines, dialect="nynorsk"))
+
+    async def test_stream_validation_error(self):
+        lines = make_source(5) + ["kommentar\n"] * 11
+        with self.assertRaisesRegex(ValueError, "more than 10 lines from end"):
+            await collect(self.transpiler.transpile_stream(lines))
+
+    async def test_stream_stats(self):
+        stats = TranspileStats()
+        await collect(self.transpiler.transpile_stream(make_source(10), stats))
+        self.assertEqual(stats.replacements["konst"], 10)
+
+    async def test_backpressure(self):
+        source = AsyncLines(make_source(200))
+        stream = self.transpiler.transpile_stream(source)
+        await stream.__anext__()
+        # Give the producer every chance to run ahead of the consumer
+        for _ in range(200):
+            await asyncio.sleep(0)
+        self.assertLess(source.read, len(source.lines) // 2)
+        await stream.aclose()
+
+    async def test_event_loop_stays_responsive(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.create_task(ticker())
+        await self.transpiler.transpile("sei(a) " * 200_000)
+        task.cancel()
+        self.assertGreater(ticks, 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
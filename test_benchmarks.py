@@ -0,0 +1,162 @@
+"""
+Tests for the benchmark suite.
+Run with: python test_benchmarks.py
+"""
+
+import unittest
+from benchmarks.corpus import CorpusGenerator, format_size, parse_size
+from benchmarks.fuzz import (
+    FuzzGenerator,
+    code_engines,
+    fuzz,
+    load_engine,
+    run_engine,
+    shrink,
+    source_engines,
+)
+from benchmarks.run import STAGES, benchmark, check_regressions
+from transpiler import (
+    DELIMITER_CHARS,
+    Semantics,
+    Transpiler,
+    get_semantics,
+    scan_rogalang,
+    transpile_rogalang,
+    transpile_stream,
+    validate_and_preprocess_rogalang,
+)
+
+
+class TestCorpusGenerator(unittest.TestCase):
+    """Test the synthetic corpus generator."""
+
+    def test_generated_program_is_valid(self):
+        lines = list(CorpusGenerator(seed=1).lines(20 * 1024))
+        processed = validate_and_preprocess_rogalang(lines)
+        self.assertTrue(processed)
+        self.assertTrue(
+            any(not line.lstrip().startswith("jille") for line in lines[1:])
+        )
+        self.assertTrue("".join(transpile_stream(lines)))
+
+    def test_size_is_roughly_the_target(self):
+        size = sum(
+            len(line.encode("utf-8")) for line in CorpusGenerator().lines(50_000)
+        )
+        self.assertGreaterEqual(size, 50_000)
+        self.assertLess(size, 52_000)
+
+    def test_template_depth(self):
+        generator = CorpusGenerator(template_depth=4)
+        self.assertEqual(generator._template(4).count("`") // 2, 5)
+        items, open_template, depth = scan_rogalang(generator._template(4))
+        self.assertEqual(len(items), 1)
+        self.assertIsNone(open_template)
+        self.assertEqual(depth, 5)
+
+    def test_deterministic_for_a_seed(self):
+        self.assertEqual(
+            list(CorpusGenerator(seed=3).lines(5000)),
+            list(CorpusGenerator(seed=3).lines(5000)),
+        )
+
+    def test_sizes(self):
+        self.assertEqual(parse_size("100MB"), 100 * 1024 * 1024)
+        self.assertEqual(parse_size("1kb"), 1024)
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(format_size(parse_size("10MB")), "10MB")
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test timing and the regression check."""
+
+    def test_benchmark_reports_every_stage(self):
+        result = benchmark(2048, repeat=1)
+        self.assertGreaterEqual(result["bytes"], 2048)
+        self.assertEqual(set(result["seconds"]), set(STAGES) | {"total"})
+        self.assertGreater(result["throughput_mb_s"], 0)
+        self.assertGreater(result["peak_memory_bytes"], 0)
+
+    def test_check_regressions(self):
+        baseline = {"results": {"1MB": {"throughput_mb_s": 10.0}}}
+        fast = {
+            "results": {
+                "1MB": {"throughput_mb_s": 9.0},
+                "1KB": {"throughput_mb_s": 1.0},
+            }
+        }
+        slow = {"results": {"1MB": {"throughput_mb_s": 7.0}}}
+        self.assertEqual(check_regressions(fast, baseline, 0.2), [])
+        self.assertEqual(len(check_regressions(slow, baseline, 0.2)), 1)
+
+
+def no_paren_delimiter():
+    """An engine that forgets that ')' is a delimiter"""
+    semantics = get_semantics()
+    pattern = semantics.regex.pattern.replace(
+        DELIMITER_CHARS, DELIMITER_CHARS.replace(")", "")
+    )
+    return Transpiler(Semantics(semantics.table, "broken", pattern)).transpile
+
+
+class TestFuzz(unittest.TestCase):
+    """Test the differential fuzzing harness."""
+
+    def test_builtin_engines_match_reference(self):
+        for mode in ("code", "source"):
+            with self.subTest(mode=mode):
+                report = fuzz({}, cases=300, mode=mode, seed=1)
+                self.assertEqual(report.mismatches, [])
+        report = fuzz(code_engines(), cases=300, seed=2)
+        self.assertEqual(report.mismatches, [])
+        self.assertEqual(
+            set(report.throughput_mb_s), {"reference", "memo", "source_map", "batch"}
+        )
+
+    def test_source_engines_match_reference(self):
+        report = fuzz(source_engines(), cases=100, mode="source", seed=3)
+        self.assertEqual(report.mismatches, [])
+        self.assertEqual(
+            set(report.throughput_mb_s),
+            {"reference", "incremental", "whole_file", "parallel", "async"},
+        )
+
+    def test_generator(self):
+        self.assertEqual(
+            [FuzzGenerator(5).case("code") for _ in range(3)],
+            [FuzzGenerator(5).case("code") for _ in range(3)],
+        )
+        sources = [FuzzGenerator(seed).source() for seed in range(200)]
+        outcomes = [run_engine(transpile_stream_text, text)[0] for text in sources]
+        # Mostly valid, but some nearly valid sources as well
+        self.assertGreater(outcomes.count("ok"), 100)
+        self.assertGreater(outcomes.count("error"), 5)
+
+    def test_mismatch_is_shrunk(self):
+        report = fuzz({"broken": no_paren_delimiter()}, cases=300, seed=0)
+        (mismatch,) = report.mismatches
+        self.assertEqual(mismatch.engine, "broken")
+        self.assertLess(len(mismatch.case), len(mismatch.original))
+        # A token directly followed by ')'
+        self.assertRegex(mismatch.case, r"^\S+\)$")
+        self.assertIn(mismatch.case[:-1], get_semantics().table)
+        self.assertNotEqual(mismatch.expected, mismatch.actual)
+
+    def test_shrink(self):
+        shrunk = shrink("abc\nxyz\nqqq", lambda case: "y" in case and "q" in case)
+        self.assertEqual(shrunk, "yq")
+
+    def test_load_engine(self):
+        self.assertIs(load_engine("transpiler:transpile_rogalang"), transpile_rogalang)
+        with self.assertRaises(ValueError):
+            load_engine("transpiler")
+
+
+def transpile_stream_text(text):
+    return "".join(transpile_stream(text.splitlines(keepends=True)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,238 @@
+"""
+Tests for the module bundler.
+Run with: python test_bundler.py
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from bundler import (
+    CALL,
+    DECLARATION,
+    DEFAULT,
+    EXPORT_LIST,
+    IMPORT,
+    REEXPORT,
+    REFERENCE,
+    SHORTHAND,
+    Binding,
+    Bundler,
+    parse_module,
+    resolve_import,
+)
+from transpile_cache import TranspileCache
+
+MAIN = """herliga london
+jille ta inn { dobbel, PI } from './lib/matte.rl'
+jille ta inn * as tekst from './lib/tekst'
+jille ta inn fs from 'fs'
+jille sei(dobbel(PI), tekst.hei('du'))
+jille send ud konst svar æ 42
+herliga london
+"""
+
+MATTE = """herliga london
+jille ta inn { hjelp } from './hjelp.rl'
+jille send ud konst PI æ 3.14
+jille send ud arbeidskar dobbel(x) { spytt ud hjelp(x) gange me 2 }
+jille send ud arbeidskar trippel(x) { spytt ud x gange me 3 }
+jille send ud arbeidskar kvadrat(x) { spytt ud x gange me x }
+jille arbeidskar brukar() { spytt ud kvadrat(2) }
+herliga london
+"""
+
+HJELP = """herliga london
+jille send ud arbeidskar hjelp(x) { spytt ud x }
+herliga london
+"""
+
+TEKST = """herliga london
+jille send ud arbeidskar hei(namn) { spytt ud `hei ${namn}` }
+jille send ud * from './hjelp.rl'
+herliga london
+"""
+
+
+class TestParseModule(unittest.TestCase):
+    """Test finding import and export statements."""
+
+    def test_imports(self):
+        js = (
+            "import a, { b, c as d } from './x.rl';\n"
+            "import * as ns from 'y'\n"
+            "import './z.rl'\n"
+            "const e = import('w')\n"
+        )
+        statements = parse_module(js).statements
+        self.assertEqual([s.kind for s in statements], [IMPORT] * 3)
+        self.assertEqual(
+            statements[0].bindings,
+            (Binding("default", "a"), Binding("b", "b"), Binding("c", "d")),
+        )
+        self.assertEqual(js[statements[0].start : statements[0].end], js[:38])
+        self.assertEqual(statements[1].bindings, (Binding("*", "ns"),))
+        self.assertEqual(statements[2].specifier, "./z.rl")
+
+    def test_exports(self):
+        js = (
+            "export const a = 1, b = [2,\n3]\n"
+            "export function f() { if (a) { return } }\n"
+            "export default class { }\n"
+            "export { a as c }\n"
+            "export * from './x.rl'\n"
+            "function g() {}\n"
+        )
+        parsed = parse_module(js)
+        kinds = [s.kind for s in parsed.statements]
+        self.assertEqual(
+            kinds, [DECLARATION, DECLARATION, DEFAULT, EXPORT_LIST, REEXPORT]
+        )
+        self.assertEqual(
+            parsed.statements[0].bindings, (Binding("a", "a"), Binding("b", "b"))
+        )
+        start, end = parsed.declarations["f"]
+        self.assertEqual(js[start:end], "export function f() { if (a) { return } }")
+        self.assertIn("g", parsed.declarations)
+        # Names in export lists are not references
+        self.assertEqual(parsed.references["a"], 2)
+
+    def test_import_references(self):
+        js = (
+            "import { a, b } from './x.rl'\n"
+            "f(a, { a }, { a: 1 }, o.a, `${a}`)\n"
+            "a()\n"
+            "const o = { a() { return b } }\n"
+            "function g(b) { return b }\n"
+        )
+        parsed = parse_module(js)
+        uses = [
+            (js[start : start + 1], js[start - 1], use)
+            for start, use in parsed.import_references["a"]
+        ]
+        self.assertEqual(
+            uses,
+            [
+                ("a", "(", REFERENCE),
+                ("a", " ", SHORTHAND),
+                ("a", "{", REFERENCE),
+                ("a", "\n", CALL),
+            ],
+        )
+        # The parameter of g declares b again
+        self.assertEqual(parsed.redeclared, {"b"})
+
+    def test_unsupported(self):
+        with self.assertRaisesRegex(ValueError, "Unsupported import or export"):
+            parse_module("export const { a } = b")
+
+
+class TestBundler(unittest.TestCase):
+    """Test bundling modules that import each other."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.write("main.rl", MAIN)
+        self.write("lib/matte.rl", MATTE)
+        self.write("lib/hjelp.rl", HJELP)
+        self.write("lib/tekst.rl", TEKST)
+        self.entry = self.path("main.rl")
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def write(self, name, content):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def test_resolve_import(self):
+        self.assertEqual(
+            resolve_import(self.entry, "./lib/tekst"), self.path("lib/tekst.rl")
+        )
+        self.assertIsNone(resolve_import(self.entry, "fs"))
+        with self.assertRaisesRegex(ValueError, "cannot find module"):
+            resolve_import(self.entry, "./missing.rl")
+
+    def test_bundle(self):
+        bundle = Bundler().bundle(self.entry)
+        self.assertEqual(
+            bundle.modules,
+            [self.path(p) for p in ("lib/hjelp.rl", "lib/matte.rl", "lib/tekst.rl")]
+            + [self.entry],
+        )
+        js = bundle.js
+        self.assertIn('import * as __rl_external0 from "fs";', js)
+        self.assertIn("const tekst = __rl_module2;", js)
+        self.assertIn(
+            "console.log((0, __rl_module1.dobbel)(__rl_module1.PI), tekst.hei('du'))",
+            js,
+        )
+        self.assertIn("return (0, __rl_module0.hjelp)(x) * 2", js)
+        self.assertIn('"hjelp": () => __rl_module0["hjelp"]', js)
+        self.assertTrue(js.endswith("export const { svar } = __rl_module3;\n"))
+        self.assertNotIn("export ", js.replace("export const { svar }", ""))
+
+    @unittest.skipUnless(shutil.which("node"), "needs node")
+    def test_imports_are_live_bindings(self):
+        self.write(
+            "teljar.rl",
+            "herliga london\n"
+            "jille send ud la teller æ 0\n"
+            "jille send ud arbeidskar auk() { teller øge mæ 1 }\n",
+        )
+        self.write(
+            "main.rl",
+            "herliga london\n"
+            "jille ta inn { teller, auk } from './teljar.rl'\n"
+            "jille auk()\n"
+            "jille sei(teller, { teller })\n",
+        )
+        bundle = Bundler().bundle(self.entry)
+        result = subprocess.run(
+            ["node", "--input-type=module"],
+            input=bundle.js,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout, "1 { teller: 1 }\n")
+
+    def test_unused_exports_are_removed(self):
+        bundle = Bundler().bundle(self.entry)
+        self.assertEqual(
+            bundle.removed, {self.path("lib/matte.rl"): ["trippel", "kvadrat"]}
+        )
+        self.assertNotIn("trippel", bundle.js)
+        # Still called by a function of its own module
+        self.assertIn("function kvadrat(x)", bundle.js)
+        self.assertIn('{ "PI": () => PI, "dobbel": () => dobbel }', bundle.js)
+
+    def test_circular_imports(self):
+        self.write("lib/hjelp.rl", HJELP + "jille ta inn './matte.rl'\n")
+        with self.assertRaisesRegex(
+            ValueError, "Circular import: lib/matte.rl -> lib/hjelp.rl -> lib/matte.rl"
+        ):
+            Bundler().bundle(self.entry)
+
+    def test_invalid_module(self):
+        self.write("lib/hjelp.rl", "jille sei(1)\n")
+        with self.assertRaisesRegex(ValueError, "hjelp.rl: No 'herliga london'"):
+            Bundler().bundle(self.entry)
+
+    def test_rebuild_transpiles_changed_modules(self):
+        cache = TranspileCache(self.path("cache"))
+        first = Bundler(jobs=2, cache=cache).bundle(self.entry)
+        self.assertEqual(len(first.transpiled), 4)
+
+        self.write("lib/tekst.rl", TEKST.replace("hei ", "hallo "))
+        second = Bundler(jobs=2, cache=cache).bundle(self.entry)
+        self.assertEqual(second.transpiled, [self.path("lib/tekst.rl")])
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 5})
+        self.assertEqual(second.js, first.js.replace("`hei ", "`hallo "))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,311 @@
+"""
+Tests for the Rogalang command line interface.
+Run with: python test_cli.py
+"""
+
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from cli import find_sources, main
+
+VALID_SOURCE = """herliga london
+jille konst a æ ['hello', 'world']
+jille for kvar einaste(b i a) {
+    jille sei(b)
+jille }
+"""
+
+VALID_OUTPUT = """const a = ['hello', 'world']
+for(b in a) {
+console.log(b)
+}
+"""
+
+MINIFIED_OUTPUT = """const a=['hello','world']
+for(b in a){console.log(b)}
+"""
+
+
+class TestBuild(unittest.TestCase):
+    """Test the build command."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.src = os.path.join(self.tmp.name, "src")
+        self.dist = os.path.join(self.tmp.name, "dist")
+        self.cache = os.path.join(self.tmp.name, "cache")
+
+    def write_source(self, name, content):
+        path = os.path.join(self.src, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def read_output(self, name):
+        with open(os.path.join(self.dist, name), encoding="utf-8") as f:
+            return f.read()
+
+    def run_main(self, *argv):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            code = main(list(argv) + ["--cache-dir", self.cache])
+        return code, stderr.getvalue()
+
+    def test_find_sources_keeps_directory_structure(self):
+        self.write_source("a.rl", VALID_SOURCE)
+        self.write_source("lib/b.rl", VALID_SOURCE)
+        self.write_source("notes.txt", "")
+        self.assertEqual(
+            find_sources(self.src, self.dist),
+            [
+                (os.path.join(self.src, "a.rl"), os.path.join(self.dist, "a.js")),
+                (
+                    os.path.join(self.src, "lib", "b.rl"),
+                    os.path.join(self.dist, "lib", "b.js"),
+                ),
+            ],
+        )
+
+    def test_build_directory_in_parallel(self):
+        for i in range(6):
+            self.write_source(f"module{i}.rl", VALID_SOURCE)
+        code, _ = self.run_main("build", self.src, "-o", self.dist, "-j", "3")
+        self.assertEqual(code, 0)
+        for i in range(6):
+            self.assertEqual(self.read_output(f"module{i}.js"), VALID_OUTPUT)
+
+    def test_errors_do_not_stop_the_build(self):
+        self.write_source("bad.rl", "jille konst a æ 5\n")
+        self.write_source("good.rl", VALID_SOURCE)
+        code, stderr = self.run_main("build", self.src, "-o", self.dist, "-j", "2")
+        self.assertEqual(code, 1)
+        self.assertIn("bad.rl: No 'herliga london' found", stderr)
+        self.assertIn("Built 1 of 2 files", stderr)
+        self.assertEqual(self.read_output("good.js"), VALID_OUTPUT)
+        self.assertFalse(os.path.exists(os.path.join(self.dist, "bad.js")))
+
+    def test_missing_source(self):
+        missing = os.path.join(self.src, "missing.rl")
+        code, stderr = self.run_main("build", missing, "-o", self.dist)
+        self.assertEqual(code, 1)
+        self.assertIn(f"{missing} does not exist", stderr)
+        self.assertFalse(os.path.exists(self.dist))
+
+    def test_build_single_file(self):
+        self.write_source("a.rl", VALID_SOURCE)
+        code, _ = self.run_main(
+            "build", os.path.join(self.src, "a.rl"), "-o", self.dist, "-j", "1"
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(self.read_output("a.js"), VALID_OUTPUT)
+
+    def test_unchanged_files_come_from_the_cache(self):
+        self.write_source("a.rl", VALID_SOURCE)
+        self.write_source("b.rl", VALID_SOURCE.replace("hello", "hei"))
+        _, stderr = self.run_main("build", self.src, "-o", self.dist, "-j", "1")
+        self.assertIn("Cache: 0 hits, 2 misses", stderr)
+
+        self.write_source("b.rl", VALID_SOURCE.replace("hello", "hallo"))
+        _, stderr = self.run_main("build", self.src, "-o", self.dist, "-j", "2")
+        self.assertIn("Cache: 1 hits, 1 misses", stderr)
+        self.assertEqual(self.read_output("a.js"), VALID_OUTPUT)
+        self.assertEqual(
+            self.read_output("b.js"), VALID_OUTPUT.replace("hello", "hallo")
+        )
+
+    def test_no_cache(self):
+        self.write_source("a.rl", VALID_SOURCE)
+        _, stderr = self.run_main(
+            "build", self.src, "-o", self.dist, "-j", "1", "--no-cache"
+        )
+        self.assertNotIn("Cache:", stderr)
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_profile(self):
+        self.write_source("a.rl", VALID_SOURCE)
+        self.write_source("b.rl", VALID_SOURCE)
+        _, stderr = self.run_main(
+            "build",
+            self.src,
+            "-o",
+            self.dist,
+            "-j",
+            "2",
+            "--no-cache",
+            "--profile",
+            "--memo",
+        )
+        self.assertIn("in 2 transpilations", stderr)
+        self.assertIn("'konst'", stderr)
+        self.assertEqual(self.read_output("a.js"), VALID_OUTPUT)
+
+    def test_minify(self):
+        self.write_source("a.rl", VALID_SOURCE)
+        self.run_main("build", self.src, "-o", self.dist, "-j", "1")
+        code, stderr = self.run_main(
+            "build", self.src, "-o", self.dist, "-j", "1", "--minify"
+        )
+        self.assertEqual(code, 0)
+        # Minified output is cached apart from the plain output
+        self.assertIn("Cache: 0 hits, 1 misses", stderr)
+        self.assertEqual(self.read_output("a.js"), MINIFIED_OUTPUT)
+
+    def test_source_map(self):
+        self.write_source("lib/b.rl", VALID_SOURCE)
+        code, _ = self.run_main(
+            "build", self.src, "-o", self.dist, "--source-map", "file"
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(
+            self.read_output("lib/b.js"),
+            VALID_OUTPUT + "//# sourceMappingURL=b.js.map\n",
+        )
+        self.assertIn(
+            '"sources": ["../../src/lib/b.rl"]', self.read_output("lib/b.js.map")
+        )
+
+
+class TestCheckCommand(unittest.TestCase):
+    """Test reporting every validation error."""
+
+    def test_check(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            good = os.path.join(tmp, "good.rl")
+            bad = os.path.join(tmp, "bad.rl")
+            with open(good, "w", encoding="utf-8") as f:
+                f.write(VALID_SOURCE)
+            with open(bad, "w", encoding="utf-8") as f:
+                f.write("jille a\nherliga london\n" + "x\n" * 11)
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                code = main(["check", tmp])
+        self.assertEqual(code, 1)
+        self.assertEqual(
+            stdout.getvalue().splitlines(),
+            [
+                f"{bad}:1: First line must be 'herliga london'",
+                f"{bad}:13: Last 'herliga london' at line 2 is more than 10 lines from end",
+            ],
+        )
+        self.assertIn("Checked 2 files, 1 invalid", stderr.getvalue())
+
+    def test_check_missing_source(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            missing = os.path.join(tmp, "missing.rl")
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                code = main(["check", missing])
+        self.assertEqual(code, 1)
+        self.assertEqual(stdout.getvalue(), f"{missing} does not exist\n")
+        self.assertIn("Checked 0 files, 1 invalid", stderr.getvalue())
+
+
+class TestBundleCommand(unittest.TestCase):
+    """Test bundling a module with its imports."""
+
+    def test_bundle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "main.rl"), "w", encoding="utf-8") as f:
+                f.write(
+                    "herliga london\njille ta inn { a } from './lib.rl'\n"
+                    "jille sei(a)\n"
+                )
+            with open(os.path.join(tmp, "lib.rl"), "w", encoding="utf-8") as f:
+                f.write(VALID_SOURCE.replace("jille konst", "jille send ud konst"))
+            output = os.path.join(tmp, "app.js")
+            argv = ["bundle", os.path.join(tmp, "main.rl"), "-o", output]
+            argv += ["--cache-dir", os.path.join(tmp, "cache")]
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                self.assertEqual(main(argv), 0)
+                self.assertEqual(main(argv), 0)
+            with open(output, encoding="utf-8") as f:
+                js = f.read()
+        self.assertIn("console.log(__rl_module0.a)", js)
+        self.assertIn(
+            f"Bundled 2 modules into {output}, transpiled 2", stderr.getvalue()
+        )
+        self.assertIn("transpiled 0, removed 0 unused exports", stderr.getvalue())
+
+
+class TestTranspileCommand(unittest.TestCase):
+    """Test transpiling a single file to stdout."""
+
+    def run_main(self, source, *args):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.rl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                code = main([path, *args])
+        return code, stdout.getvalue()
+
+    def test_default_command(self):
+        code, stdout = self.run_main(VALID_SOURCE)
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout, VALID_OUTPUT + "\n")
+
+    def test_source_map(self):
+        code, stdout = self.run_main(VALID_SOURCE, "--source-map")
+        self.assertEqual(code, 0)
+        self.assertTrue(
+            stdout.startswith(VALID_OUTPUT + "\n//# sourceMappingURL=data:")
+        )
+
+    def test_optimize(self):
+        source = "herliga london\njille sei(2 gange me 3 ta i frå 1)\n"
+        code, stdout = self.run_main(source, "--optimize")
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout, "console.log(5)\n\n")
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            self.run_main(source, "--optimize", "--source-map")
+
+    def test_minify(self):
+        code, stdout = self.run_main(VALID_SOURCE * 3, "--minify", "-j", "2")
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout, MINIFIED_OUTPUT * 3 + "\n")
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            self.run_main(VALID_SOURCE, "--minify", "--source-map")
+
+    def test_jobs(self):
+        code, stdout = self.run_main(VALID_SOURCE * 3, "-j", "2")
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout, VALID_OUTPUT * 3 + "\n")
+
+
+class TestLazyImports(unittest.TestCase):
+    """Test that importing a module only loads the modules it always needs."""
+
+    def loaded(self, module, candidates):
+        script = (
+            f"import sys, {module}\n"
+            f"print(' '.join(m for m in {candidates!r} if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.split()
+
+    def test_transpiler(self):
+        self.assertEqual(self.loaded("transpiler", ["optimizer", "jstokens"]), [])
+
+    def test_cli(self):
+        candidates = ["optimizer", "jstokens", "bundler", "parallel", "server"]
+        self.assertEqual(self.loaded("cli", candidates), [])
+
+    def test_bundler(self):
+        self.assertEqual(self.loaded("bundler", ["optimizer"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
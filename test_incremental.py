@@ -0,0 +1,196 @@
+"""
+Tests for incremental transpilation.
+Run with: python test_incremental.py
+"""
+
+import random
+import unittest
+from unittest import mock
+import transpiler
+from incremental import IncrementalTranspiler, split_segments, validate_segments
+from transpiler import transpile_stream
+
+
+def segment(*statements):
+    return ["herliga london\n"] + [f"jille {s}\n" for s in statements]
+
+
+SOURCE = (
+    segment("konst a æ 1", "sei(a)")
+    + segment("sei(`start", "midten")
+    + segment("slutt ${a}`)")
+    + segment("la b æ 'b'", "sei(b)")
+    + segment("sei(forrektigt)")
+)
+
+
+class TestIncrementalTranspiler(unittest.TestCase):
+    """Test that edits only transpile the segments they touch."""
+
+    def assert_matches_stream(self, transpiler, lines):
+        self.assertEqual(transpiler.output, "".join(transpile_stream(lines)))
+        self.assertEqual(transpiler.lines, lines)
+
+    def test_first_update_transpiles_everything(self):
+        transpiler = IncrementalTranspiler()
+        transpiler.update("".join(SOURCE))
+        self.assertEqual(transpiler.transpiled_segments, 5)
+        self.assert_matches_stream(transpiler, SOURCE)
+
+    def test_unchanged_source(self):
+        transpiler = IncrementalTranspiler()
+        transpiler.update(SOURCE)
+        transpiler.update(list(SOURCE))
+        self.assertEqual(transpiler.transpiled_segments, 0)
+
+    def test_edit_one_segment(self):
+        transpiler = IncrementalTranspiler()
+        transpiler.update(SOURCE)
+        lines = list(SOURCE)
+        lines[8] = "jille la b æ 'c'\n"
+        transpiler.update(lines)
+        self.assertEqual(transpiler.transpiled_segments, 1)
+        self.assert_matches_stream(transpiler, lines)
+
+    def test_open_template_carries_into_next_segment(self):
+        transpiler = IncrementalTranspiler()
+        transpiler.update(SOURCE)
+        # Changing the text inside the literal changes what the next
+        # segment receives, but the segments after it are reused
+        transpiler.edit(4, 5, "jille sei(`begynnelse\n")
+        self.assertEqual(transpiler.transpiled_segments, 2)
+        self.assert_matches_stream(transpiler, transpiler.lines)
+        self.assertIn("`begynnelse\nmidten\nslutt ${a}`", transpiler.output)
+
+    def test_unclosed_template_at_the_end(self):
+        transpiler = IncrementalTranspiler()
+        lines = SOURCE + segment("sei(`aldri lukka")
+        transpiler.update(lines)
+        self.assert_matches_stream(transpiler, lines)
+        transpiler.edit(len(lines), len(lines), "jille ferdig`)\n")
+        self.assert_matches_stream(transpiler, lines + ["jille ferdig`)\n"])
+
+    def test_edit_inside_open_template_is_linear(self):
+        scan = transpiler.scan_rogalang
+        for size in (1000, 4000):
+            lines = segment("sei(`aldri lukka")
+            for i in range(size):
+                lines += segment(f"konst a{i} æ 'streng {i}'", f"sei(a{i})")
+            incremental = IncrementalTranspiler()
+            incremental.update(lines)
+            scanned = 0
+
+            def counting_scan(content):
+                nonlocal scanned
+                scanned += len(content)
+                return scan(content)
+
+            middle = len(lines) // 2
+            with mock.patch("transpiler.scan_rogalang", counting_scan):
+                incremental.edit(middle, middle + 1, "jille sei(1)\n")
+            lines[middle] = "jille sei(1)\n"
+            self.assertEqual(incremental.output, "".join(transpile_stream(lines)))
+            # Every character is scanned a few times, not once per segment
+            with self.subTest(size=size):
+                self.assertLess(scanned, 3 * sum(map(len, lines)))
+
+    def test_removing_herliga_london_merges_segments(self):
+        transpiler = IncrementalTranspiler()
+        transpiler.update(SOURCE)
+        transpiler.edit(7, 8, [])
+        self.assert_matches_stream(transpiler, SOURCE[:7] + SOURCE[8:])
+
+    def test_invalid_edit_keeps_previous_source(self):
+        transpiler = IncrementalTranspiler()
+        output = transpiler.update(SOURCE)
+        with self.assertRaisesRegex(ValueError, "Gap of 11 lines"):
+            transpiler.edit(1, 1, ["kommentar\n"] * 8)
+        with self.assertRaisesRegex(ValueError, "First line must be"):
+            transpiler.update(["kommentar\n"] + SOURCE)
+        self.assertEqual(transpiler.output, output)
+        self.assertEqual(transpiler.lines, SOURCE)
+
+    def test_edit_late_in_the_source(self):
+        transpiler = IncrementalTranspiler()
+        lines = SOURCE * 3
+        transpiler.update(lines)
+        with self.assertRaisesRegex(ValueError, "at lines 20 and 31"):
+            transpiler.edit(20, 20, ["kommentar\n"] * 9)
+        transpiler.edit(30, 31, "jille sei(b)\n")
+        lines[30] = "jille sei(b)\n"
+        self.assert_matches_stream(transpiler, lines)
+
+    def test_edit_out_of_range(self):
+        transpiler = IncrementalTranspiler()
+        transpiler.update(SOURCE)
+        with self.assertRaises(IndexError):
+            transpiler.edit(5, len(SOURCE) + 1, [])
+
+    def test_random_edits_match_stream(self):
+        rnd = random.Random(0)
+        replacements = [
+            [],
+            ["herliga london\n"],
+            ["jille sei(`a\n"],
+            ["jille b`)\n"],
+            ["jille konst x æ 1\n"],
+            ["kommentar\n", "jille hvis(a)\n"],
+        ]
+        transpiler = IncrementalTranspiler()
+        lines = SOURCE * 4
+        transpiler.update(lines)
+        for i in range(200):
+            start = rnd.randrange(len(lines) + 1)
+            end = min(len(lines), start + rnd.randrange(3))
+            new_lines = rnd.choice(replacements)
+            candidate = lines[:start] + new_lines + lines[end:]
+            try:
+                expected = "".join(transpile_stream(candidate))
+            except ValueError as e:
+                with self.assertRaisesRegex(ValueError, str(e)):
+                    transpiler.edit(start, end, new_lines)
+                continue
+            if i % 2:
+                transpiler.edit(start, end, new_lines)
+            else:
+                transpiler.update(candidate)
+            lines = candidate
+            self.assertEqual(transpiler.output, expected)
+            self.assertEqual(transpiler.lines, lines)
+
+
+class TestSegments(unittest.TestCase):
+    """Test splitting and validating segments."""
+
+    def test_split(self):
+        self.assertEqual(
+            split_segments(["a\n", "herliga london\n", "b\n", "herliga london"]),
+            [("a\n",), ("herliga london\n", "b\n"), ("herliga london",)],
+        )
+
+    def test_validation_matches_stream(self):
+        sources = [
+            [],
+            ["jille a\n"],
+            ["jille a\n", "herliga london\n"],
+            ["herliga london\n"] + ["x\n"] * 10 + ["herliga london\n"],
+            ["herliga london\n"] + ["x\n"] * 11,
+            ["herliga london\n"] + ["x\n"] * 10,
+        ]
+        for lines in sources:
+            with self.subTest(lines=lines):
+                try:
+                    list(transpile_stream(lines))
+                    expected = None
+                except ValueError as e:
+                    expected = str(e)
+                try:
+                    validate_segments(split_segments(lines))
+                    error = None
+                except ValueError as e:
+                    error = str(e)
+                self.assertEqual(error, expected)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,213 @@
+"""
+Tests for the streaming lexer.
+Run with: python test_lexer.py
+"""
+
+import os
+import tempfile
+import unittest
+from collections import Counter
+from lexer import (
+    COMMENT,
+    HERLIGA,
+    IDENTIFIER,
+    JILLE,
+    KEYWORD,
+    NEWLINE,
+    NUMBER,
+    OPERATOR,
+    OTHER,
+    PUNCTUATION,
+    STRING,
+    TEMPLATE,
+    WHITESPACE,
+    Token,
+    check_camel_case,
+    tokenize,
+    tokenize_code,
+)
+from transpiler import DIALECTS, TranspileStats, Transpiler
+
+SOURCE = """herliga london
+jille konst melding æ `hei ${sei('du')}
+ en kommentar
+jille !`
+  jille\tsei(melding)
+"""
+
+
+def significant(tokens):
+    return [
+        (token.type, token.text)
+        for token in tokens
+        if token.type not in (WHITESPACE, NEWLINE)
+    ]
+
+
+class TestTokenizeCode(unittest.TestCase):
+    """Test tokenizing preprocessed code."""
+
+    def assertTokens(self, code, expected):
+        tokens = list(tokenize_code(code))
+        self.assertEqual("".join(text for _, text, _ in tokens), code)
+        for _, text, offset in tokens:
+            self.assertTrue(code.startswith(text, offset))
+        self.assertEqual(
+            [(type, text) for type, text, _ in tokens if type != WHITESPACE],
+            expected,
+        )
+
+    def test_keywords_and_operators(self):
+        self.assertTokens(
+            "konst x æ y græla likt mæ 2",
+            [
+                (KEYWORD, "konst"),
+                (IDENTIFIER, "x"),
+                (OPERATOR, "æ"),
+                (IDENTIFIER, "y"),
+                (OPERATOR, "græla likt mæ"),
+                (NUMBER, "2"),
+            ],
+        )
+
+    def test_tokens_need_delimiters(self):
+        # Like the transpiler, a literal counts as a delimiter
+        self.assertTokens(
+            "seix+sei sei'a'",
+            [
+                (IDENTIFIER, "seix"),
+                (PUNCTUATION, "+"),
+                (IDENTIFIER, "sei"),
+                (KEYWORD, "sei"),
+                (STRING, "'a'"),
+            ],
+        )
+
+    def test_template_expressions(self):
+        self.assertTokens(
+            "`a ${ {b: sei}.b } ${`c${'d'}`}`",
+            [
+                (TEMPLATE, "`a ${"),
+                (PUNCTUATION, "{"),
+                (IDENTIFIER, "b"),
+                (PUNCTUATION, ":"),
+                (KEYWORD, "sei"),
+                (PUNCTUATION, "}"),
+                (PUNCTUATION, "."),
+                (IDENTIFIER, "b"),
+                (TEMPLATE, "} ${"),
+                (TEMPLATE, "`c${"),
+                (STRING, "'d'"),
+                (TEMPLATE, "}`"),
+                (TEMPLATE, "}`"),
+            ],
+        )
+
+    def test_unclosed_literals_are_code(self):
+        self.assertTokens(
+            "'a sei `b",
+            [
+                (OTHER, "'"),
+                (IDENTIFIER, "a"),
+                (KEYWORD, "sei"),
+                (OTHER, "`"),
+                (IDENTIFIER, "b"),
+            ],
+        )
+
+    def test_same_tokens_as_the_transpiler(self):
+        code = "konst a æ `${sei(1) aog mæ  2}` elle 'sei' ? b : sei`x`"
+        stats = TranspileStats()
+        Transpiler().transpile(code, stats)
+        replaced = Counter(
+            text for type, text, _ in tokenize_code(code) if type in (KEYWORD, OPERATOR)
+        )
+        self.assertEqual(replaced, stats.replacements)
+
+
+class TestTokenize(unittest.TestCase):
+    """Test tokenizing whole sources with positions."""
+
+    def test_positions(self):
+        tokens = list(tokenize(SOURCE.splitlines(keepends=True)))
+        self.assertEqual("".join(token.text for token in tokens), SOURCE)
+        lines = SOURCE.splitlines(keepends=True)
+        for token in tokens:
+            self.assertTrue(
+                lines[token.line - 1].startswith(token.text, token.column), token
+            )
+        self.assertEqual(
+            tokens[:5],
+            [
+                Token(HERLIGA, "herliga london", 1, 0),
+                Token(NEWLINE, "\n", 1, 14),
+                Token(JILLE, "jille ", 2, 0),
+                Token(KEYWORD, "konst", 2, 6),
+                Token(WHITESPACE, " ", 2, 11),
+            ],
+        )
+
+    def test_template_spanning_lines(self):
+        tokens = significant(tokenize(SOURCE.splitlines(keepends=True)))
+        self.assertEqual(
+            tokens[5:13],
+            [
+                (TEMPLATE, "`hei ${"),
+                (KEYWORD, "sei"),
+                (PUNCTUATION, "("),
+                (STRING, "'du'"),
+                (PUNCTUATION, ")"),
+                (TEMPLATE, "}"),
+                (COMMENT, " en kommentar"),
+                (JILLE, "jille "),
+            ],
+        )
+        self.assertEqual(tokens[13], (TEMPLATE, "!`"))
+        self.assertEqual(tokens[14:16], [(JILLE, "  jille\t"), (KEYWORD, "sei")])
+
+    def test_unclosed_template(self):
+        # Like transpile_stream, the backtick is code and does not delimit
+        # the token before it
+        source = ["herliga london\n", "jille sei`a sei\n", "jille b\n"]
+        self.assertEqual(
+            significant(tokenize(source))[2:],
+            [(IDENTIFIER, "sei"), (OTHER, "`"), (IDENTIFIER, "a"), (KEYWORD, "sei")]
+            + [(JILLE, "jille "), (IDENTIFIER, "b")],
+        )
+        self.assertEqual(
+            "".join(Transpiler().transpile_stream(source)), "sei`a console.log\nb\n"
+        )
+
+    def test_lines_are_streamed(self):
+        def lines():
+            yield "herliga london\n"
+            yield "jille sei(1)\n"
+            raise RuntimeError("read too far")
+
+        tokens = tokenize(lines())
+        self.assertEqual(
+            [next(tokens).type for _ in range(6)],
+            [HERLIGA, NEWLINE, JILLE, KEYWORD, PUNCTUATION, NUMBER],
+        )
+
+    def test_dialect(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bergensk.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("js,rogalang\nconsole.log,skriv\n")
+            DIALECTS.register("bergensk", path, cache_dir=tmp)
+            self.addCleanup(DIALECTS.unregister, "bergensk")
+            tokens = significant(tokenize(["jille skriv(sei)\n"], dialect="bergensk"))
+        self.assertEqual(tokens[1], (KEYWORD, "skriv"))
+        self.assertEqual(tokens[3], (IDENTIFIER, "sei"))
+
+    def test_check_camel_case(self):
+        source = ["herliga london\n", "jille konst my_var æ 'a_b'\n"]
+        issues = check_camel_case(tokenize(source))
+        self.assertEqual(len(issues), 1)
+        self.assertEqual(issues[0].line, 2)
+        self.assertIn("'my_var' at column 12", issues[0].message)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,261 @@
+"""
+Tests for the optimizing pass over transpiled JavaScript.
+Run with: python test_optimizer.py
+"""
+
+import os
+import tempfile
+import unittest
+from jstokens import tokenize_js
+from optimizer import compact_branch_chains, fold_constants, optimize
+from transpile_cache import TranspileCache
+from transpiler import TranspileStats, transpile_file
+
+LADDER = """function f(x) {
+    if (x === 1) {
+        return 'a'
+    }
+    if (x === 2) {
+        return 'b'
+    }
+    if (3 === x) {
+        throw new Error('c')
+    }
+    return 'd'
+}
+"""
+
+
+class TestTokenize(unittest.TestCase):
+    """Test splitting JavaScript into tokens."""
+
+    def assertTokens(self, js, expected):
+        tokens = tokenize_js(js)
+        self.assertEqual("".join(token.text for token in tokens), js)
+        self.assertEqual(
+            [(t.kind, t.text) for t in tokens if t.kind not in ("ws", "newline")],
+            expected,
+        )
+
+    def test_template_expressions(self):
+        self.assertTokens(
+            "`a ${ {b: 1}.b } c ${`d${e}`}`",
+            [
+                ("template", "`a ${"),
+                ("punct", "{"),
+                ("ident", "b"),
+                ("punct", ":"),
+                ("number", "1"),
+                ("punct", "}"),
+                ("punct", "."),
+                ("ident", "b"),
+                ("template", "} c ${"),
+                ("template", "`d${"),
+                ("ident", "e"),
+                ("template", "}`"),
+                ("template", "}`"),
+            ],
+        )
+
+    def test_regex_or_division(self):
+        self.assertTokens(
+            "a / 2 / b; x = /'+/g",
+            [
+                ("ident", "a"),
+                ("punct", "/"),
+                ("number", "2"),
+                ("punct", "/"),
+                ("ident", "b"),
+                ("punct", ";"),
+                ("ident", "x"),
+                ("punct", "="),
+                ("regex", "/'+/g"),
+            ],
+        )
+
+    def test_comments_and_strings(self):
+        self.assertTokens(
+            "'1 + 2' // 3 + 4\n/* 5 */ \"6\"",
+            [
+                ("string", "'1 + 2'"),
+                ("comment", "// 3 + 4"),
+                ("comment", "/* 5 */"),
+                ("string", '"6"'),
+            ],
+        )
+
+
+class TestFoldConstants(unittest.TestCase):
+    """Test folding constant expressions."""
+
+    def test_arithmetic(self):
+        self.assertEqual(fold_constants("a = 2 * 3 + 1"), "a = 7")
+        self.assertEqual(fold_constants("a = (1 - 4) * 2 ** 3"), "a = -24")
+        self.assertEqual(fold_constants("a = 1 / 4 + 7 % 4"), "a = 3.25")
+        self.assertEqual(fold_constants("a = 0.1 + 0.2"), "a = 0.30000000000000004")
+        self.assertEqual(fold_constants("f(1 + 2, [3 * 4])"), "f(3, [12])")
+
+    def test_strings(self):
+        self.assertEqual(fold_constants("a = 'x' + 'y' + b"), "a = 'xy' + b")
+        self.assertEqual(fold_constants('a = "x" + "y"'), 'a = "xy"')
+        # Mixed quotes and numbers would need their contents converted
+        self.assertEqual(fold_constants("a = 'x' + \"y\""), "a = 'x' + \"y\"")
+        self.assertEqual(fold_constants("a = 'x' + 1"), "a = 'x' + 1")
+
+    def test_escaped_strings_are_kept(self):
+        for js in [
+            r"a = '\1' + '2'",
+            r"a = '\0' + '1'",
+            r"a = 'x' + '\n'",
+            r"a = '\\' + 'y'",
+        ]:
+            with self.subTest(js=js):
+                self.assertEqual(fold_constants(js), js)
+
+    def test_template_expressions(self):
+        self.assertEqual(
+            fold_constants("console.log(`${2 + 2} ${'a' + 'b'}`)"),
+            "console.log(`${4} ${'ab'}`)",
+        )
+
+    def test_left_operand_is_folded(self):
+        self.assertEqual(fold_constants("a = 1 + 2 + b"), "a = 3 + b")
+        self.assertEqual(fold_constants("a = 2 ** 3 - b"), "a = 8 - b")
+
+    def test_tighter_neighbours_are_kept(self):
+        for js in [
+            "a = 1 + 2 * b",
+            "a = b * 2 + 3",
+            "a = b - 1 + 2",
+            "a = 1 + 2 .toFixed()",
+            "a = 1 + 2[0]",
+            "a = typeof 1 + 2",
+            "a = !1 + 2",
+            "a = 1 + 2\n* 3",
+            "a = 1 + 2\n(b)",
+            "a = /x/ + 1 + 2",
+        ]:
+            with self.subTest(js=js):
+                self.assertEqual(fold_constants(js), js)
+
+    def test_asi(self):
+        self.assertEqual(fold_constants("a = 1 + 2\nb()"), "a = 3\nb()")
+
+    def test_unsafe_numbers_are_kept(self):
+        for js in ["a = 1 / 0", "a = 2 ** 0.5", "a = 0x10 + 1", "a = 08 + 1"]:
+            with self.subTest(js=js):
+                self.assertEqual(fold_constants(js), js)
+
+    def test_keeps_tokens_apart(self):
+        self.assertEqual(fold_constants("return(1 + 2) * 3"), "return 9")
+        self.assertEqual(fold_constants("a = (1 - 4) ** b"), "a = (-3) ** b")
+
+
+class TestCompactBranchChains(unittest.TestCase):
+    """Test turning if-ladders into switch statements."""
+
+    def test_returning_ladder(self):
+        self.assertEqual(
+            compact_branch_chains(LADDER),
+            """function f(x) {
+    switch (x) { case 1: {
+        return 'a'
+    }
+    case 2: {
+        return 'b'
+    }
+    case 3: {
+        throw new Error('c')
+    } }
+    return 'd'
+}
+""",
+        )
+
+    def test_else_chain(self):
+        self.assertEqual(
+            compact_branch_chains(
+                "if (x === 'a') { f() } else if (x === 'b') { return } "
+                "else if (x === 'c') { g() } else { h() }"
+            ),
+            "switch (x) { case 'a': { f() } break; case 'b': { return } "
+            "case 'c': { g() } break; default: { h() } }",
+        )
+
+    def test_unsafe_ladders_are_kept(self):
+        for js in [
+            # == converts its operands, switch does not
+            LADDER.replace("===", "=="),
+            # The body does not leave, so the next if runs as well
+            LADDER.replace("return 'a'", "a()"),
+            # A break would leave the switch instead of the loop
+            LADDER.replace("return 'a'", "break"),
+            # Too short
+            "if (x === 1) { a() } else if (x === 2) { b() }",
+            # Another variable
+            LADDER.replace("3 === x", "3 === y"),
+            # An else if the switch cannot hold
+            "if (x === 1) { a() } else if (x === 2) { b() } "
+            "else if (x === 3) { c() } else if (y) { d() }",
+            # The body of a loop
+            "while (a) if (x === 1) { return } if (x === 2) { return } "
+            "if (x === 3) { return }",
+        ]:
+            with self.subTest(js=js):
+                self.assertEqual(compact_branch_chains(js), js)
+
+    def test_keeps_lines(self):
+        optimized = optimize(LADDER)
+        self.assertEqual(optimized.count("\n"), LADDER.count("\n"))
+
+    def test_nested_ladders(self):
+        inner = "if (y === 1) { return 1 } if (y === 2) { return 2 } if (y === 3) { return 3 }"
+        js = (
+            f"if (x === 1) {{ {inner} }} else if (x === 2) {{ b() }} "
+            "else if (x === 3) { c() }"
+        )
+        self.assertEqual(
+            compact_branch_chains(js),
+            "switch (x) { case 1: { switch (y) { case 1: { return 1 } "
+            "case 2: { return 2 } case 3: { return 3 } } } break; "
+            "case 2: { b() } break; case 3: { c() } }",
+        )
+
+
+class TestTranspileFileOptimize(unittest.TestCase):
+    """Test optimizing whole transpiled files."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, "a.rl")
+        self.output = os.path.join(self.tmp.name, "a.js")
+        with open(self.source, "w", encoding="utf-8") as f:
+            f.write("herliga london\njille konst a æ 2 gange me 3\n")
+
+    def read_output(self):
+        with open(self.output, encoding="utf-8") as f:
+            return f.read()
+
+    def test_optimize(self):
+        stats = TranspileStats()
+        transpile_file(self.source, self.output, stats=stats, optimize=True)
+        self.assertEqual(self.read_output(), "const a = 6\n")
+        self.assertGreater(stats.seconds["optimize"], 0)
+
+    def test_cache_keeps_optimized_output_apart(self):
+        cache = TranspileCache(os.path.join(self.tmp.name, "cache"))
+        transpile_file(self.source, self.output, cache, optimize=True)
+        transpile_file(self.source, self.output, cache)
+        self.assertEqual(self.read_output(), "const a = 2 * 3\n")
+        transpile_file(self.source, self.output, cache, optimize=True)
+        self.assertEqual(self.read_output(), "const a = 6\n")
+        self.assertEqual(cache.hits, 1)
+
+    def test_source_map(self):
+        with self.assertRaisesRegex(ValueError, "source map"):
+            transpile_file(self.source, self.output, source_map="inline", optimize=True)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,78 @@
+"""
+Tests for transpiling a single file in parallel.
+Run with: python test_parallel.py
+"""
+
+import os
+import tempfile
+import unittest
+from benchmarks.corpus import CorpusGenerator
+from parallel import ParallelTranspiler, iter_chunks
+from transpiler import TranspileStats, transpile_stream
+
+SOURCE = (
+    ["herliga london\n", "jille konst a æ 1\n", "jille sei(`start\n"]
+    + ["herliga london\n", "jille midten ${a}\n"]
+    + ["herliga london\n", "jille slutt`)\n", "jille sei(a)\n"]
+)
+
+
+class TestParallelTranspiler(unittest.TestCase):
+    """Test that parallel output matches transpiling in one process."""
+
+    def test_matches_stream(self):
+        lines = list(CorpusGenerator(template_depth=3, seed=1).lines(200_000))
+        transpiler = ParallelTranspiler(jobs=2, chunk_size=4096)
+        self.assertEqual(
+            "".join(transpiler.transpile_stream(lines)),
+            "".join(transpile_stream(lines)),
+        )
+
+    def test_template_open_at_split_points(self):
+        # Every segment is a chunk of its own
+        transpiler = ParallelTranspiler(jobs=2, chunk_size=1)
+        self.assertEqual(
+            "".join(transpiler.transpile_stream(SOURCE)),
+            "".join(transpile_stream(SOURCE)),
+        )
+        unclosed = SOURCE[:3] + SOURCE[3:5]
+        self.assertEqual(
+            "".join(transpiler.transpile_stream(unclosed)),
+            "".join(transpile_stream(unclosed)),
+        )
+
+    def test_validation_error(self):
+        transpiler = ParallelTranspiler(jobs=2, chunk_size=1)
+        lines = SOURCE + ["kommentar\n"] * 11 + ["herliga london\n"]
+        with self.assertRaisesRegex(ValueError, "Gap of 14 lines"):
+            "".join(transpiler.transpile_stream(lines))
+
+    def test_stats(self):
+        stats = TranspileStats()
+        transpiler = ParallelTranspiler(jobs=2, chunk_size=1)
+        "".join(transpiler.transpile_stream(SOURCE, stats))
+        # The first chunk, the second and third transpiled again and
+        # neither reused from the workers
+        self.assertEqual(stats.transpilations, 2)
+        self.assertEqual(stats.replacements["konst"], 1)
+        self.assertEqual(stats.replacements["sei"], 2)
+
+    def test_transpile_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "a.rl")
+            output = os.path.join(tmp, "a.js")
+            with open(source, "w", encoding="utf-8") as f:
+                f.writelines(SOURCE)
+            ParallelTranspiler(jobs=2, chunk_size=1).transpile_file(source, output)
+            with open(output, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "".join(transpile_stream(SOURCE)))
+
+    def test_chunks(self):
+        self.assertEqual(
+            list(iter_chunks(SOURCE, chunk_size=20)),
+            ["konst a æ 1\nsei(`start\n", "midten ${a}\nslutt`)\nsei(a)\n"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
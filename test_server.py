@@ -0,0 +1,185 @@
+"""
+Tests for the transpile server.
+Run with: python test_server.py
+"""
+
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from server import TranspileServer, percentile
+from transpiler import DIALECTS
+
+SOURCE = "herliga london\njille konst a æ 'hei'\njille sei(a)\n"
+
+
+class TestTranspileServer(unittest.TestCase):
+    """Test answering NDJSON requests."""
+
+    def setUp(self):
+        self.server = TranspileServer(max_workers=4)
+        self.addCleanup(self.server.close)
+
+    def serve(self, *requests):
+        input = io.StringIO(
+            "".join(
+                (r if isinstance(r, str) else json.dumps(r)) + "\n" for r in requests
+            )
+        )
+        output = io.StringIO()
+        self.server.serve_stream(input, output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        return {response["id"]: response for response in responses}
+
+    def test_source_and_code(self):
+        responses = self.serve(
+            {"id": 1, "source": SOURCE}, {"id": 2, "code": "konst b æ 2"}
+        )
+        self.assertEqual(
+            responses[1],
+            {"id": 1, "ok": True, "js": "const a = 'hei'\nconsole.log(a)\n"},
+        )
+        self.assertEqual(responses[2], {"id": 2, "ok": True, "js": "const b = 2"})
+
+    def test_errors(self):
+        responses = self.serve(
+            {"id": "a", "source": "jille sei(a)\n"},
+            {"id": "b"},
+            {"id": "c", "command": "reload"},
+            "{not json",
+            "[1, 2]",
+        )
+        self.assertEqual(
+            responses["a"]["error"], "No 'herliga london' found in source file"
+        )
+        self.assertIn("'source' or 'code'", responses["b"]["error"])
+        self.assertIn("Unknown command", responses["c"]["error"])
+        self.assertFalse(responses[None]["ok"])
+        self.assertEqual(self.server.errors, 5)
+
+    def test_unexpected_errors_are_answered(self):
+        with mock.patch.object(
+            self.server.transpiler, "transpile", side_effect=RuntimeError("kaputt")
+        ):
+            responses = self.serve({"id": 1, "code": "sei(1)"})
+        self.assertEqual(
+            responses[1], {"id": 1, "ok": False, "error": "RuntimeError: kaputt"}
+        )
+        self.assertEqual(self.server.errors, 1)
+
+    def test_serve_unix_keeps_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rogalang.sock")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("viktig")
+            with self.assertRaisesRegex(FileExistsError, "not a socket"):
+                self.server.serve_unix(path)
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "viktig")
+
+    def test_serve_unix_keeps_live_server(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rogalang.sock")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as live:
+                live.bind(path)
+                live.listen()
+                with self.assertRaisesRegex(FileExistsError, "already listening"):
+                    self.server.serve_unix(path)
+            self.assertTrue(os.path.exists(path))
+
+    def test_serve_unix_replaces_stale_socket(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rogalang.sock")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+                stale.bind(path)
+            with mock.patch("socketserver.BaseServer.serve_forever") as serve:
+                self.server.serve_unix(path)
+            serve.assert_called_once()
+
+    def test_slow_client_does_not_block_workers(self):
+        server = TranspileServer(max_workers=1)
+        self.addCleanup(server.close)
+        release = threading.Event()
+        # Finish requests on the worker, after the server waits for them
+        handle_line = server.handle_line
+        server.handle_line = lambda *args: time.sleep(0.05) or handle_line(*args)
+
+        class SlowOutput(io.StringIO):
+            def write(self, text):
+                release.wait(30)
+                return super().write(text)
+
+        slow_input = io.StringIO(
+            "".join(json.dumps({"id": i, "code": "sei(1)"}) + "\n" for i in range(3))
+        )
+        slow = threading.Thread(
+            target=server.serve_stream, args=(slow_input, SlowOutput())
+        )
+        slow.start()
+        try:
+            output = io.StringIO()
+            fast = threading.Thread(
+                target=server.serve_stream,
+                args=(io.StringIO('{"id": 1, "code": "sei(2)"}\n'), output),
+            )
+            fast.start()
+            fast.join(5)
+            self.assertFalse(fast.is_alive())
+            self.assertEqual(json.loads(output.getvalue())["js"], "console.log(2)")
+        finally:
+            release.set()
+            slow.join()
+
+    def test_many_concurrent_requests(self):
+        requests = [{"id": i, "code": f"sei({i})"} for i in range(200)]
+        responses = self.serve(*requests)
+        self.assertEqual(len(responses), 200)
+        for i in range(200):
+            self.assertEqual(responses[i]["js"], f"console.log({i})")
+
+    def test_stats(self):
+        self.serve(*[{"id": i, "source": SOURCE} for i in range(10)])
+        responses = self.serve({"id": "stats", "command": "stats"})
+        stats = responses["stats"]
+        self.assertEqual(stats["requests"], 10)
+        self.assertEqual(stats["errors"], 0)
+        self.assertGreater(stats["latency_ms"]["p50"], 0)
+        self.assertGreaterEqual(stats["latency_ms"]["p99"], stats["latency_ms"]["p50"])
+        self.assertGreater(stats["memo"]["line"]["hits"], 0)
+
+    def test_profile(self):
+        responses = self.serve({"id": 1, "code": "sei(sei)", "profile": True})
+        self.assertEqual(responses[1]["profile"]["replacements"], {"sei": 2})
+
+    def test_dialect(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bergensk.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("js,rogalang\nconsole.log,skriv\n")
+            DIALECTS.register("bergensk", path, cache_dir=tmp)
+            self.addCleanup(DIALECTS.unregister, "bergensk")
+            responses = self.serve(
+                {"id": 1, "code": "skriv(1)", "dialect": "bergensk"},
+                {"id": 2, "source": SOURCE, "dialect": "bergensk"},
+                {"id": 3, "code": "sei(1)", "dialect": "nynorsk"},
+                {"id": 4, "code": "sei(1)", "dialect": 1},
+            )
+        self.assertEqual(responses[1]["js"], "console.log(1)")
+        self.assertEqual(responses[2]["js"], "konst a æ 'hei'\nsei(a)\n")
+        self.assertEqual(responses[3]["error"], "Unknown dialect: 'nynorsk'")
+        self.assertIn("must be a string", responses[4]["error"])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,149 @@
+"""
+Tests for source map generation.
+Run with: python test_sourcemap.py
+"""
+
+import base64
+import json
+import os
+import tempfile
+import unittest
+from sourcemap import SourceMapBuilder, decode_mappings, encode_vlq
+from transpiler import transpile_file, transpile_stream
+
+SOURCE = [
+    "herliga london\n",
+    "jille konst a æ 1\n",
+    "kommentar\n",
+    "  jille for kvar einaste(b i a) { sei(b) }\n",
+    "jille sei(`start ${a græla likt mæ 1}\n",
+    "herliga london\n",
+    "jille slutt`)\n",
+]
+
+
+def transpile_with_map(lines):
+    builder = SourceMapBuilder("a.rl", "a.js")
+    output = "".join(transpile_stream(lines, source_map=builder))
+    return output, builder.as_dict()
+
+
+class TestVLQ(unittest.TestCase):
+    """Test Base64 VLQ encoding."""
+
+    def test_encode(self):
+        self.assertEqual(encode_vlq(0), "A")
+        self.assertEqual(encode_vlq(1), "C")
+        self.assertEqual(encode_vlq(-1), "D")
+        self.assertEqual(encode_vlq(15), "e")
+        self.assertEqual(encode_vlq(16), "gB")
+        self.assertEqual(encode_vlq(-1000), "x+B")
+
+    def test_decode(self):
+        values = [0, 5, -3, 1000, -70000]
+        mappings = "".join(encode_vlq(value) for value in values[:4])
+        mappings += ";" + encode_vlq(7) + "AAA"
+        self.assertEqual(
+            decode_mappings(mappings), [[(0, 5, -3, 1000)], [(7, 5, -3, 1000)]]
+        )
+
+
+class TestSourceMap(unittest.TestCase):
+    """Test that mappings point at the Rogalang each piece of output came from."""
+
+    def assert_maps_to(self, output, mappings, js, line, column):
+        output_lines = output.split("\n")
+        for gen_line, segments in enumerate(mappings):
+            for gen_col, _, src_line, src_col in segments:
+                if output_lines[gen_line].startswith(js, gen_col):
+                    self.assertEqual((src_line, src_col), (line, column), js)
+                    return
+        self.fail(f"No mapping for {js!r}")
+
+    def test_same_output(self):
+        output, _ = transpile_with_map(SOURCE)
+        self.assertEqual(output, "".join(transpile_stream(SOURCE)))
+
+    def test_fields(self):
+        _, source_map = transpile_with_map(SOURCE)
+        self.assertEqual(source_map["version"], 3)
+        self.assertEqual(source_map["file"], "a.js")
+        self.assertEqual(source_map["sources"], ["a.rl"])
+
+    def test_mappings(self):
+        output, source_map = transpile_with_map(SOURCE)
+        mappings = decode_mappings(source_map["mappings"])
+        self.assert_maps_to(output, mappings, "const", 1, 6)
+        # The comment line is dropped and the indented prefix stripped
+        self.assert_maps_to(output, mappings, "for(", 3, 8)
+        self.assert_maps_to(output, mappings, "(b in a)", 3, 24)
+        self.assert_maps_to(output, mappings, "console.log(b)", 3, 34)
+        # Inside a template expression, and code after a replaced token
+        self.assert_maps_to(output, mappings, "=== 1}", 4, 21)
+        self.assert_maps_to(output, mappings, " 1}", 4, 34)
+        # A template literal spanning two segments
+        self.assert_maps_to(output, mappings, "slutt`)", 6, 6)
+
+    def test_bare_jille_lines(self):
+        source = [
+            "herliga london\n",
+            "jille konst a æ 1\n",
+            "jille\n",
+            "jille sei(a)\n",
+            "jille   \n",
+            "jille konst b æ 2\n",
+        ]
+        output, source_map = transpile_with_map(source)
+        mappings = decode_mappings(source_map["mappings"])
+        self.assert_maps_to(output, mappings, "console.log(a)", 3, 6)
+        self.assert_maps_to(output, mappings, "const b", 5, 6)
+
+    def test_every_line_starts_mapped(self):
+        output, source_map = transpile_with_map(SOURCE)
+        mappings = decode_mappings(source_map["mappings"])
+        for line, segments in zip(output.split("\n"), mappings):
+            if line:
+                self.assertEqual(segments[0][0], 0)
+
+
+class TestTranspileFileSourceMap(unittest.TestCase):
+    """Test writing source maps with transpile_file."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.source = os.path.join(tmp.name, "src", "a.rl")
+        self.output = os.path.join(tmp.name, "a.js")
+        os.makedirs(os.path.dirname(self.source))
+        with open(self.source, "w", encoding="utf-8") as f:
+            f.writelines(SOURCE)
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_inline(self):
+        transpile_file(self.source, self.output, source_map="inline")
+        output = self.read(self.output)
+        code, comment = output.rsplit("\n//# sourceMappingURL=", 1)
+        self.assertEqual(code + "\n", "".join(transpile_stream(SOURCE)))
+        data = comment.split("base64,", 1)[1]
+        source_map = json.loads(base64.b64decode(data))
+        self.assertEqual(source_map["sources"], ["src/a.rl"])
+
+    def test_file(self):
+        transpile_file(self.source, self.output, source_map="file")
+        self.assertTrue(
+            self.read(self.output).endswith("\n//# sourceMappingURL=a.js.map\n")
+        )
+        source_map = json.loads(self.read(self.output + ".map"))
+        self.assertEqual(source_map["file"], "a.js")
+        self.assertEqual(source_map["sources"], ["src/a.rl"])
+
+    def test_unknown_kind(self):
+        with self.assertRaisesRegex(ValueError, "Unknown source map kind"):
+            transpile_file(self.source, self.output, source_map="sidecar")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,106 @@
+"""
+Tests for the transpile cache.
+Run with: python test_transpile_cache.py
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import transpile_cache
+from transpile_cache import TranspileCache
+from transpiler import get_semantics, transpile_file
+
+SOURCE = """herliga london
+jille konst a æ 5
+"""
+
+
+class TestTranspileCache(unittest.TestCase):
+    """Test the content-addressed transpile cache."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = TranspileCache(os.path.join(self.tmp.name, "cache"))
+        self.source = self.path("a.rl")
+        self.write(self.source, SOURCE)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def write(self, path, content):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_miss_then_hit(self):
+        transpile_file(self.source, self.path("first.js"), self.cache)
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 1})
+
+        transpile_file(self.source, self.path("second.js"), self.cache)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1})
+        self.assertEqual(self.read(self.path("second.js")), "const a = 5\n")
+
+    def test_text_entries_are_shared_with_files(self):
+        key = self.cache.key_for_file(self.source, get_semantics().digest)
+        self.assertIsNone(self.cache.get_text(key))
+        transpile_file(self.source, self.path("a.js"), self.cache)
+        self.assertEqual(self.cache.get_text(key), "const a = 5\n")
+
+        self.cache.put_text(key, "const a = 7\n")
+        transpile_file(self.source, self.path("a.js"), self.cache)
+        self.assertEqual(self.read(self.path("a.js")), "const a = 7\n")
+        self.assertEqual(self.cache.stats(), {"hits": 2, "misses": 2})
+
+    def test_changed_source_misses(self):
+        transpile_file(self.source, self.path("a.js"), self.cache)
+        self.write(self.source, SOURCE.replace("5", "6"))
+        transpile_file(self.source, self.path("a.js"), self.cache)
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 2})
+        self.assertEqual(self.read(self.path("a.js")), "const a = 6\n")
+
+    def test_key_depends_on_semantics_and_version(self):
+        digest = get_semantics().digest
+        key = self.cache.key_for_file(self.source, digest)
+        self.assertNotEqual(key, self.cache.key_for_file(self.source, "other"))
+        with mock.patch.object(transpile_cache, "__version__", "0.0.0"):
+            self.assertNotEqual(key, self.cache.key_for_file(self.source, digest))
+
+    def test_validation_errors_are_not_cached(self):
+        self.write(self.source, "jille konst a æ 5\n")
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                transpile_file(self.source, self.path("a.js"), self.cache)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertFalse(os.path.exists(self.path("a.js")))
+
+    def test_prune_evicts_least_recently_used(self):
+        for i in range(3):
+            self.cache.put_file(f"{i:064x}", self.source)
+        entries = [self.cache._entry_path(f"{i:064x}") for i in range(3)]
+        now = time.time()
+        for age, entry in zip((30, 10, 20), entries):
+            os.utime(entry, (now - age, now - age))
+
+        self.cache.max_bytes = 2 * len(SOURCE.encode("utf-8"))
+        self.assertEqual(self.cache.prune(), 1)
+        self.assertEqual(
+            [os.path.exists(entry) for entry in entries], [False, True, True]
+        )
+
+    def test_hit_refreshes_entry(self):
+        key = f"{1:064x}"
+        self.cache.put_file(key, self.source)
+        entry = self.cache._entry_path(key)
+        os.utime(entry, (0, 0))
+        self.assertTrue(self.cache.get_file(key, self.path("a.js")))
+        self.assertGreater(os.stat(entry).st_mtime, 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
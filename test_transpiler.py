@@ -3,13 +3,40 @@ Comprehensive test suite for the Rogalang transpiler.
 Run with: python test_transpiler.py
 """
 
+import json
+import os
+import tempfile
 import unittest
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 from transpiler import (
+    DialectRegistry,
+    transpile_batch,
     transpile_rogalang,
+    transpile_stream,
     validate_and_preprocess_rogalang,
+    find_open_template,
+    find_carry_start,
+    get_semantics,
+    DEFAULT_TRANSPILER,
+    TemplateCarry,
+    scan_rogalang,
+    parse_semantics_csv,
+    DIALECTS,
+    SemanticsRegistry,
+    SEMANTICS_PATH,
+    Semantics,
     StringLiteral,
-    STRING_LITERALS,
+    Transpiler,
+    TranspileMemo,
+    TranspileStats,
+    ValidationError,
+    iter_file_lines,
+    iter_validated_lines,
+    validate_file,
 )
+from sourcemap import SourceMapBuilder
 
 
 class TestBasicTokenReplacement(unittest.TestCase):
@@ -101,6 +128,216 @@ class TestDelimiterChecking(unittest.TestCase):
         )  # "konst" between brackets should be replaced
 
 
+class TestSemanticsRegex(unittest.TestCase):
+    """Test the single-pass token matcher."""
+
+    def test_longest_token_wins(self):
+        result = transpile_rogalang("a græla likt mæ b likt mæ c", _reset_state=True)
+        self.assertEqual(result, "a === b == c")
+
+    def test_longer_token_with_shared_prefix(self):
+        result = transpile_rogalang("i aog mæ ein", _reset_state=True)
+        self.assertEqual(result, "in ++")
+
+    def test_replacements_are_not_rescanned(self):
+        # "aog mæ " is not delimited in the source, so it must not be
+        # replaced just because the next token turned into "??="
+        result = transpile_rogalang("a aog mæ njaast mæ b", _reset_state=True)
+        self.assertEqual(result, "a aog mæ ??= b")
+
+
+class TestSemanticsRegistry(unittest.TestCase):
+    """Test loading and caching of the semantics table."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def test_parse_skips_rows_without_translation(self):
+        table = parse_semantics_csv(
+            "js,rogalang,comment\nconst,konst\n,herliga london\nnull,inkje\n"
+        )
+        self.assertEqual(table, {"konst": "const", "inkje": "null"})
+
+    def test_loads_without_cache(self):
+        semantics = SemanticsRegistry(cache_dir=self.cache_dir.name).get()
+        self.assertEqual(semantics.table["konst"], "const")
+        self.assertEqual(semantics.replace_tokens("konst a æ 5"), "const a = 5")
+
+    def test_reuses_cached_artifact(self):
+        SemanticsRegistry(cache_dir=self.cache_dir.name).get()
+        artifacts = os.listdir(self.cache_dir.name)
+        self.assertEqual(len(artifacts), 1)
+
+        semantics = SemanticsRegistry(cache_dir=self.cache_dir.name).get()
+        self.assertEqual(os.listdir(self.cache_dir.name), artifacts)
+        self.assertEqual(semantics.replace_tokens("viss(a)"), "if(a)")
+
+    def test_artifact_is_keyed_by_csv_contents(self):
+        with open(SEMANTICS_PATH, encoding="utf-8") as f:
+            data = f.read()
+        path = os.path.join(self.cache_dir.name, "semantics.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data + "let,lat som\n")
+
+        SemanticsRegistry(cache_dir=self.cache_dir.name).get()
+        semantics = SemanticsRegistry(path, cache_dir=self.cache_dir.name).get()
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 3)
+        self.assertEqual(semantics.replace_tokens("lat som a"), "let a")
+
+    def test_corrupt_artifact_is_rebuilt(self):
+        registry = SemanticsRegistry(cache_dir=self.cache_dir.name)
+        registry.get()
+        (artifact,) = os.listdir(self.cache_dir.name)
+        with open(os.path.join(self.cache_dir.name, artifact), "wb") as f:
+            f.write(b"garbage")
+
+        semantics = SemanticsRegistry(cache_dir=self.cache_dir.name).get()
+        self.assertEqual(semantics.table["sei"], "console.log")
+
+    def test_artifact_is_json(self):
+        SemanticsRegistry(cache_dir=self.cache_dir.name).get()
+        (artifact,) = os.listdir(self.cache_dir.name)
+        path = os.path.join(self.cache_dir.name, artifact)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(data["table"]["sei"], "console.log")
+
+        # An artifact of the wrong shape is rebuilt rather than used
+        data["table"]["sei"] = ["console.log"]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        semantics = SemanticsRegistry(cache_dir=self.cache_dir.name).get()
+        self.assertEqual(semantics.table["sei"], "console.log")
+
+
+class TestDialects(unittest.TestCase):
+    """Test hot-reloading dialects and picking one per call."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "bergensk.csv")
+        self.write("console.log,skriv\n")
+        self.registry = DialectRegistry()
+        self.registry.register("bergensk", self.path, cache_dir=self.dir.name)
+        self.addCleanup(self.registry.stop)
+
+    def write(self, rows):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("js,rogalang\n" + rows)
+        # Make sure the change is seen on file systems with coarse mtimes
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def register_globally(self):
+        DIALECTS.register("bergensk", self.path, cache_dir=self.dir.name)
+        self.addCleanup(DIALECTS.unregister, "bergensk")
+
+    def test_get(self):
+        self.assertEqual(self.registry.get("bergensk").table, {"skriv": "console.log"})
+        self.assertEqual(self.registry.get().table["sei"], "console.log")
+        self.assertEqual(self.registry.names(), ["default", "bergensk"])
+        with self.assertRaisesRegex(ValueError, "Unknown dialect"):
+            self.registry.get("nynorsk")
+
+    def test_reload_changed(self):
+        old = self.registry.get("bergensk")
+        self.assertEqual(self.registry.reload(), [])
+        self.write("console.error,skriv\nconst,konst\n")
+        self.assertEqual(self.registry.reload(), ["bergensk"])
+        new = self.registry.get("bergensk")
+        self.assertEqual(new.replace_tokens("konst skriv"), "const console.error")
+        # Holders of the old semantics are not affected
+        self.assertEqual(old.replace_tokens("konst skriv"), "konst console.log")
+
+    def test_failed_reload_keeps_semantics(self):
+        self.registry.get("bergensk")
+        self.write("")
+        self.assertEqual(self.registry.reload(), [])
+        self.assertIn("bergensk", self.registry.errors)
+        self.assertEqual(self.registry.get("bergensk").table, {"skriv": "console.log"})
+        self.write("console.warn,skriv\n")
+        self.assertEqual(self.registry.reload(), ["bergensk"])
+        self.assertEqual(self.registry.errors, {})
+
+    def test_failed_reload_is_retried(self):
+        registry = SemanticsRegistry(self.path, cache_dir=self.dir.name)
+        registry.get()
+        self.write("")
+        with self.assertRaises(ValueError):
+            registry.reload()
+        # The broken CSV is still stale, so the next check tries it again
+        self.assertTrue(registry.is_stale())
+        self.write("console.warn,skriv\n")
+        self.assertTrue(registry.reload())
+        self.assertFalse(registry.is_stale())
+
+    def test_default_can_be_replaced(self):
+        with mock.patch("transpiler.DIALECTS", self.registry):
+            self.registry.register("default", self.path, cache_dir=self.dir.name)
+            self.assertEqual(get_semantics().table, {"skriv": "console.log"})
+            self.write("console.error,skriv\n")
+            self.assertEqual(self.registry.reload(), ["default"])
+            self.assertEqual(get_semantics().table, {"skriv": "console.error"})
+
+    def test_watch(self):
+        self.registry.get("bergensk")
+        self.registry.watch(0.01)
+        self.write("console.error,skriv\n")
+        deadline = time.monotonic() + 5
+        while self.registry.get("bergensk").table["skriv"] != "console.error":
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.registry.stop()
+
+    def test_per_call_dialect(self):
+        self.register_globally()
+        transpiler = Transpiler(memo=TranspileMemo())
+        self.assertEqual(transpiler.transpile("skriv(1)"), "skriv(1)")
+        self.assertEqual(
+            transpiler.transpile("skriv(1)", dialect="bergensk"), "console.log(1)"
+        )
+        self.assertEqual(
+            transpile_batch(["skriv", "sei"], dialect="bergensk"),
+            ["console.log", "sei"],
+        )
+        # Every dialect has its own memo, so they do not evict each other
+        self.assertEqual(transpiler.transpile("skriv(1)"), "skriv(1)")
+        self.assertEqual(transpiler.memo.stats()["line"]["hits"], 1)
+        with self.assertRaisesRegex(ValueError, "Unknown dialect"):
+            transpiler.transpile("sei", dialect="nynorsk")
+
+    def test_stream_keeps_its_snapshot(self):
+        self.register_globally()
+        source = ["herliga london\n", "jille skriv(1)\n", "herliga london\n"]
+        source += ["jille skriv(2)\n"]
+        chunks = transpile_stream(source, dialect="bergensk")
+        self.assertEqual(next(chunks), "console.log(1)\n")
+        self.write("console.error,skriv\n")
+        self.assertEqual(DIALECTS.reload(), ["bergensk"])
+        self.assertEqual(list(chunks), ["console.log(2)\n"])
+        self.assertEqual(
+            "".join(transpile_stream(source, dialect="bergensk")),
+            "console.error(1)\nconsole.error(2)\n",
+        )
+
+    def test_memo_ignores_other_digests(self):
+        memo = TranspileMemo()
+        old = self.registry.get("bergensk")
+        memo.bind(old)
+        memo.put("line", "skriv", "console.log", old.digest)
+        self.write("console.error,skriv\n")
+        self.registry.reload()
+        new = self.registry.get("bergensk")
+        memo.bind(new)
+        # A transpilation still using the old semantics can neither read
+        # nor fill the memo of the new ones
+        memo.put("line", "skriv", "console.log", old.digest)
+        self.assertIsNone(memo.get("line", "skriv", old.digest))
+        self.assertIsNone(memo.get("line", "skriv", new.digest))
+
+
 class TestHerligaLondonValidation(unittest.TestCase):
     """Test validation of 'herliga london' requirements."""
 
@@ -144,6 +381,76 @@ class TestHerligaLondonValidation(unittest.TestCase):
         self.assertIn("more than 10 lines from end", str(ctx.exception))
 
 
+class TestSinglePassValidation(unittest.TestCase):
+    """Test collecting every validation issue in one pass."""
+
+    INVALID = (
+        ["jille a\n", "herliga london\n"]
+        + ["jille x\n"] * 12
+        + ["herliga london\n", "jille b\n"]
+        + ["kommentar\n"] * 12
+    )
+
+    def test_collects_every_issue(self):
+        with self.assertRaises(ValidationError) as ctx:
+            list(iter_validated_lines(self.INVALID))
+        self.assertEqual(
+            [(issue.line, issue.message) for issue in ctx.exception.issues],
+            [
+                (1, "First line must be 'herliga london'"),
+                (13, "Gap of 13 lines between 'herliga london' at lines 2 and 15"),
+                (
+                    26,
+                    "Last 'herliga london' at line 15 is more than 10 lines from end",
+                ),
+            ],
+        )
+        self.assertIsInstance(ctx.exception, ValueError)
+
+    def test_fail_fast(self):
+        lines = iter_validated_lines(self.INVALID[1:], fail_fast=True)
+        self.assertEqual(next(lines), "x\n")
+        with self.assertRaises(ValidationError) as ctx:
+            list(lines)
+        self.assertEqual(len(ctx.exception.issues), 1)
+        self.assertIn("Gap of 13 lines", str(ctx.exception))
+
+    def test_missing_herliga_london(self):
+        for fail_fast in (False, True):
+            with self.assertRaises(ValidationError) as ctx:
+                list(iter_validated_lines(["jille a\n", "b\n"], fail_fast))
+            self.assertEqual(
+                str(ctx.exception), "line 1: No 'herliga london' found in source file"
+            )
+
+    def test_yields_same_lines_as_preprocessor(self):
+        lines = [
+            "herliga london\n",
+            "jille konst a æ 5\n",
+            "  jille\tsei(a)\n",
+            "kommentar\n",
+            "herliga london\n",
+            "jille konst b æ 10",
+        ]
+        self.assertEqual(
+            list(iter_validated_lines(lines)), validate_and_preprocess_rogalang(lines)
+        )
+
+    def test_memory_mapped_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.rl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(self.INVALID)
+            self.assertEqual(list(iter_file_lines(path)), self.INVALID)
+            self.assertEqual(len(validate_file(path)), 3)
+            self.assertEqual(len(validate_file(path, fail_fast=True)), 1)
+
+            empty = os.path.join(tmp, "empty.rl")
+            open(empty, "w").close()
+            self.assertEqual(list(iter_file_lines(empty)), [])
+            self.assertIn("No 'herliga london'", validate_file(empty)[0].message)
+
+
 class TestJillePrefix(unittest.TestCase):
     """Test jille prefix removal and line filtering."""
 
@@ -168,6 +475,112 @@ class TestJillePrefix(unittest.TestCase):
         self.assertEqual(result, ["konst a æ 5\n"])
 
 
+class TestTranspileStream(unittest.TestCase):
+    """Test the segment-at-a-time streaming pipeline."""
+
+    def test_matches_whole_file_transpilation(self):
+        lines = [
+            "herliga london\n",
+            "jille konst a æ ['hello', 'world']\n",
+            "a comment\n",
+            "herliga london\n",
+            "jille for kvar einaste(b i a) {\n",
+            "    jille sei(b)\n",
+            "jille }\n",
+        ]
+        expected = transpile_rogalang(
+            "".join(validate_and_preprocess_rogalang(lines)), _reset_state=True
+        )
+        self.assertEqual("".join(transpile_stream(lines)), expected)
+
+    def test_yields_one_chunk_per_segment(self):
+        lines = [
+            "herliga london\n",
+            "jille konst a æ 1\n",
+            "herliga london\n",
+            "herliga london\n",
+            "jille konst b æ 2\n",
+        ]
+        self.assertEqual(
+            list(transpile_stream(lines)), ["const a = 1\n", "const b = 2\n"]
+        )
+
+    def test_template_literal_spanning_segments(self):
+        lines = [
+            "herliga london\n",
+            "jille sei(`first konst\n",
+            "herliga london\n",
+            "jille second ${a aog mæ  b}`)\n",
+            "jille konst c æ 1\n",
+        ]
+        chunks = list(transpile_stream(lines))
+        self.assertEqual(chunks[0], "console.log(")
+        self.assertEqual(
+            "".join(chunks),
+            "console.log(`first konst\nsecond ${a + b}`)\nconst c = 1\n",
+        )
+
+    def test_output_starts_before_input_is_read(self):
+        def lines():
+            yield "herliga london\n"
+            yield "jille konst a æ 1\n"
+            yield "herliga london\n"
+            raise AssertionError("read too far")
+
+        self.assertEqual(next(transpile_stream(lines())), "const a = 1\n")
+
+    def test_validation_errors(self):
+        cases = [
+            (["jille x\n"], "No 'herliga london' found"),
+            (["jille x\n", "herliga london\n"], "First line must be"),
+            (["herliga london\n"] + ["jille x\n"] * 11, "more than 10 lines"),
+            (
+                ["herliga london\n"] + ["jille x\n"] * 11 + ["herliga london\n"],
+                "Gap of 12 lines",
+            ),
+        ]
+        for lines, message in cases:
+            with self.subTest(message=message):
+                with self.assertRaises(ValueError) as ctx:
+                    list(transpile_stream(lines))
+                self.assertIn(message, str(ctx.exception))
+
+    def test_find_open_template(self):
+        self.assertIsNone(find_open_template("sei(`done`)"))
+        self.assertIsNone(find_open_template("sei('`')"))
+        self.assertEqual(find_open_template("a `x ${`y`} z"), 2)
+        self.assertEqual(find_open_template("a `x ${b"), 2)
+
+    def test_find_carry_start(self):
+        semantics = DEFAULT_TRANSPILER.semantics
+        self.assertIsNone(find_carry_start("sei(`done`)", semantics))
+        self.assertEqual(find_carry_start("a(`x ${b", semantics), 2)
+        # 'KLASSE' would be delimited by the split, but not by the backtick
+        self.assertEqual(find_carry_start("'a' b KLASSE`${c", semantics), 3)
+
+    def test_template_never_closed_matches_whole_file(self):
+        lines = [
+            "herliga london\n",
+            "jille konst a æ KLASSE`${b\n",
+            "herliga london\n",
+            "jille sei(a)\n",
+        ]
+        whole = transpile_rogalang("".join(validate_and_preprocess_rogalang(lines)))
+        self.assertEqual("".join(transpile_stream(lines)), whole)
+        self.assertIn("KLASSE`${b", whole)
+
+    def test_open_template_is_rescanned_once_doubled(self):
+        carry = TemplateCarry(DEFAULT_TRANSPILER.semantics)
+        self.assertEqual(carry.feed("sei(`" + "a" * 10 + "\n"), "sei(")
+        # Closed, but held until the carried code has doubled
+        self.assertEqual(carry.feed("`)\n"), "")
+        self.assertEqual(
+            carry.feed("b" * 10 + "\n"), "`" + "a" * 10 + "\n`)\n" + "b" * 10 + "\n"
+        )
+        self.assertFalse(carry)
+        self.assertEqual(carry.finish(), "")
+
+
 class TestComplexExamples(unittest.TestCase):
     """Test realistic, complex code examples."""
 
@@ -236,6 +649,41 @@ class TestEdgeCases(unittest.TestCase):
         result = transpile_rogalang(code, _reset_state=True)
         self.assertEqual(result, expected)
 
+    def test_token_before_closing_parenthesis(self):
+        result = transpile_rogalang("sei(forrektigt)", _reset_state=True)
+        self.assertEqual(result, "console.log(true)")
+
+    def test_code_delimiters_inside_strings_preserved(self):
+        code = "konst a æ 'a.(b.) c_) d'"
+        expected = "const a = 'a.(b.) c_) d'"
+        result = transpile_rogalang(code, _reset_state=True)
+        self.assertEqual(result, expected)
+
+    def test_string_literal_str(self):
+        self.assertEqual(str(StringLiteral("'konst'")), "'konst'")
+        self.assertEqual(
+            str(StringLiteral("`${a græla likt mæ b} og ${inkje}`")),
+            "`${a === b} og ${null}`",
+        )
+
+    def test_string_literal_offsets(self):
+        source = "sei(`x ${konst} y ${z + 'w'}`)"
+        scan = scan_rogalang(source)
+        start, end, expressions = scan.items[1]
+        self.assertEqual((start, end), (4, 29))
+        # The code inside the expressions as offset pairs into source, the
+        # quoted string is literal text
+        self.assertEqual(
+            [source[expressions[i] : expressions[i + 1]] for i in (0, 2)],
+            ["konst", "z + "],
+        )
+        literal = StringLiteral(source, None, expressions, start, end)
+        self.assertEqual(literal.content, "`x ${konst} y ${z + 'w'}`")
+        self.assertTrue(literal.is_template)
+        self.assertEqual(str(literal), "`x ${const} y ${z + 'w'}`")
+        self.assertFalse(hasattr(literal, "__dict__"))
+        self.assertEqual(str(StringLiteral(source, start=start, end=end)), str(literal))
+
     def test_parentheses_escaping(self):
         # Test the _) hack for parentheses
         code = "sei(test)"
@@ -359,6 +807,32 @@ console.log(doubleEscaped)"""
         result = transpile_rogalang(code, _reset_state=True)
         self.assertEqual(result, expected)
 
+    def test_very_deeply_nested_template_literals(self):
+        """Nesting is limited by memory, not by the recursion limit."""
+        depth = 2000
+        code = "konst deep æ " + "`${" * depth + "a aog mæ  b" + "}`" * depth
+        expected = "const deep = " + "`${" * depth + "a + b" + "}`" * depth
+        result = transpile_rogalang(code, _reset_state=True)
+        self.assertEqual(result, expected)
+
+    def test_braces_inside_template_expression(self):
+        code = "sei(`${ {a: konst}.a } og ${(arbeidskar() { spytt ud 1 })()}`)"
+        expected = "console.log(`${ {a: const}.a } og ${(function() { return 1 })()}`)"
+        result = transpile_rogalang(code, _reset_state=True)
+        self.assertEqual(result, expected)
+
+    def test_backticks_are_not_greedy(self):
+        code = "sei(`a`) konst b æ `b`"
+        expected = "console.log(`a`) const b = `b`"
+        result = transpile_rogalang(code, _reset_state=True)
+        self.assertEqual(result, expected)
+
+    def test_unclosed_template_literal_is_code(self):
+        code = "konst a æ ` konst 'x' konst"
+        expected = "const a = ` const 'x' const"
+        result = transpile_rogalang(code, _reset_state=True)
+        self.assertEqual(result, expected)
+
     def test_template_with_all_operator_types(self):
         """Test template literals containing various Rogalang operators."""
         code = """konst test æ `
@@ -432,5 +906,294 @@ class TestStateIsolation(unittest.TestCase):
         self.assertEqual(result1, result2)
 
 
+class TestTranspiler(unittest.TestCase):
+    """Test the re-entrant Transpiler object."""
+
+    CODES = [
+        "konst a æ 'first'",
+        "sei(`sum: ${a aog mæ  b}`)",
+        "viss(x græla likt mæ 'y') {}",
+        "konst b æ [`${c}`, 'd']",
+    ] * 25
+
+    def test_transpile_matches_function(self):
+        transpiler = Transpiler()
+        for code in self.CODES[:4]:
+            self.assertEqual(
+                transpiler.transpile(code), transpile_rogalang(code, _reset_state=True)
+            )
+
+    def test_string_literals_are_per_call(self):
+        transpiler = Transpiler()
+        first = transpiler.transpile("konst a æ 'first'")
+        second = transpiler.transpile("konst b æ 'second'")
+        self.assertEqual(first, "const a = 'first'")
+        self.assertEqual(second, "const b = 'second'")
+
+    def test_shared_between_threads(self):
+        transpiler = Transpiler()
+        expected = [transpiler.transpile(code) for code in self.CODES]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(transpiler.transpile, self.CODES))
+        self.assertEqual(results, expected)
+
+    def test_transpile_many_keeps_order(self):
+        transpiler = Transpiler()
+        expected = [transpiler.transpile(code) for code in self.CODES]
+        self.assertEqual(transpiler.transpile_many(self.CODES, max_workers=4), expected)
+
+
+class TestTranspileStats(unittest.TestCase):
+    """Test profiling transpilations."""
+
+    def test_counts(self):
+        stats = TranspileStats()
+        result = transpile_rogalang(
+            "konst a æ `x ${`y ${konst}`}` + 'z' + sei", stats=stats
+        )
+        self.assertEqual(result, "const a = `x ${`y ${const}`}` + 'z' + console.log")
+        self.assertEqual(stats.transpilations, 1)
+        self.assertEqual(stats.replacements, {"konst": 2, "æ": 1, "sei": 1})
+        self.assertEqual(stats.max_template_depth, 2)
+        self.assertEqual(stats.allocations, {"extract_literals": 2})
+        self.assertEqual(stats.bytes_out, len(result.encode("utf-8")))
+        for stage in ("extract_literals", "replace_tokens", "restore"):
+            self.assertGreater(stats.seconds[stage], 0)
+
+    def test_disabled_gives_same_output(self):
+        code = "hvis(a græla likt mæ `${b}`) { sei('c') }"
+        self.assertEqual(
+            transpile_rogalang(code, stats=TranspileStats()), transpile_rogalang(code)
+        )
+
+    def test_stream_and_callback(self):
+        stages = []
+        stats = TranspileStats(callback=lambda stage, seconds: stages.append(stage))
+        source = [
+            "herliga london\n",
+            "jille sei(`a\n",
+            "herliga london\n",
+            "jille b`)\n",
+        ]
+        self.assertEqual(
+            "".join(transpile_stream(source, stats)), "console.log(`a\nb`)\n"
+        )
+        self.assertEqual(stats.transpilations, 2)
+        self.assertIn("validate", stages)
+        self.assertIn("find_open_template", stages)
+        self.assertEqual(stats.replacements, {"sei": 1})
+
+    def test_merge_and_report(self):
+        first, second = TranspileStats(), TranspileStats()
+        transpile_rogalang("sei(a)", stats=first)
+        transpile_rogalang("sei(`${`b`}`)", stats=second)
+        first.merge(second)
+        self.assertEqual(first.transpilations, 2)
+        self.assertEqual(first.replacements["sei"], 2)
+        self.assertEqual(first.max_template_depth, 2)
+        report = first.report()
+        self.assertIn("replace_tokens", report)
+        self.assertIn("'sei'", report)
+
+
+class TestTranspileMemo(unittest.TestCase):
+    """Test memoizing repeated lines and template expressions."""
+
+    CODE = (
+        "konst a æ `x ${b + 1}`\n"
+        "sei(`fleire\nlinjer ${`nøsta ${c}`}\nslutt`) + 'd'\n"
+        "hvis(a græla likt mæ 2) { sei('ja') }\n"
+    )
+
+    def test_same_output_as_without_memo(self):
+        transpiler = Transpiler(memo=TranspileMemo())
+        for code in [self.CODE, self.CODE * 3, "sei(`aldri lukka\n${a}\n", "a `b"]:
+            with self.subTest(code=code):
+                self.assertEqual(transpiler.transpile(code), transpile_rogalang(code))
+
+    def test_hit_rates(self):
+        memo = TranspileMemo()
+        transpiler = Transpiler(memo=memo)
+        transpiler.transpile(self.CODE * 10)
+        stats = memo.stats()
+        # The multi-line template is never memoized as a line
+        self.assertEqual(stats["line"]["entries"], 2)
+        self.assertEqual(stats["line"]["hits"], 18)
+        # 'b + 1' on the first line, 'c' in the nested template
+        self.assertEqual(stats["expression"]["misses"], 2)
+        self.assertEqual(stats["expression"]["hits"], 9)
+
+    def test_bounded(self):
+        memo = TranspileMemo(max_entries=3, max_key_length=20)
+        transpiler = Transpiler(memo=memo)
+        transpiler.transpile("".join(f"sei({i})\n" for i in range(10)))
+        transpiler.transpile("sei(" + "a" * 50 + ")\n")
+        self.assertEqual(memo.stats()["line"]["entries"], 3)
+        self.assertEqual(memo.get("line", "sei(9)\n"), "console.log(9)\n")
+        self.assertIsNone(memo.get("line", "sei(0)\n"))
+
+    def test_cleared_when_semantics_change(self):
+        memo = TranspileMemo()
+        first = Transpiler(Semantics({"sei": "console.log"}, "first"), memo)
+        second = Transpiler(Semantics({"sei": "print"}, "second"), memo)
+        self.assertEqual(first.transpile("sei(a)\n"), "console.log(a)\n")
+        self.assertEqual(second.transpile("sei(a)\n"), "print(a)\n")
+        self.assertEqual(memo.stats()["line"]["entries"], 1)
+
+
+class TestTranspileBatch(unittest.TestCase):
+    """Test transpiling many snippets with one token replacement pass."""
+
+    SNIPPETS = [
+        "konst a æ 1",
+        "sei(`x ${a græla likt mæ 1} 'konst'`)",
+        "",
+        "'hei' + sei",
+        "sei(`aldri lukka ${a}",
+        "hvis(a) { returner `${`${b}`}` }",
+        "konst\0sei",
+    ]
+
+    def test_same_output_as_one_by_one(self):
+        self.assertEqual(
+            transpile_batch(self.SNIPPETS),
+            [transpile_rogalang(snippet) for snippet in self.SNIPPETS],
+        )
+
+    def test_tokens_do_not_span_snippets(self):
+        # 'græla likt mæ' must not match across the separator
+        self.assertEqual(
+            transpile_batch(["a græla", "likt mæ b"]),
+            [transpile_rogalang("a græla"), transpile_rogalang("likt mæ b")],
+        )
+        self.assertNotIn("===", "".join(transpile_batch(["a græla", "likt mæ b"])))
+
+    def test_quote_not_closed_in_its_snippet(self):
+        # Scanned in one go the quotes would pair up across the snippets
+        snippets = ["sei('a", "b' + sei"]
+        self.assertEqual(
+            transpile_batch(snippets), ["console.log('a", "b' + console.log"]
+        )
+
+    def test_errors_are_isolated(self):
+        results = transpile_batch(
+            [
+                "herliga london\njille sei(1)\n",
+                "jille sei(2)\n",
+                None,
+                "herliga london\njille sei(3)\n",
+            ],
+            validate=True,
+        )
+        self.assertEqual(results[0], "console.log(1)\n")
+        self.assertIsInstance(results[1], ValidationError)
+        self.assertIsInstance(results[2], TypeError)
+        self.assertEqual(results[3], "console.log(3)\n")
+
+    def test_stats(self):
+        stats = TranspileStats()
+        transpile_batch(["sei(1)", "sei(`${sei}`)"], stats=stats)
+        self.assertEqual(stats.transpilations, 2)
+        self.assertEqual(stats.replacements["sei"], 3)
+        self.assertEqual(stats.bytes_in, 19)
+
+    def test_series(self):
+        try:
+            import pandas
+        except ImportError:
+            self.skipTest("pandas is not installed")
+        snippets = pandas.Series(["sei(1)", float("nan")], index=["a", "b"], name="rl")
+        results = transpile_batch(snippets)
+        self.assertIsInstance(results, pandas.Series)
+        self.assertEqual(list(results.index), ["a", "b"])
+        self.assertEqual(results.name, "rl")
+        self.assertEqual(results["a"], "console.log(1)")
+        self.assertIsInstance(results["b"], TypeError)
+
+
+class TestMinify(unittest.TestCase):
+    """Test dropping whitespace and comments while replacing tokens."""
+
+    def test_whitespace(self):
+        self.assertEqual(
+            transpile_rogalang(
+                "konst a æ 1\nviss (a græla likt mæ  1) {\n    sei( a ,\tb )\n}\n",
+                minify=True,
+            ),
+            "const a=1\nif(a===1){console.log(a,b)}\n",
+        )
+
+    def test_tokens_do_not_merge(self):
+        self.assertEqual(
+            transpile_rogalang(
+                "e an ein type av  a + +b - -c delt me / x /g; 1 .toString()",
+                minify=True,
+            ),
+            "typeof a+ +b- -c/ / x /g;1 .toString()",
+        )
+
+    def test_literals_are_kept(self):
+        self.assertEqual(
+            transpile_rogalang(
+                "sei( 'a  b' , `c  ${ d aog mæ  `e ${ f }` }  g` )", minify=True
+            ),
+            "console.log('a  b',`c  ${d+`e ${f}`}  g`)",
+        )
+
+    def test_asi_line_breaks_are_kept(self):
+        code = "spytt ud\n  a\nb\n  ++c\nd\n(e)\nkonst f æ [\n  1\n]\n  .map(g)\n"
+        self.assertEqual(
+            transpile_rogalang(code, minify=True),
+            "return\na\nb\n++c\nd\n(e)\nconst f=[1]\n.map(g)\n",
+        )
+
+    def test_comments_and_regexes(self):
+        code = "a æ b // c\nd æ / e  f /g /* g\n h */ x\nj æ k /* l */ m\n"
+        self.assertEqual(
+            transpile_rogalang(code, minify=True),
+            "a=b\nd=/ e  f /g\nx\nj=k m\n",
+        )
+
+    def test_comment_may_continue_in_a_literal(self):
+        # The line break after the quotes may end a comment
+        self.assertEqual(
+            transpile_rogalang("a // 'b'\n  c\n 'd' \n e", minify=True),
+            "a// 'b'\nc\n'd'\ne",
+        )
+
+    def test_same_replacements(self):
+        code = "konst a æ `${sei(1) aog mæ  2}` elle 'sei' ? b : sei`x`"
+        plain, minified = TranspileStats(), TranspileStats()
+        transpile_rogalang(code, stats=plain)
+        transpile_rogalang(code, stats=minified, minify=True)
+        self.assertEqual(minified.replacements, plain.replacements)
+        self.assertLess(minified.bytes_out, plain.bytes_out)
+
+    def test_stream_and_memo(self):
+        source = [
+            "herliga london\n",
+            "jille viss (a) {\n",
+            "jille     sei(`b\n",
+            "herliga london\n",
+            "jille c`)\n",
+            "jille }\n",
+        ]
+        # A line break after a string literal is always kept
+        expected = "if(a){console.log(`b\nc`)\n}\n"
+        self.assertEqual("".join(transpile_stream(source, minify=True)), expected)
+        memo = TranspileMemo()
+        transpiler = Transpiler(memo=memo)
+        self.assertEqual(
+            "".join(transpiler.transpile_stream(source, minify=True)), expected
+        )
+        self.assertEqual(memo.stats()["line"]["entries"], 0)
+
+    def test_no_source_map(self):
+        with self.assertRaisesRegex(ValueError, "source map of minified output"):
+            Transpiler().transpile_stream(
+                ["herliga london\n"], source_map=SourceMapBuilder("a.rl"), minify=True
+            )
+
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
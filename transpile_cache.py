@@ -0,0 +1,181 @@
+"""
+Content-addressed on-disk cache of transpiled JavaScript.
+
+Entries are keyed by a hash of the Rogalang source, the semantics table and
+the transpiler version, so an entry can never be stale. Entries are written
+atomically, which makes it safe for concurrent builds to share a directory.
+"""
+
+from __future__ import annotations
+from typing import Dict, Optional
+import hashlib
+import os
+import shutil
+import tempfile
+
+from transpiler import __version__, default_cache_dir
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_EXTENSION = ".js"
+READ_CHUNK_SIZE = 1 << 20
+
+
+class TranspileCache:
+    """
+    A size-bounded cache of transpiled files.
+
+    Every hit refreshes the modification time of its entry, prune() then
+    evicts the least recently used entries until the cache fits in max_bytes.
+    """
+
+    def __init__(
+        self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.directory = directory or os.path.join(default_cache_dir(), "transpiled")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key_for_file(
+        self, source_path: str, semantics_digest: str, options: str = ""
+    ) -> str:
+        """
+        Compute the cache key of a Rogalang file.
+
+        Args:
+            source_path: Path of the Rogalang source file
+            semantics_digest: Digest of the semantics table used to transpile
+            options: Transpiler options the output depends on, like 'optimize'
+
+        Returns:
+            A hex digest identifying the transpiled output
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{__version__}\0{semantics_digest}\0".encode("utf-8"))
+        if options:
+            digest.update(f"{options}\0".encode("utf-8"))
+        with open(source_path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ENTRY_EXTENSION)
+
+    def get_file(self, key: str, output_path: str) -> bool:
+        """
+        Copy a cached entry to output_path.
+
+        Returns:
+            Whether the entry was in the cache
+        """
+        entry_path = self._entry_path(key)
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+            os.close(fd)
+            try:
+                shutil.copyfile(entry_path, tmp_path)
+                os.replace(tmp_path, output_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            # Mark the entry as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Never cached, or evicted by a concurrent build
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def get_text(self, key: str) -> Optional[str]:
+        """
+        Read a cached entry.
+
+        Returns:
+            The transpiled JavaScript, None if the entry was not in the cache
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(entry_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put_file(self, key: str, path: str) -> None:
+        """Store the transpiled file at path under key"""
+        entry_path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(entry_path), suffix=".tmp"
+            )
+            os.close(fd)
+            try:
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, entry_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            # A cache that cannot be written must never break a build
+            pass
+
+    def put_text(self, key: str, text: str) -> None:
+        """Store transpiled JavaScript under key"""
+        entry_path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(entry_path), suffix=".tmp"
+            )
+            try:
+                with open(fd, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, entry_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            pass
+
+    def prune(self) -> int:
+        """
+        Evict the least recently used entries until the cache fits in max_bytes.
+
+        Returns:
+            The number of evicted entries
+        """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(ENTRY_EXTENSION):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
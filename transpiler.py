@@ -1,17 +1,597 @@
 from __future__ import annotations
-from typing import List
-import pandas as pd
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from time import perf_counter
+import csv
+import hashlib
+import io
+import json
+import mmap
+import os
 import re
 import sys
+import tempfile
+import threading
+
+from sourcemap import SOURCE_MAP_KINDS, Edit, SourceMapBuilder, url_comment
+
+if TYPE_CHECKING:
+    from transpile_cache import TranspileCache
+
+# Bump this whenever the transpiled output changes, it is part of cache keys
+__version__ = "0.4.1"
+
+SEMANTICS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "semantics", "semantics.csv"
+)
+
+# Bump this whenever the layout of the cached semantics artifact changes
+SEMANTICS_CACHE_VERSION = 3
+
+# Rogalang tokens are only replaced when surrounded by these delimiters.
+# Only include delimiters that exist in Rogalang (not replaced by semantics.csv)
+DELIMITER_CHARS = r"\s(){}[\];,.?:\0"
+
+# Joins the code of batched snippets, it is a delimiter so tokens never match
+# across two snippets
+BATCH_SEPARATOR = "\0"
+
+# Line terminators of JavaScript, which automatic semicolon insertion
+# depends on
+LINE_TERMINATOR_REGEX = re.compile(r"[\n\r\u2028\u2029]")
+# Minified code drops a line break after these characters, since no
+# statement ends with them, and before these, since they can only continue
+# the statement before them
+NEWLINE_SAFE_BEFORE = frozenset("{([,;:=?*%&|^!~<>")
+NEWLINE_SAFE_AFTER = frozenset(",;)]}?:=")
+# Pairs of characters that form another token when the space between them
+# is dropped, besides two word characters
+MERGING_PAIRS = frozenset(["++", "--", "//", "/*", "<!"])
+TRAILING_WORD_REGEX = re.compile(r"[\w$]+\Z")
+
+
+def default_cache_dir() -> str:
+    """
+    Directory for on-disk caches, can be overridden with ROGALANG_CACHE_DIR.
+    """
+    if os.environ.get("ROGALANG_CACHE_DIR"):
+        return os.environ["ROGALANG_CACHE_DIR"]
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "rogalang")
+
+
+def parse_semantics_csv(data: str) -> Dict[str, str]:
+    """
+    Parse the contents of a semantics CSV into a token table.
+
+    Rows without a JavaScript or Rogalang side (like 'herliga london' and
+    'jille') are skipped, as they are handled by the preprocessor.
+
+    Args:
+        data: Contents of a CSV file with 'js' and 'rogalang' columns
+
+    Returns:
+        Mapping from Rogalang tokens to JavaScript
+    """
+    return {
+        row["rogalang"]: row["js"]
+        for row in csv.DictReader(io.StringIO(data))
+        if row.get("js") and row.get("rogalang")
+    }
+
+
+def compile_semantics_regex(semantics: Dict[str, str]) -> re.Pattern:
+    """
+    Compile all Rogalang tokens of a semantics table into one regex.
+
+    The tokens are joined into a single alternation sorted longest first, so
+    that e.g. 'græla likt mæ' wins over 'likt mæ' at the same position. The
+    matched token is used to look up its replacement in the semantics table.
+
+    Args:
+        semantics: Mapping from Rogalang tokens to JavaScript
+
+    Returns:
+        A compiled regex matching any delimited Rogalang token
+    """
+    tokens = sorted((token for token in semantics if token), key=len, reverse=True)
+    alternation = "|".join(re.escape(token) for token in tokens)
+    # Match tokens only when preceded by a delimiter (or at the start) and
+    # followed by a delimiter (or at the end)
+    return re.compile(
+        f"(?<![^{DELIMITER_CHARS}])(?:{alternation})(?=[{DELIMITER_CHARS}]|$)"
+    )
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_$\\" or char > "\x7f"
+
+
+def _regex_allowed(before: str) -> bool:
+    """
+    Whether a '/' after the JavaScript before starts a regex literal, or
+    might, rather than being a division
+    """
+    if not before:
+        return True
+    if before[-1] in ")]":
+        return False
+    if not _is_word_char(before[-1]):
+        return True
+    # Not imported at the top, compiling the tokenizer's regexes would slow
+    # down every import of this module
+    from jstokens import REGEX_KEYWORDS
+
+    word = TRAILING_WORD_REGEX.search(before)
+    return word is not None and word.group() in REGEX_KEYWORDS
+
+
+def _minified_space(space: str, before: str, after: str, keep_newline: bool) -> str:
+    """
+    What a run of whitespace between two characters of JavaScript minifies to.
+
+    Args:
+        space: The whitespace, including any comments it replaces
+        before: The character before it, empty if not known
+        after: The character after it, empty if not known
+        keep_newline: Whether to keep a line break even where it looks safe
+            to drop
+
+    Returns:
+        A line break if space has one that automatic semicolon insertion
+        could depend on, a space if the characters would merge into another
+        token without one, or nothing
+    """
+    if LINE_TERMINATOR_REGEX.search(space) and (
+        keep_newline
+        or not (before in NEWLINE_SAFE_BEFORE or after in NEWLINE_SAFE_AFTER)
+    ):
+        return "\n"
+    if not before or not after:
+        return ""
+    if _is_word_char(before) and _is_word_char(after):
+        return " "
+    if before + after in MERGING_PAIRS or (before.isdigit() and after == "."):
+        return " "
+    return ""
+
+
+class Semantics:
+    """A semantics table together with its compiled token matcher"""
+
+    def __init__(
+        self, table: Dict[str, str], digest: str, pattern: Optional[str] = None
+    ):
+        if not table:
+            raise ValueError(
+                "Failed to load semantics from semantics.csv or file is empty"
+            )
+        self.table = table
+        self.digest = digest
+        self.regex = re.compile(pattern) if pattern else compile_semantics_regex(table)
+        self._minify_regex: Optional[re.Pattern] = None
+
+    @property
+    def minify_regex(self) -> re.Pattern:
+        """Matches Rogalang tokens, runs of whitespace and slashes in one pass"""
+        if self._minify_regex is None:
+            self._minify_regex = re.compile(
+                f"(?P<token>{self.regex.pattern})|(?P<space>\\s+)|(?P<slash>/)"
+            )
+        return self._minify_regex
+
+    def replace_tokens(
+        self,
+        content: str,
+        counts: Optional[Counter] = None,
+        edits: Optional[List[Edit]] = None,
+        offset: int = 0,
+    ) -> str:
+        """
+        Replace all delimited Rogalang tokens in content with JavaScript.
+
+        Args:
+            content: The Rogalang code
+            counts: Counter to add the number of replacements per token to
+            edits: List to append every replacement to, for source maps
+            offset: Offset of content in the code the edits refer to
+        """
+        table = self.table
+        if counts is None and edits is None:
+            return self.regex.sub(lambda match: table[match.group()], content)
+
+        def replace(match: re.Match) -> str:
+            token = match.group()
+            if counts is not None:
+                counts[token] += 1
+            if edits is not None:
+                edits.append((offset + match.start(), len(token), table[token]))
+            return table[token]
+
+        return self.regex.sub(replace, content)
+
+    def minify_tokens(
+        self,
+        content: str,
+        counts: Optional[Counter] = None,
+        after_literal: bool = False,
+    ) -> str:
+        """
+        Replace all delimited Rogalang tokens in content with JavaScript and
+        drop the whitespace and comments around them in the same pass.
+
+        Every run of whitespace becomes nothing, a space where the code on
+        both sides would merge without one, or a line break where automatic
+        semicolon insertion could depend on it. Regex literals are kept as
+        they are, and so is a comment that does not end in content, as it
+        may go on in a string literal after it.
+
+        Args:
+            content: The Rogalang code, outside of any string literal
+            counts: Counter to add the number of replacements per token to
+            after_literal: Whether content follows a string literal, which
+                may be part of a comment. The first line break is kept then
+        """
+        table = self.table
+        output: List[str] = []
+        # Whitespace and comments not emitted yet, and what was emitted last
+        space = ""
+        last = ""
+        keep_newline = after_literal
+
+        def emit(text: str) -> None:
+            nonlocal space, last, keep_newline
+            if space:
+                output.append(_minified_space(space, last[-1:], text[0], keep_newline))
+                if keep_newline and LINE_TERMINATOR_REGEX.search(space):
+                    keep_newline = False
+                space = ""
+            output.append(text)
+            last = text
+
+        search = self.minify_regex.search
+        pos = 0
+        while True:
+            match = search(content, pos)
+            if match is None:
+                break
+            start = match.start()
+            if start > pos:
+                emit(content[pos:start])
+            kind = match.lastgroup
+            pos = match.end()
+            if kind == "token":
+                token = match.group()
+                if counts is not None:
+                    counts[token] += 1
+                if table[token]:
+                    emit(table[token])
+            elif kind == "space":
+                space += match.group()
+            elif content.startswith("//", start):
+                end = content.find("\n", start)
+                if end < 0:
+                    emit(self.replace_tokens(content[start:], counts))
+                    pos = len(content)
+                else:
+                    pos = end
+            elif content.startswith("/*", start):
+                end = content.find("*/", start + 2)
+                if end < 0:
+                    emit(self.replace_tokens(content[start:], counts))
+                    pos = len(content)
+                else:
+                    pos = end + 2
+                    comment = content[start:pos]
+                    space += "\n" if LINE_TERMINATOR_REGEX.search(comment) else " "
+            else:
+                regex = None
+                if _regex_allowed(last):
+                    from jstokens import REGEX_LITERAL
+
+                    regex = REGEX_LITERAL.match(content, start)
+                emit(self.replace_tokens(regex.group(), counts) if regex else "/")
+                if regex:
+                    pos = regex.end()
+        if pos < len(content):
+            emit(content[pos:])
+        if space:
+            output.append(_minified_space(space, last[-1:], "", keep_newline))
+        return "".join(output)
+
+
+class SemanticsRegistry:
+    """
+    Lazily loads a semantics CSV and caches its compiled form on disk.
+
+    The cached artifact is keyed by the SHA-256 of the CSV contents and
+    SEMANTICS_CACHE_VERSION, so editing the CSV or changing the artifact
+    layout simply results in a new artifact.
+    """
+
+    def __init__(self, path: str = SEMANTICS_PATH, cache_dir: Optional[str] = None):
+        self.path = path
+        self.cache_dir = cache_dir
+        self._semantics: Optional[Semantics] = None
+        # Modification time and size of the CSV when it was last read
+        self._stat: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Semantics:
+        """Return the compiled semantics, loading them on first use"""
+        semantics = self._semantics
+        if semantics is None:
+            with self._lock:
+                if self._semantics is None:
+                    self._semantics = self._load()
+                semantics = self._semantics
+        return semantics
+
+    def is_stale(self) -> bool:
+        """Whether the CSV changed on disk since it was loaded"""
+        if self._stat is None:
+            return False
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) != self._stat
+
+    def reload(self) -> bool:
+        """
+        Load the CSV again and swap in its semantics if they changed.
+
+        The new semantics are compiled before the lock is taken, so get()
+        never waits for a reload. Transpilations that already hold the old
+        semantics finish with them.
+
+        Returns:
+            Whether the semantics changed
+
+        Raises:
+            OSError: If the CSV cannot be read, the old semantics are kept
+            ValueError: If the CSV has no semantics, likewise
+        """
+        semantics = self._load()
+        with self._lock:
+            if self._semantics is not None and (
+                self._semantics.digest == semantics.digest
+            ):
+                return False
+            self._semantics = semantics
+        return True
+
+    def _cache_path(self, digest: str) -> str:
+        cache_dir = self.cache_dir or default_cache_dir()
+        return os.path.join(
+            cache_dir, f"semantics-v{SEMANTICS_CACHE_VERSION}-{digest}.json"
+        )
+
+    def _load(self) -> Semantics:
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            # Taken before reading, so a write during the read is seen later
+            read_stat = (stat.st_mtime_ns, stat.st_size)
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        cache_path = self._cache_path(digest)
+
+        # Use the precompiled artifact if there is a valid one. It is plain
+        # JSON, as the cache directory may be shared with other users
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                artifact = json.load(f)
+            table = artifact["table"]
+            pattern = artifact["pattern"]
+            if (
+                artifact["version"] == SEMANTICS_CACHE_VERSION
+                and artifact["digest"] == digest
+                and isinstance(pattern, str)
+                and isinstance(table, dict)
+                and all(isinstance(js, str) for js in table.values())
+            ):
+                semantics = Semantics(table, digest, pattern)
+                self._stat = read_stat
+                return semantics
+        except (OSError, ValueError, KeyError, TypeError, re.error):
+            pass
+
+        semantics = Semantics(parse_semantics_csv(data.decode("utf-8")), digest)
+        # Only recorded once the CSV loaded, so a broken one is tried again
+        self._stat = read_stat
+        artifact = {
+            "version": SEMANTICS_CACHE_VERSION,
+            "digest": digest,
+            "table": semantics.table,
+            "pattern": semantics.regex.pattern,
+        }
+        # Write atomically, a failure to cache must never break transpilation
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(artifact, f, ensure_ascii=False)
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            pass
+        return semantics
+
+
+SEMANTICS_REGISTRY = SemanticsRegistry()
+
+# Name of the dialect of semantics/semantics.csv
+DEFAULT_DIALECT = "default"
+# Seconds between checks for changed CSVs while watching
+DEFAULT_RELOAD_INTERVAL = 1.0
+
+
+class DialectRegistry:
+    """
+    Semantics of several Rogalang dialects by name, reloaded on change.
+
+    Every dialect has its own SemanticsRegistry, so looking one up is a
+    dictionary lookup and never waits for a reload. While watching, a
+    background thread checks the CSVs every interval and compiles the ones
+    that changed, swapping the new semantics in once they are ready.
+    """
+
+    def __init__(self, dialects: Optional[Dict[str, SemanticsRegistry]] = None):
+        """
+        Args:
+            dialects: Registries by dialect name, defaults to just the
+                default dialect
+        """
+        if dialects is None:
+            dialects = {DEFAULT_DIALECT: SEMANTICS_REGISTRY}
+        self._registries: Dict[str, SemanticsRegistry] = dict(dialects)
+        # The last failed reload of every dialect, while it keeps its old
+        # semantics
+        self.errors: Dict[str, Exception] = {}
+        self._stop: Optional[threading.Event] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(
+        self, name: str, path: str, cache_dir: Optional[str] = None
+    ) -> SemanticsRegistry:
+        """
+        Add a dialect, or point an existing one to another CSV.
+
+        Args:
+            name: Name of the dialect, as passed to get
+            path: Path of the semantics CSV of the dialect
+            cache_dir: Directory for the compiled semantics, see
+                SemanticsRegistry
+
+        Returns:
+            The registry of the dialect, its CSV is loaded on first use
+        """
+        registry = SemanticsRegistry(path, cache_dir)
+        with self._lock:
+            # Copy on write, readers never see a half updated dictionary
+            self._registries = {**self._registries, name: registry}
+        return registry
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._registries = {
+                key: registry
+                for key, registry in self._registries.items()
+                if key != name
+            }
+        self.errors.pop(name, None)
+
+    def names(self) -> List[str]:
+        return list(self._registries)
+
+    def get(self, name: Optional[str] = None) -> Semantics:
+        """
+        Return the current semantics of a dialect.
+
+        Args:
+            name: Name of the dialect, defaults to the default dialect
+
+        Raises:
+            ValueError: If there is no such dialect
+        """
+        registry = self._registries.get(DEFAULT_DIALECT if name is None else name)
+        if registry is None:
+            raise ValueError(f"Unknown dialect: {name!r}")
+        return registry.get()
+
+    def reload(self) -> List[str]:
+        """
+        Reload the dialects whose CSV changed since it was loaded.
+
+        A CSV that cannot be read or parsed is recorded in errors and its
+        dialect keeps its old semantics.
+
+        Returns:
+            The names of the dialects whose semantics changed
+        """
+        changed = []
+        for name, registry in self._registries.items():
+            if not registry.is_stale():
+                continue
+            try:
+                if registry.reload():
+                    changed.append(name)
+                self.errors.pop(name, None)
+            except (OSError, ValueError, csv.Error) as e:
+                self.errors[name] = e
+        return changed
+
+    def watch(self, interval: float = DEFAULT_RELOAD_INTERVAL) -> None:
+        """Reload changed dialects every interval seconds in the background"""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._stop = threading.Event()
+            self._watcher = threading.Thread(
+                target=self._watch,
+                args=(self._stop, interval),
+                name="rogalang-dialects",
+                daemon=True,
+            )
+            self._watcher.start()
 
+    def _watch(self, stop: threading.Event, interval: float) -> None:
+        while not stop.wait(interval):
+            self.reload()
 
-with open("semantics/semantics.csv", "r") as f:
-    semantics = pd.read_csv(f)[["js", "rogalang"]].dropna()
+    def stop(self) -> None:
+        """Stop watching, waiting for a reload in progress"""
+        with self._lock:
+            watcher, stop = self._watcher, self._stop
+            self._watcher = self._stop = None
+        if watcher is not None:
+            stop.set()
+            watcher.join()
 
-if semantics is None or semantics.empty:
-    raise ValueError("Failed to load semantics from semantics.csv or file is empty")
 
-semantics_dict = {row["rogalang"]: row["js"] for _, row in semantics.iterrows()}
+DIALECTS = DialectRegistry()
+
+
+def get_semantics(dialect: Optional[str] = None) -> Semantics:
+    """
+    Return the current compiled semantics of a dialect, see DIALECTS.
+
+    Args:
+        dialect: Name of the dialect, defaults to DEFAULT_DIALECT, so that
+            pointing it to another CSV or reloading it is seen too
+    """
+    return DIALECTS.get(dialect)
+
+
+def __getattr__(name: str):
+    # Keep the old module attributes working without loading at import time
+    if name == "semantics_dict":
+        return get_semantics().table
+    if name == "SEMANTICS_REGEX":
+        return get_semantics().regex
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 MAX_LINES_BETWEEN_HERLIGA_LONDON = 10
 JILLE_PREFIX = re.compile(r"^\s*jille\s+")
@@ -73,151 +653,1691 @@ def validate_and_preprocess_rogalang(lines: List[str]) -> List[str]:
     return processed_lines
 
 
+class SegmentValidator:
+    """
+    Validates Rogalang source pushed to it line by line.
+
+    The push-based form of iter_rogalang_segments, for sources that cannot be
+    pulled from, like asynchronous uploads. Lines are only kept until their
+    segment is complete, and the first gap that is too large is reported.
+    """
+
+    def __init__(self):
+        self.line = 0
+        self.last_herliga: Optional[int] = None
+        self.segment: List[str] = []
+        # Set when the source is invalid, but the error depends on what follows
+        self._failure: Optional[str] = None
+
+    def feed(self, line: str) -> Optional[List[str]]:
+        """
+        Validate the next line of the source.
+
+        Returns:
+            The preprocessed 'jille' lines of the segment that the line
+            completed, if it completed a non-empty one
+
+        Raises:
+            ValueError: If validation fails
+        """
+        i = self.line
+        self.line += 1
+        is_herliga = line.rstrip("\r\n") == "herliga london"
+
+        if self._failure is not None:
+            # Read ahead to tell which error it is
+            if is_herliga:
+                if self._failure == "first":
+                    raise ValueError("First line must be 'herliga london'")
+                raise ValueError(
+                    f"Gap of {i - self.last_herliga} lines between 'herliga london' at lines {self.last_herliga + 1} and {i + 1}"
+                )
+            return None
+
+        last_herliga = self.last_herliga
+        if is_herliga:
+            if last_herliga is None and i != 0:
+                raise ValueError("First line must be 'herliga london'")
+            if (
+                last_herliga is not None
+                and i - last_herliga > MAX_LINES_BETWEEN_HERLIGA_LONDON
+            ):
+                raise ValueError(
+                    f"Gap of {i - last_herliga} lines between 'herliga london' at lines {last_herliga + 1} and {i + 1}"
+                )
+            self.last_herliga = i
+            segment = self.segment
+            if segment:
+                self.segment = []
+                return segment
+            return None
+
+        if last_herliga is None:
+            # A misplaced 'herliga london' or a missing one
+            self._failure = "first"
+        elif i - last_herliga > MAX_LINES_BETWEEN_HERLIGA_LONDON:
+            # A gap or a missing 'herliga london' at the end
+            self._failure = "gap"
+        elif JILLE_PREFIX.match(line):
+            self.segment.append(JILLE_PREFIX.sub("", line))
+        return None
+
+    def close(self) -> Optional[List[str]]:
+        """
+        Finish validating at the end of the source.
+
+        Returns:
+            The preprocessed 'jille' lines of the last segment, if non-empty
+
+        Raises:
+            ValueError: If validation fails
+        """
+        if self.last_herliga is None or self._failure == "first":
+            raise ValueError("No 'herliga london' found in source file")
+        if self._failure == "gap":
+            raise ValueError(
+                f"Last 'herliga london' at line {self.last_herliga + 1} is more than {MAX_LINES_BETWEEN_HERLIGA_LONDON} lines from end"
+            )
+        segment = self.segment
+        self.segment = []
+        return segment or None
+
+
+def iter_rogalang_segments(lines: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Validate Rogalang source while reading it and yield it one segment at a time.
+
+    A segment is the block of lines following a 'herliga london' line, so at
+    most MAX_LINES_BETWEEN_HERLIGA_LONDON lines are held in memory. Unlike
+    validate_and_preprocess_rogalang, the first gap that is too large is
+    reported instead of the largest one.
+
+    Args:
+        lines: Lines of the Rogalang source, e.g. an open file
+
+    Yields:
+        The preprocessed 'jille' lines of each non-empty segment
+
+    Raises:
+        ValueError: If validation fails
+    """
+    validator = SegmentValidator()
+    feed = validator.feed
+    for line in lines:
+        segment = feed(line)
+        if segment is not None:
+            yield segment
+    segment = validator.close()
+    if segment is not None:
+        yield segment
+
+
+class ValidationIssue(NamedTuple):
+    # 1-based line the issue was found at
+    line: int
+    message: str
+
+    def __str__(self):
+        return f"line {self.line}: {self.message}"
+
+
+class ValidationError(ValueError):
+    """Raised with every issue found in a Rogalang source"""
+
+    def __init__(self, issues: List[ValidationIssue]):
+        super().__init__("\n".join(str(issue) for issue in issues))
+        self.issues = issues
+
+
+def iter_validated_lines(
+    lines: Iterable[str], fail_fast: bool = False
+) -> Iterator[str]:
+    """
+    Validate Rogalang source in a single pass, collecting every issue.
+
+    Nothing but the current line is held in memory. Every 'herliga london'
+    that is missing or too far away is reported with the line it was
+    found at, instead of stopping at the first one.
+
+    Args:
+        lines: Lines of the Rogalang source, e.g. iter_file_lines(path)
+        fail_fast: Raise as soon as the first issue is known, and stop
+            yielding lines once the source is known to be invalid
+
+    Yields:
+        The preprocessed 'jille' lines
+
+    Raises:
+        ValidationError: After the last line if any issue was found, or at
+            the first issue in fail_fast mode
+    """
+    issues: List[ValidationIssue] = []
+
+    def report(line: int, message: str) -> None:
+        issues.append(ValidationIssue(line, message))
+        if fail_fast:
+            raise ValidationError(issues)
+
+    last_herliga = None
+    # Whether the current line is too far from the last 'herliga london'
+    too_far = False
+    jille_match = JILLE_PREFIX.match
+    for i, line in enumerate(lines):
+        if line.rstrip("\r\n") == "herliga london":
+            if last_herliga is None:
+                if i != 0:
+                    report(1, "First line must be 'herliga london'")
+            elif too_far:
+                report(
+                    last_herliga + MAX_LINES_BETWEEN_HERLIGA_LONDON + 2,
+                    f"Gap of {i - last_herliga} lines between 'herliga london' at lines {last_herliga + 1} and {i + 1}",
+                )
+            last_herliga = i
+            too_far = False
+            continue
+
+        if last_herliga is None or too_far:
+            if fail_fast:
+                continue
+        elif i - last_herliga > MAX_LINES_BETWEEN_HERLIGA_LONDON:
+            too_far = True
+            if fail_fast:
+                continue
+
+        match = jille_match(line)
+        if match:
+            yield line[match.end() :]
+
+    if last_herliga is None:
+        # Replaces the issue about the first line
+        issues.clear()
+        report(1, "No 'herliga london' found in source file")
+    elif too_far:
+        report(
+            last_herliga + MAX_LINES_BETWEEN_HERLIGA_LONDON + 2,
+            f"Last 'herliga london' at line {last_herliga + 1} is more than {MAX_LINES_BETWEEN_HERLIGA_LONDON} lines from end",
+        )
+    if issues:
+        raise ValidationError(issues)
+
+
+def iter_file_lines(path: str) -> Iterator[str]:
+    """
+    Iterate over the lines of a UTF-8 file through a memory map, letting the
+    OS page the file in instead of copying it into buffers.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                yield line.decode("utf-8")
+
+
+def validate_file(path: str, fail_fast: bool = False) -> List[ValidationIssue]:
+    """
+    Validate a Rogalang file in a single pass.
+
+    Args:
+        path: Path of the Rogalang file
+        fail_fast: Stop at the first issue
+
+    Returns:
+        Every issue found, an empty list if the file is valid
+    """
+    try:
+        for _ in iter_validated_lines(iter_file_lines(path), fail_fast):
+            pass
+    except ValidationError as e:
+        return e.issues
+    return []
+
+
+###################
+# Instrumentation #
+###################
+
+# Stages of a transpilation, in the order they run
+PROFILE_STAGES = (
+    "validate",
+    "find_open_template",
+    "extract_literals",
+    "replace_tokens",
+    "restore",
+    "optimize",
+    "write",
+)
+
+
+class TranspileStats:
+    """
+    Opt-in profile of one or more transpilations.
+
+    Pass an instance to the transpile entry points to accumulate the wall
+    time of every stage, the bytes processed, the replacements per semantics
+    entry, the deepest template literal nesting and the StringLiteral
+    allocations per stage. Without one, all bookkeeping is skipped.
+
+    An instance is not thread-safe, use one per thread and merge them.
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float], None]] = None):
+        """
+        Args:
+            callback: Called with the stage name and its seconds every time
+                a stage finishes
+        """
+        self.callback = callback
+        self.seconds: Dict[str, float] = dict.fromkeys(PROFILE_STAGES, 0.0)
+        self.transpilations = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.replacements: Counter = Counter()
+        self.max_template_depth = 0
+        self.allocations: Counter = Counter()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        """Record seconds spent in stage"""
+        self.seconds[stage] += seconds
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+    def timed(self, iterable: Iterable, stage: str) -> Iterator:
+        """Iterate over iterable, recording the time spent producing items"""
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, perf_counter() - start)
+                return
+            self.add_time(stage, perf_counter() - start)
+            yield item
+
+    def merge(self, other: TranspileStats) -> None:
+        """Add the counts of another profile to this one"""
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.transpilations += other.transpilations
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.replacements.update(other.replacements)
+        self.max_template_depth = max(self.max_template_depth, other.max_template_depth)
+        self.allocations.update(other.allocations)
+
+    def __getstate__(self):
+        # Callbacks are often closures, which cannot cross process boundaries
+        state = self.__dict__.copy()
+        state["callback"] = None
+        return state
+
+    def as_dict(self) -> Dict:
+        return {
+            "seconds": dict(self.seconds),
+            "transpilations": self.transpilations,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "replacements": dict(self.replacements),
+            "max_template_depth": self.max_template_depth,
+            "allocations": dict(self.allocations),
+        }
+
+    def report(self, top: int = 10) -> str:
+        """
+        Format the profile as a human readable table.
+
+        Args:
+            top: Number of most replaced tokens to list
+        """
+        total = sum(self.seconds.values())
+        lines = [f"{'Stage':<20}{'Time':>12}{'Share':>8}"]
+        for stage, seconds in self.seconds.items():
+            share = seconds / total * 100 if total else 0.0
+            lines.append(f"{stage:<20}{seconds * 1000:>10.2f}ms{share:>7.1f}%")
+        lines.append(f"{'total':<20}{total * 1000:>10.2f}ms")
+
+        megabytes = self.bytes_in / (1024 * 1024)
+        throughput = f" ({megabytes / total:.2f} MB/s)" if total else ""
+        lines.append(
+            f"Transpiled {self.bytes_in} bytes into {self.bytes_out} bytes in "
+            f"{self.transpilations} transpilations{throughput}"
+        )
+        allocations = ", ".join(
+            f"{count} in {stage}" for stage, count in self.allocations.items()
+        )
+        lines.append(f"String literals allocated: {allocations or 0}")
+        lines.append(f"Deepest template literal nesting: {self.max_template_depth}")
+        if self.replacements:
+            lines.append(
+                f"Token replacements: {sum(self.replacements.values())}, "
+                f"most frequent:"
+            )
+            for token, count in self.replacements.most_common(top):
+                lines.append(f"  {count:>10}  {token!r}")
+        return "\n".join(lines)
+
+
+################
+# Memoization #
+################
+
+DEFAULT_MEMO_ENTRIES = 4096
+# Longer fragments are rarely repeated and would make the memo too large
+MEMO_MAX_KEY_LENGTH = 512
+
+
+class TranspileMemo:
+    """
+    Size-bounded LRU memo of transpiled fragments.
+
+    Generated Rogalang repeats the same lines and template expressions many
+    times. Whole lines without a literal spanning them and the code inside
+    template expressions are memoized separately, keyed by their exact
+    source text. Each kind holds at most max_entries fragments of at most
+    max_key_length characters, and the memo is cleared whenever it is used
+    with a different semantics table.
+
+    A memo is thread-safe and can be shared between transpilers.
+    """
+
+    KINDS = ("line", "expression")
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MEMO_ENTRIES,
+        max_key_length: int = MEMO_MAX_KEY_LENGTH,
+    ):
+        self.max_entries = max_entries
+        self.max_key_length = max_key_length
+        self.digest: Optional[str] = None
+        self._tables: Dict[str, OrderedDict] = {
+            kind: OrderedDict() for kind in self.KINDS
+        }
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def bind(self, semantics: Semantics) -> None:
+        """Clear the memo if it was filled with other semantics"""
+        if semantics.digest != self.digest:
+            with self._lock:
+                if semantics.digest != self.digest:
+                    for table in self._tables.values():
+                        table.clear()
+                    self.digest = semantics.digest
+
+    def get(self, kind: str, key: str, digest: Optional[str] = None) -> Optional[str]:
+        """
+        Look up a transpiled fragment, marking it as recently used.
+
+        A digest other than the one the memo is bound to (as after a reload
+        during the transpilation) never hits, so the fragments of one
+        semantics table are never used with another.
+        """
+        table = self._tables[kind]
+        with self._lock:
+            value = table.get(key) if digest in (None, self.digest) else None
+            if value is None:
+                self.misses[kind] += 1
+            else:
+                table.move_to_end(key)
+                self.hits[kind] += 1
+        return value
+
+    def put(
+        self, kind: str, key: str, value: str, digest: Optional[str] = None
+    ) -> None:
+        """
+        Store a transpiled fragment, evicting the least recently used one.
+        Fragments of a digest the memo is no longer bound to are dropped.
+        """
+        if len(key) > self.max_key_length:
+            return
+        table = self._tables[kind]
+        with self._lock:
+            if digest not in (None, self.digest):
+                return
+            table[key] = value
+            if len(table) > self.max_entries:
+                table.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            for table in self._tables.values():
+                table.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Entries, hits, misses and hit rate of every kind of fragment"""
+        with self._lock:
+            result = {}
+            for kind, table in self._tables.items():
+                hits, misses = self.hits[kind], self.misses[kind]
+                result[kind] = {
+                    "entries": len(table),
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                }
+            return result
+
+
 ###########################
 # Process string literals #
 ###########################
 
-STRING_LITERALS: List[StringLiteral] = []
+# Matches double/single-quoted strings, which cannot contain real newlines
+QUOTED_STRING_REGEX = re.compile(r"\"(?:\\.|[^\\\"\n])*\"|'(?:\\.|[^\\'\n])*'")
 
-# Matches:
-# - backtick-delimited strings with real newlines
-# - double/single-quoted strings without real newlines
-STRING_REGEX = re.compile(
-    r"(?:`(?:\\.|[\s\S])*`|\"(?:\\.|[^\\\"\n])*\"|'(?:\\.|[^\\'\n])*')"
-)
+# Matches what can start a string literal in code, inside template
+# expressions the braces are matched as well to find the closing }
+CODE_EVENT_REGEX = re.compile(r"[`'\"]")
+EXPRESSION_EVENT_REGEX = re.compile(r"[`'\"{}]")
+
+# Matches what can end a run of text inside a template literal
+TEMPLATE_EVENT_REGEX = re.compile(r"\\.|`|\$\{", re.DOTALL)
+
+# The code inside the template expressions of a string literal, as flat
+# start, end offset pairs into the source. Everything else is literal text
+Expressions = Sequence[int]
+
+# The expressions of a string literal without any
+NO_EXPRESSIONS: Expressions = ()
+
+
+class ScanResult(NamedTuple):
+    # The top level (start, end, expressions) items, where expressions is None
+    # for code and the expressions of a string literal otherwise
+    items: List[Tuple[int, int, Optional[Expressions]]]
+    # The offset of the first template literal that was never closed
+    open_template: Optional[int]
+    # The deepest nesting of template literals
+    max_template_depth: int
+
+
+def scan_rogalang(content: str) -> ScanResult:
+    """
+    Split Rogalang code into code and string literals in a single pass.
+
+    Nested template literals are tracked with an explicit stack of open
+    templates and the brace depth of their ${...} expressions, so there is
+    no recursion and braces inside expressions are handled correctly. A
+    template literal that is never closed is treated as code, like a quote
+    without a closing quote on the same line.
+
+    Args:
+        content: The Rogalang code to scan
+
+    Returns:
+        The code and string literals of content, see ScanResult
+    """
+    items = []
+    expressions: Optional[List[int]] = None
+    # None for an open template literal, the brace depth for an expression
+    stack: List[Optional[int]] = []
+    literal_start = run_start = pos = 0
+    open_template = None
+    max_stack = 0
+
+    while True:
+        if not stack:
+            match = CODE_EVENT_REGEX.search(content, pos)
+        elif stack[-1] is None:
+            match = TEMPLATE_EVENT_REGEX.search(content, pos)
+        else:
+            match = EXPRESSION_EVENT_REGEX.search(content, pos)
+
+        if match is None:
+            if not stack:
+                break
+            # Rescan an unclosed template literal from its backtick as code
+            if open_template is None:
+                open_template = literal_start
+            if items and items[-1][2] is None and items[-1][1] == literal_start:
+                run_start = items.pop()[0]
+            else:
+                run_start = literal_start
+            expressions = None
+            stack = []
+            pos = literal_start + 1
+            continue
+
+        event = match.group()
+        start = match.start()
+
+        if stack and stack[-1] is None:
+            # Inside the text of a template literal
+            pos = match.end()
+            if event == "`":
+                stack.pop()
+                run_start = pos
+                if not stack:
+                    items.append((literal_start, pos, expressions or NO_EXPRESSIONS))
+                    expressions = None
+            elif event == "${":
+                stack.append(0)
+                run_start = pos
+            continue
+
+        # Inside code, either at the top level or in a template expression
+        if event == "{":
+            stack[-1] += 1
+            pos = match.end()
+            continue
+        if event == "}":
+            pos = match.end()
+            if stack[-1]:
+                stack[-1] -= 1
+            else:
+                # The end of the template expression
+                stack.pop()
+                if start > run_start:
+                    expressions += (run_start, start)
+                run_start = start
+            continue
+
+        if event != "`":
+            string = QUOTED_STRING_REGEX.match(content, start)
+            if string is None:
+                # A quote without a closing quote is just code
+                pos = start + 1
+                continue
 
-# Matches template expressions like ${exp}
-STRING_TEMPLATE_EXPRESSION_REGEX = re.compile(r"\$\{[^\}]*\}")
+        # The code before the string literal
+        if stack:
+            if start > run_start:
+                expressions += (run_start, start)
+        else:
+            if start > run_start:
+                items.append((run_start, start, None))
+            literal_start = start
+            expressions = []
+
+        if event == "`":
+            stack.append(None)
+            if len(stack) > max_stack:
+                max_stack = len(stack)
+            run_start = start
+            pos = match.end()
+        else:
+            pos = run_start = string.end()
+            if not stack:
+                items.append((start, pos, NO_EXPRESSIONS))
+                expressions = None
+
+    if run_start < len(content):
+        items.append((run_start, len(content), None))
+    # The stack alternates between templates and their expressions
+    return ScanResult(items, open_template, (max_stack + 1) // 2)
 
 
 class StringLiteral:
-    """A string literal in Rogalang"""
+    """
+    A string literal in Rogalang.
 
-    def __init__(self, content: str):
-        self.string_template_expressions = []
+    Only offsets into the source are kept, the text of the literal is sliced
+    out of the source when the literal is emitted.
+    """
 
-        # Determine quoting style to decide if this is a template literal
-        self.quote_char = content[0] if content else ""
-        self.is_template = self.quote_char == "`"
+    __slots__ = (
+        "source",
+        "start",
+        "end",
+        "expressions",
+        "replaced",
+        "semantics",
+        "memo",
+        "minify",
+    )
 
-        if self.is_template:
-            template_expressions = STRING_TEMPLATE_EXPRESSION_REGEX.findall(content)
-            for exp in template_expressions:
-                # replace the exp in ${exp} with a placeholder index
-                content = content.replace(
-                    exp, f"${{{len(self.string_template_expressions)}}}"
-                )
-                # remove the ${ and }
-                exp = exp[2:-1]
-                # Recursively transpile the template expression
-                transpiled_exp = transpile_rogalang(exp)
-                self.string_template_expressions.append(transpiled_exp)
+    def __init__(
+        self,
+        source: str,
+        context: Optional[TranspileContext] = None,
+        expressions: Optional[Expressions] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+    ):
+        """
+        Args:
+            source: The Rogalang code containing the string literal
+            context: The transpilation the literal belongs to
+            expressions: The expressions of the literal, scanned if not given
+            start: Offset of the opening quote in source
+            end: Offset after the closing quote in source, defaults to the
+                end of source
+        """
+        if context is None:
+            context = TranspileContext(get_semantics())
+        if end is None:
+            end = len(source)
+        if expressions is None:
+            items = scan_rogalang(source[start:end]).items
+            if len(items) == 1 and items[0][2] is not None:
+                expressions = [offset + start for offset in items[0][2]]
+            else:
+                # Not a complete string literal, keep it as is
+                expressions = NO_EXPRESSIONS
 
-        # Persist the content
-        self.content = content
+        self.source = source
+        self.start = start
+        self.end = end
+        self.expressions = expressions
+        # The transpiled code of every expression
+        self.replaced: Optional[List[str]] = None
+        self.semantics = context.semantics
+        self.memo = context.memo
+        self.minify = context.minify
 
-    def __str__(self):
-        # Only expand placeholders for template literals
-        if not self.is_template:
-            return self.content
+    @property
+    def content(self) -> str:
+        """The string literal, including its quotes"""
+        return self.source[self.start : self.end]
 
-        content = self.content
-        for i, exp in enumerate(self.string_template_expressions):
-            content = content.replace(f"${{{i}}}", f"${{{exp}}}")
-        return content
+    @property
+    def quote_char(self) -> str:
+        return self.source[self.start] if self.end > self.start else ""
+
+    @property
+    def is_template(self) -> bool:
+        return self.quote_char == "`"
+
+    def expression_code(self) -> List[str]:
+        """The Rogalang code of every template expression"""
+        source = self.source
+        expressions = self.expressions
+        return [
+            source[expressions[i] : expressions[i + 1]]
+            for i in range(0, len(expressions), 2)
+        ]
+
+    def replace_tokens(
+        self, counts: Optional[Counter] = None, edits: Optional[List[Edit]] = None
+    ) -> None:
+        """
+        Transpile the template expressions, no recursion needed.
+
+        Args:
+            counts: Counter to add the number of replacements per token to
+            edits: List to append every replacement to, for source maps
+        """
+        expressions = self.expressions
+        if not expressions:
+            return
+        if self.minify:
+            minify_tokens = self.semantics.minify_tokens
+            self.replaced = [
+                minify_tokens(code, counts, after_literal=True)
+                for code in self.expression_code()
+            ]
+            return
+        replace_tokens = self.semantics.replace_tokens
+        memo = self.memo
+        digest = self.semantics.digest
+        if edits is not None:
+            source = self.source
+            self.replaced = [
+                replace_tokens(source[start:end], counts, edits, start)
+                for start, end in zip(expressions[::2], expressions[1::2])
+            ]
+            return
+        if memo is None:
+            self.replaced = [
+                replace_tokens(code, counts) for code in self.expression_code()
+            ]
+            return
+
+        replaced = []
+        for code in self.expression_code():
+            result = memo.get("expression", code, digest)
+            if result is None:
+                result = replace_tokens(code, counts)
+                memo.put("expression", code, result, digest)
+            replaced.append(result)
+        self.replaced = replaced
+
+    def emit(self, output: List[str]) -> None:
+        """Append the transpiled literal to output"""
+        expressions = self.expressions
+        if not expressions:
+            output.append(self.source[self.start : self.end])
+            return
+        if self.replaced is None:
+            self.replace_tokens()
+        source = self.source
+        pos = self.start
+        for i, replaced in enumerate(self.replaced):
+            output.append(source[pos : expressions[2 * i]])
+            output.append(replaced)
+            pos = expressions[2 * i + 1]
+        output.append(source[pos : self.end])
+
+    def __str__(self):
+        output: List[str] = []
+        self.emit(output)
+        return "".join(output)
 
     def __repr__(self):
         return str(self)
 
 
-def transpile_rogalang(content: str, _reset_state: bool = False) -> str:
+# Code and string literals, in source order
+Segments = List[Union[str, StringLiteral]]
+
+
+class TranspileContext:
+    """
+    The state of a single transpilation.
+
+    Owns the table of string literals found in the code, the profile to
+    record the transpilation in if profiling is enabled and the replaced
+    tokens if a source map is being built.
+    """
+
+    def __init__(
+        self,
+        semantics: Semantics,
+        stats: Optional[TranspileStats] = None,
+        memo: Optional[TranspileMemo] = None,
+        edits: Optional[List[Edit]] = None,
+        minify: bool = False,
+    ):
+        if minify and edits is not None:
+            raise ValueError("Cannot write a source map of minified output")
+        self.semantics = semantics
+        self.stats = stats
+        # Memoized output has no record of its replacements, and minified
+        # lines depend on the lines around them
+        self.memo = memo if edits is None and not minify else None
+        if self.memo is not None:
+            self.memo.bind(semantics)
+        self.edits = edits
+        # Whether to drop the whitespace and comments the output does not need
+        self.minify = minify
+        self.string_literals: List[StringLiteral] = []
+
+    def transpile(self, content: str) -> str:
+        """
+        Transpile Rogalang code to JavaScript.
+
+        String literals are located in one pass and only the code between
+        them (and inside template expressions) is rewritten, so the output is
+        built from spans of the input in a single join.
+
+        Args:
+            content: The Rogalang code to transpile
+
+        Returns:
+            The transpiled JavaScript code
+        """
+        if self.memo is None:
+            result = self._transpile(content)
+        else:
+            result = self._transpile_memoized(content)
+
+        stats = self.stats
+        if stats is not None:
+            stats.transpilations += 1
+            stats.bytes_in += len(content.encode("utf-8"))
+            stats.bytes_out += len(result.encode("utf-8"))
+        return result
+
+    def _transpile(self, content: str, scan: Optional[ScanResult] = None) -> str:
+        stats = self.stats
+        if stats is None:
+            segments = self.extract_literals(content, scan)
+            self.replace_tokens(segments)
+            return self.restore(segments)
+
+        start = perf_counter()
+        segments = self.extract_literals(content, scan)
+        extracted = perf_counter()
+        stats.add_time("extract_literals", extracted - start)
+        self.replace_tokens(segments)
+        replaced = perf_counter()
+        stats.add_time("replace_tokens", replaced - extracted)
+        result = self.restore(segments)
+        stats.add_time("restore", perf_counter() - replaced)
+        return result
+
+    def _transpile_memoized(self, content: str) -> str:
+        """
+        Transpile content line by line, looking every line up in the memo.
+
+        A line that leaves a template literal open is transpiled together
+        with the following lines, up to the end of a line where every
+        literal is closed.
+        """
+        memo = self.memo
+        digest = self.semantics.digest
+        output = []
+        pos = 0
+        length = len(content)
+        while pos < length:
+            end = content.find("\n", pos) + 1 or length
+            line = content[pos:end]
+            result = memo.get("line", line, digest)
+            if result is None:
+                scan = scan_rogalang(line)
+                if scan.open_template is None:
+                    result = self._transpile(line, scan)
+                    memo.put("line", line, result, digest)
+                else:
+                    end, scan = self._closed_chunk(content, pos, end)
+                    result = self._transpile(content[pos:end], scan)
+            output.append(result)
+            pos = end
+        return "".join(output)
+
+    @staticmethod
+    def _closed_chunk(content: str, pos: int, end: int) -> Tuple[int, ScanResult]:
+        """
+        Find the end of the shortest run of whole lines from pos on that
+        leaves no template literal open, given that the line ending at end
+        does. Doubles the number of lines scanned every time, so the cost
+        stays linear in the size of the chunk.
+        """
+        lines = 1
+        while end < len(content):
+            lines *= 2
+            for _ in range(lines):
+                end = content.find("\n", end) + 1 or len(content)
+                if end == len(content):
+                    break
+            scan = scan_rogalang(content[pos:end])
+            if scan.open_template is None:
+                return end, scan
+        # Never closed, so it is code like in a single pass over content
+        return end, scan_rogalang(content[pos:end])
+
+    def extract_literals(
+        self, content: str, scan: Optional[ScanResult] = None
+    ) -> Segments:
+        """
+        Split code into code and string literals, adding the string literals
+        to the literal table.
+
+        Args:
+            content: The Rogalang code
+            scan: The result of scan_rogalang(content), if already known
+        """
+        segments = []
+        allocated = len(self.string_literals)
+        if scan is None:
+            scan = scan_rogalang(content)
+        for start, end, expressions in scan.items:
+            if expressions is None:
+                segments.append(content[start:end])
+                continue
+            literal = StringLiteral(content, self, expressions, start, end)
+            self.string_literals.append(literal)
+            segments.append(literal)
+
+        stats = self.stats
+        if stats is not None:
+            stats.allocations["extract_literals"] += (
+                len(self.string_literals) - allocated
+            )
+            stats.max_template_depth = max(
+                stats.max_template_depth, scan.max_template_depth
+            )
+        return segments
+
+    def replace_tokens(self, segments: Segments) -> None:
+        """
+        Replace all tokens in the code segments and template expressions in
+        place, minifying them if the context minifies. The boundary of a
+        string literal counts as a delimiter.
+        """
+        replace_tokens = self.semantics.replace_tokens
+        counts = self.stats.replacements if self.stats is not None else None
+        edits = self.edits
+        if self.minify:
+            minify_tokens = self.semantics.minify_tokens
+            for i, segment in enumerate(segments):
+                if isinstance(segment, str):
+                    segments[i] = minify_tokens(segment, counts, after_literal=i > 0)
+                else:
+                    segment.replace_tokens(counts)
+            return
+        if edits is None:
+            for i, segment in enumerate(segments):
+                if isinstance(segment, str):
+                    segments[i] = replace_tokens(segment, counts)
+                else:
+                    segment.replace_tokens(counts)
+            return
+
+        # The segments are contiguous, so the offset of code is known
+        pos = 0
+        for i, segment in enumerate(segments):
+            if isinstance(segment, str):
+                segments[i] = replace_tokens(segment, counts, edits, pos)
+                pos += len(segment)
+            else:
+                segment.replace_tokens(counts, edits)
+                pos = segment.end
+
+    def transpile_batch(self, contents: Sequence[str]) -> List[str]:
+        """
+        Transpile several pieces of Rogalang code with one scan and one
+        token replacement pass over all of them.
+
+        The pieces are joined with BATCH_SEPARATOR and scanned at once. As
+        long as no string literal crosses a separator, every piece starts
+        outside of any literal, just like when it is scanned on its own.
+        Otherwise every piece is scanned separately. The code segments and
+        template expressions are then joined and rewritten at once.
+
+        Args:
+            contents: The Rogalang code to transpile, none of which may
+                contain BATCH_SEPARATOR
+
+        Returns:
+            The transpiled JavaScript code, in the same order as contents
+        """
+        if not contents:
+            return []
+        stats = self.stats
+        start = perf_counter()
+        joined = BATCH_SEPARATOR.join(contents)
+        scan = scan_rogalang(joined)
+        if scan.open_template is None and not any(
+            expressions is not None and joined.find(BATCH_SEPARATOR, begin, end) >= 0
+            for begin, end, expressions in scan.items
+        ):
+            batch = [self.extract_literals(joined, scan)]
+        else:
+            batch = [self.extract_literals(content) for content in contents]
+        code: List[str] = []
+        for segments in batch:
+            for segment in segments:
+                if isinstance(segment, str):
+                    code.append(segment)
+                else:
+                    code.extend(segment.expression_code())
+        extracted = perf_counter()
+
+        counts = stats.replacements if stats is not None else None
+        replaced = iter(
+            self.semantics.replace_tokens(BATCH_SEPARATOR.join(code), counts).split(
+                BATCH_SEPARATOR
+            )
+        )
+        for segments in batch:
+            for i, segment in enumerate(segments):
+                if isinstance(segment, str):
+                    # Code scanned in one go still contains the separators
+                    pieces = segment.count(BATCH_SEPARATOR) + 1
+                    segments[i] = BATCH_SEPARATOR.join(islice(replaced, pieces))
+                elif segment.expressions:
+                    segment.replaced = [
+                        next(replaced) for _ in range(len(segment.expressions) // 2)
+                    ]
+        replaced_at = perf_counter()
+
+        if len(batch) == 1:
+            results = self.restore(batch[0]).split(BATCH_SEPARATOR)
+        else:
+            results = [self.restore(segments) for segments in batch]
+        if stats is not None:
+            stats.add_time("extract_literals", extracted - start)
+            stats.add_time("replace_tokens", replaced_at - extracted)
+            stats.add_time("restore", perf_counter() - replaced_at)
+            stats.transpilations += len(results)
+            for content, result in zip(contents, results):
+                stats.bytes_in += len(content.encode("utf-8"))
+                stats.bytes_out += len(result.encode("utf-8"))
+        return results
+
+    def restore(self, segments: Segments) -> str:
+        """Join the code and string literals back together"""
+        output: List[str] = []
+        append = output.append
+        for segment in segments:
+            if isinstance(segment, str):
+                append(segment)
+            else:
+                segment.emit(output)
+        return "".join(output)
+
+
+#############
+# Streaming #
+#############
+
+
+def find_open_template(content: str) -> Optional[int]:
+    """
+    Find a template literal that is still open at the end of content.
+
+    Args:
+        content: Rogalang code, possibly ending in the middle of a literal
+
+    Returns:
+        The offset of the opening backtick, or None if no template is open
+    """
+    return scan_rogalang(content).open_template
+
+
+def find_carry_start(
+    content: str, semantics: Semantics, scan: Optional[ScanResult] = None
+) -> Optional[int]:
+    """
+    Find where to split content to carry a template literal that is still
+    open at its end over to the next chunk.
+
+    That is the opening backtick, unless a Rogalang token ends right before
+    it: the end of a chunk delimits tokens, while the backtick does not if
+    the template turns out to never close. The split is at the start of the
+    code the backtick is part of then, so the code before the split is
+    transpiled exactly like in a single pass over the whole source.
+
+    Args:
+        content: Rogalang code, possibly ending in the middle of a literal
+        semantics: Semantics the code is transpiled with
+        scan: The result of scan_rogalang(content), if already known
+
+    Returns:
+        The offset to split at, or None if no template is open
+    """
+    if scan is None:
+        scan = scan_rogalang(content)
+    open_template = scan.open_template
+    if open_template is None:
+        return None
+    code_start = 0
+    for start, _, _ in reversed(scan.items):
+        if start <= open_template:
+            code_start = start
+            break
+    token = None
+    for token in semantics.regex.finditer(content[code_start:open_template]):
+        pass
+    if token is not None and code_start + token.end() == open_template:
+        return code_start
+    return open_template
+
+
+class TemplateCarry:
+    """
+    Code carried over from chunk to chunk while a template literal in it is
+    still open.
+
+    The carried code is only scanned again once it has doubled in size, so
+    a template literal that stays open for the rest of the source costs
+    time linear in its size rather than quadratic.
+    """
+
+    def __init__(self, semantics: Semantics, eager_size: int = 0) -> None:
+        """
+        Args:
+            semantics: Semantics the code is transpiled with
+            eager_size: Carried code shorter than this is scanned again on
+                every feed, to find out right away when a short template
+                literal closes. Costs at most this much per feed
+        """
+        self.semantics = semantics
+        self.eager_size = eager_size
+        self._held: List[str] = []
+        self._size = 0
+        self._scanned = 0
+
+    def __bool__(self) -> bool:
+        return bool(self._held)
+
+    def __len__(self) -> int:
+        """The length of the carried code"""
+        return self._size
+
+    def hold(self, content: str) -> None:
+        """Carry content, which is known to start a template still open"""
+        self._held = [content] if content else []
+        self._size = self._scanned = len(content)
+
+    def feed(self, content: str) -> str:
+        """
+        Add the next chunk of code.
+
+        Returns:
+            The code before any template literal still open, which can be
+            transpiled on its own. Empty while the carried code is held
+        """
+        if self._held:
+            self._held.append(content)
+            self._size += len(content)
+            if self._size >= self.eager_size and self._size < 2 * self._scanned:
+                return ""
+            content = "".join(self._held)
+        start = find_carry_start(content, self.semantics)
+        if start is None:
+            self.hold("")
+            return content
+        self.hold(content[start:])
+        return content[:start]
+
+    def finish(self) -> str:
+        """Take the carried code at the end of the source"""
+        content = "".join(self._held)
+        self.hold("")
+        return content
+
+
+##############
+# Transpiler #
+##############
+
+
+def _is_series(values: Any) -> bool:
+    """Whether values looks like a pandas Series, without importing pandas"""
+    index = getattr(values, "index", None)
+    return index is not None and not callable(index) and hasattr(values, "tolist")
+
+
+# Buffer size used when writing transpiled files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+def optimize_chunks(
+    chunks: Iterable[str], stats: Optional[TranspileStats] = None
+) -> Iterator[str]:
+    """
+    Join transpiled chunks and optimize them as a whole, see optimizer.optimize.
+
+    Args:
+        chunks: The transpiled JavaScript of a whole file
+        stats: Profile to record the optimization in
+
+    Yields:
+        The optimized JavaScript, once every chunk was read
+    """
+    from optimizer import optimize
+
+    js = "".join(chunks)
+    start = perf_counter()
+    js = optimize(js)
+    if stats is not None:
+        stats.add_time("optimize", perf_counter() - start)
+    yield js
+
+
+def _record_origins(
+    lines: Iterable[str], source_map: SourceMapBuilder
+) -> Iterator[str]:
+    """Pass lines through, telling source_map where every 'jille' line is"""
+    jille_match = JILLE_PREFIX.match
+    for i, line in enumerate(lines):
+        match = jille_match(line)
+        # A bare 'jille' line is swallowed whole, newline included, so it
+        # adds no line of code to map
+        if match and match.end() < len(line):
+            source_map.add_origin(i, match.end())
+        yield line
+
+
+def write_output(
+    output_path: str, chunks: Iterable[str], stats: Optional[TranspileStats] = None
+) -> None:
+    """
+    Write transpiled chunks through a buffered temporary file next to
+    output_path, which only replaces output_path once every chunk has been
+    written.
+
+    Args:
+        output_path: Path of the JavaScript file to write
+        chunks: The transpiled JavaScript
+        stats: Profile to record the time spent writing in
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    try:
+        with open(fd, "w", encoding="utf-8", buffering=OUTPUT_BUFFER_SIZE) as output:
+            if stats is None:
+                for chunk in chunks:
+                    output.write(chunk)
+            else:
+                for chunk in chunks:
+                    start = perf_counter()
+                    output.write(chunk)
+                    stats.add_time("write", perf_counter() - start)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Transpiler:
+    """
+    Transpiles Rogalang to JavaScript.
+
+    A Transpiler only holds the compiled semantics and an optional memo,
+    everything belonging to a single transpilation lives in its own
+    TranspileContext. One instance can therefore be shared between threads.
+
+    Every method takes a dialect to transpile with instead, by its name in
+    DIALECTS. The semantics are looked up once per call, so a call keeps
+    the semantics it started with while the dialect is reloaded.
+    """
+
+    def __init__(
+        self,
+        semantics: Optional[Semantics] = None,
+        memo: Optional[TranspileMemo] = None,
+    ):
+        """
+        Args:
+            semantics: Semantics to use, defaults to the default semantics
+            memo: Memo of transpiled fragments to reuse between calls
+        """
+        self._semantics = semantics
+        self.memo = memo
+        # Memos of the other dialects, so they do not clear each other
+        self._dialect_memos: Dict[str, TranspileMemo] = {}
+
+    @property
+    def semantics(self) -> Semantics:
+        if self._semantics is None:
+            return get_semantics()
+        return self._semantics
+
+    def _resolve(
+        self, dialect: Optional[str]
+    ) -> Tuple[Semantics, Optional[TranspileMemo]]:
+        """The semantics to transpile with and the memo to use with them"""
+        if dialect is None:
+            return self.semantics, self.memo
+        semantics = DIALECTS.get(dialect)
+        memo = self.memo
+        if memo is not None:
+            memo = self._dialect_memos.get(dialect)
+            if memo is None:
+                memo = self._dialect_memos.setdefault(
+                    dialect,
+                    TranspileMemo(self.memo.max_entries, self.memo.max_key_length),
+                )
+        return semantics, memo
+
+    def transpile(
+        self,
+        content: str,
+        stats: Optional[TranspileStats] = None,
+        dialect: Optional[str] = None,
+        minify: bool = False,
+    ) -> str:
+        """
+        Transpile Rogalang code to JavaScript.
+
+        Args:
+            content: The preprocessed Rogalang code to transpile
+            stats: Profile to record the transpilation in
+            dialect: Name of the dialect to transpile with
+            minify: Whether to drop the whitespace and comments the
+                JavaScript does not need, see Semantics.minify_tokens. The
+                memo is not used then
+
+        Returns:
+            The transpiled JavaScript code
+
+        Raises:
+            ValueError: If there is no such dialect
+        """
+        semantics, memo = self._resolve(dialect)
+        return TranspileContext(semantics, stats, memo, minify=minify).transpile(
+            content
+        )
+
+    def transpile_many(
+        self, contents: Iterable[str], max_workers: Optional[int] = None
+    ) -> List[str]:
+        """
+        Transpile several pieces of Rogalang code in a thread pool.
+
+        Args:
+            contents: The preprocessed Rogalang code to transpile
+            max_workers: Number of threads, defaults to the executor default
+
+        Returns:
+            The transpiled JavaScript code, in the same order as contents
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.transpile, contents))
+
+    def transpile_batch(
+        self,
+        snippets: Iterable[Any],
+        validate: bool = False,
+        stats: Optional[TranspileStats] = None,
+        dialect: Optional[str] = None,
+    ) -> Any:
+        """
+        Transpile many small snippets in one call.
+
+        Every snippet is scanned for string literals on its own, but all of
+        them share a single token replacement pass, which saves most of the
+        per-call overhead of transpiling tiny snippets one by one. A snippet
+        that fails does not affect the others: its exception is returned in
+        its place, like asyncio.gather(return_exceptions=True).
+
+        Args:
+            snippets: Rogalang snippets, e.g. a list or a pandas Series
+            validate: Whether the snippets are whole Rogalang sources to
+                validate and preprocess, instead of preprocessed code
+            stats: Profile to record the transpilation in
+            dialect: Name of the dialect to transpile with
+
+        Returns:
+            The transpiled JavaScript code or the exception of every snippet,
+            in order. A list, or a Series with the same index for a Series
+
+        Raises:
+            ValueError: If there is no such dialect
+        """
+        series = _is_series(snippets)
+        values = snippets.tolist() if series else list(snippets)
+        results: List[Any] = [None] * len(values)
+        context = TranspileContext(self._resolve(dialect)[0], stats)
+        indices = []
+        contents = []
+        for i, snippet in enumerate(values):
+            try:
+                if not isinstance(snippet, str):
+                    raise TypeError(
+                        f"Snippet must be a string, not {type(snippet).__name__}"
+                    )
+                if validate:
+                    snippet = "".join(
+                        iter_validated_lines(
+                            snippet.splitlines(keepends=True), fail_fast=True
+                        )
+                    )
+            except (TypeError, ValueError) as e:
+                results[i] = e
+                continue
+            if BATCH_SEPARATOR in snippet:
+                # Would be split apart, so it is transpiled on its own
+                results[i] = context.transpile(snippet)
+                continue
+            indices.append(i)
+            contents.append(snippet)
+
+        for i, result in zip(indices, context.transpile_batch(contents)):
+            results[i] = result
+        if series:
+            return type(snippets)(
+                results, index=snippets.index, name=snippets.name, dtype=object
+            )
+        return results
+
+    def transpile_stream(
+        self,
+        source: Iterable[str],
+        stats: Optional[TranspileStats] = None,
+        source_map: Optional[SourceMapBuilder] = None,
+        dialect: Optional[str] = None,
+        minify: bool = False,
+    ) -> Iterator[str]:
+        """
+        Validate and transpile Rogalang source one 'herliga london' segment at a time.
+
+        Template literals that are still open at the end of a segment are carried
+        over to the next one, so memory stays bounded by the segment (and literal)
+        size instead of the file size. The output is the same as that of
+        transpiling all of the preprocessed source at once.
+
+        Args:
+            source: Lines of the Rogalang source, e.g. an open file
+            stats: Profile to record the transpilation in
+            source_map: Source map to record the transpilation in
+            dialect: Name of the dialect to transpile with, every segment
+                is transpiled with its semantics at the first segment
+            minify: Whether to drop the whitespace and comments the
+                JavaScript does not need. Line breaks between chunks are kept
+
+        Yields:
+            Transpiled JavaScript, one chunk per segment
+
+        Raises:
+            ValueError: If validation fails, there is no such dialect or
+                both source_map and minify are given
+        """
+        if source_map is not None and minify:
+            raise ValueError("Cannot write a source map of minified output")
+        return self._transpile_stream(
+            source, *self._resolve(dialect), stats, source_map, minify
+        )
+
+    def _transpile_stream(
+        self,
+        source: Iterable[str],
+        semantics: Semantics,
+        memo: Optional[TranspileMemo],
+        stats: Optional[TranspileStats],
+        source_map: Optional[SourceMapBuilder],
+        minify: bool = False,
+    ) -> Iterator[str]:
+        if source_map is not None:
+            source = _record_origins(source, source_map)
+        segments = iter_rogalang_segments(source)
+        if stats is not None:
+            segments = stats.timed(segments, "validate")
+        carry = TemplateCarry(semantics)
+        for segment in segments:
+            if stats is None:
+                content = carry.feed("".join(segment))
+            else:
+                start = perf_counter()
+                content = carry.feed("".join(segment))
+                stats.add_time("find_open_template", perf_counter() - start)
+            if content:
+                yield self._transpile_mapped(
+                    content, semantics, memo, stats, source_map, minify
+                )
+        pending = carry.finish()
+        if pending:
+            yield self._transpile_mapped(
+                pending, semantics, memo, stats, source_map, minify
+            )
+
+    @staticmethod
+    def _transpile_mapped(
+        content: str,
+        semantics: Semantics,
+        memo: Optional[TranspileMemo],
+        stats: Optional[TranspileStats],
+        source_map: Optional[SourceMapBuilder],
+        minify: bool = False,
+    ) -> str:
+        """Transpile content, recording it in source_map if given"""
+        if source_map is None:
+            context = TranspileContext(semantics, stats, memo, minify=minify)
+            return context.transpile(content)
+        edits: List[Edit] = []
+        result = TranspileContext(semantics, stats, edits=edits).transpile(content)
+        source_map.add(content, edits)
+        return result
+
+    def transpile_file(
+        self,
+        source_path: str,
+        output_path: str,
+        cache: Optional[TranspileCache] = None,
+        stats: Optional[TranspileStats] = None,
+        source_map: Optional[str] = None,
+        dialect: Optional[str] = None,
+        optimize: bool = False,
+        minify: bool = False,
+    ) -> None:
+        """
+        Validate and transpile a Rogalang file into a JavaScript file.
+
+        The output is streamed through a buffered temporary file next to
+        output_path, which only replaces output_path once the whole file has
+        been transpiled.
+
+        Args:
+            source_path: Path of the Rogalang source file
+            output_path: Path of the JavaScript file to write
+            cache: Cache to look up and store the transpiled file in, not
+                used when writing a source map
+            stats: Profile to record the transpilation in, cache hits are
+                not transpiled and therefore not recorded
+            source_map: 'inline' to append a source map to the JavaScript,
+                'file' to write it to output_path + '.map'
+            dialect: Name of the dialect to transpile with
+            optimize: Whether to fold constants and compact if-ladders, see
+                optimizer.py. The whole output is held in memory to do so
+            minify: Whether to drop the whitespace and comments the
+                JavaScript does not need while replacing tokens, see
+                Semantics.minify_tokens
+
+        Raises:
+            ValueError: If validation fails or there is no such dialect
+        """
+        if source_map is not None:
+            if source_map not in SOURCE_MAP_KINDS:
+                raise ValueError(f"Unknown source map kind: {source_map!r}")
+            if optimize:
+                raise ValueError("Cannot write a source map of optimized output")
+            if minify:
+                raise ValueError("Cannot write a source map of minified output")
+            cache = None
+        semantics, memo = self._resolve(dialect)
+        if cache is not None:
+            options = ",".join(
+                name
+                for name, enabled in (("optimize", optimize), ("minify", minify))
+                if enabled
+            )
+            key = cache.key_for_file(source_path, semantics.digest, options)
+            if cache.get_file(key, output_path):
+                return
+
+        with open(source_path, "r", encoding="utf-8") as source:
+            if source_map is None:
+                chunks = self._transpile_stream(
+                    source, semantics, memo, stats, None, minify
+                )
+                if optimize:
+                    chunks = optimize_chunks(chunks, stats)
+            else:
+                chunks = self._transpile_with_source_map(
+                    source, source_path, output_path, source_map, semantics, stats
+                )
+            write_output(output_path, chunks, stats)
+
+        if cache is not None:
+            cache.put_file(key, output_path)
+
+    def _transpile_with_source_map(
+        self,
+        source: Iterable[str],
+        source_path: str,
+        output_path: str,
+        kind: str,
+        semantics: Semantics,
+        stats: Optional[TranspileStats],
+    ) -> Iterator[str]:
+        """Transpile source, ending with the sourceMappingURL comment"""
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        builder = SourceMapBuilder(
+            os.path.relpath(os.path.abspath(source_path), output_dir).replace(
+                os.sep, "/"
+            ),
+            os.path.basename(output_path),
+        )
+        last = ""
+        for chunk in self._transpile_stream(source, semantics, None, stats, builder):
+            last = chunk
+            yield chunk
+        if last and not last.endswith("\n"):
+            yield "\n"
+        if kind == "inline":
+            yield builder.inline_comment()
+        else:
+            map_path = output_path + ".map"
+            write_output(map_path, [builder.to_json()])
+            yield url_comment(os.path.basename(map_path))
+
+
+DEFAULT_TRANSPILER = Transpiler()
+
+
+def transpile_rogalang(
+    content: str,
+    _reset_state: bool = False,
+    stats: Optional[TranspileStats] = None,
+    dialect: Optional[str] = None,
+    minify: bool = False,
+) -> str:
     """
-    Transpile Rogalang code to JavaScript.
-    This function can be called recursively on template expressions.
+    Transpile Rogalang code to JavaScript with the default semantics.
 
     Args:
         content: The Rogalang code to transpile
-        _reset_state: Internal flag to reset global state (used for top-level calls)
+        _reset_state: Unused, every call has its own state. Kept for
+            backwards compatibility
+        stats: Profile to record the transpilation in
+        dialect: Name of the dialect to transpile with instead
+        minify: Whether to drop the whitespace and comments the JavaScript
+            does not need
 
     Returns:
         The transpiled JavaScript code
     """
-    # Reset global state for top-level calls to enable independent test runs
-    global STRING_LITERALS
-    if _reset_state:
-        STRING_LITERALS = []
-
-    # Replace all ) with _) to avoid confusion with the string literal syntax
-    full_content = content.replace(")", "_)")
-    new_content = ""
-    last_position = 0
-
-    # Extract all string literals and add them to the global STRING_LITERALS list
-    for match in STRING_REGEX.finditer(full_content):
-        before = f".({full_content[last_position : match.start()]}.)"
-        new_content += f"{before} str{len(STRING_LITERALS)}"
-        STRING_LITERALS.append(StringLiteral(match.group()))
-        last_position = match.end()
-    full_content = new_content + f".({full_content[last_position:]}.)"
-
-    # Replace all tokens with their semantics, ensuring they're delimited
-    # Only include delimiters that exist in Rogalang (not replaced by semantics.csv)
-    delimiter_chars = r"\s(){}[\];,.?:"
-
-    for rogalang_token in sorted(semantics_dict, key=len, reverse=True):
-        if not rogalang_token:
-            continue
-        escaped_token = re.escape(rogalang_token)
-        # Use word boundaries: match token only when surrounded by delimiters
-        # We need to keep the delimiter before the token
-        pattern = f"(^|[{delimiter_chars}]){escaped_token}(?=[{delimiter_chars}]|$)"
-
-        def replace_with_delimiter(match):
-            return match.group(1) + semantics_dict[rogalang_token]
-
-        full_content = re.sub(pattern, replace_with_delimiter, full_content)
-
-    # Insert string literals back in between code delimiters (pattern: ".(xyz.) str1 .(abc.) str2")
-    INSIDE_CODE_REGEX = re.compile(r"\.\(.*?\.\)", re.DOTALL)
-    matches = list(INSIDE_CODE_REGEX.finditer(full_content))
-    new_content = ""
-    for i, match in enumerate(matches):
-        # Add the current match
-        new_content += match.group()
-
-        # If there's a next match, process the content between them
-        if i < len(matches) - 1:
-            between = full_content[match.end() : matches[i + 1].start()]
-            # Extract string literal index from "str{N}"
-            if between.strip().startswith("str"):
-                str_index = int(between.strip()[3:])
-                new_content += str(STRING_LITERALS[str_index])
-            else:
-                new_content += between
+    return DEFAULT_TRANSPILER.transpile(content, stats, dialect, minify)
 
-    # Add any content before first match
-    if matches:
-        new_content = full_content[: matches[0].start()] + new_content
-        # Add any content after last match
-        new_content += full_content[matches[-1].end() :]
-    else:
-        new_content = full_content
 
-    full_content = new_content
+def transpile_batch(
+    snippets: Iterable[Any],
+    validate: bool = False,
+    stats: Optional[TranspileStats] = None,
+    dialect: Optional[str] = None,
+) -> Any:
+    """
+    Transpile many small snippets in one call with the default semantics.
+    See Transpiler.transpile_batch.
+    """
+    return DEFAULT_TRANSPILER.transpile_batch(snippets, validate, stats, dialect)
 
-    # Remove code delimiters
-    full_content = full_content.replace(".(", "").replace(".)", "").replace("_)", ")")
 
-    return full_content
+def transpile_stream(
+    source: Iterable[str],
+    stats: Optional[TranspileStats] = None,
+    source_map: Optional[SourceMapBuilder] = None,
+    dialect: Optional[str] = None,
+    minify: bool = False,
+) -> Iterator[str]:
+    """
+    Validate and transpile Rogalang source one segment at a time with the
+    default semantics. See Transpiler.transpile_stream.
+    """
+    return DEFAULT_TRANSPILER.transpile_stream(
+        source, stats, source_map, dialect, minify
+    )
 
 
-if __name__ == "__main__":
-    with open("helloWorld.rl", "r") as f:
-        lines = f.readlines()
+def transpile_file(
+    source_path: str,
+    output_path: str,
+    cache: Optional[TranspileCache] = None,
+    stats: Optional[TranspileStats] = None,
+    source_map: Optional[str] = None,
+    dialect: Optional[str] = None,
+    optimize: bool = False,
+    minify: bool = False,
+) -> None:
+    """
+    Validate and transpile a Rogalang file into a JavaScript file with the
+    default semantics. See Transpiler.transpile_file.
+    """
+    DEFAULT_TRANSPILER.transpile_file(
+        source_path, output_path, cache, stats, source_map, dialect, optimize, minify
+    )
+
 
-    # Validate and preprocess the source
-    processed_lines = validate_and_preprocess_rogalang(lines)
+if __name__ == "__main__":
+    from cli import main
 
-    # Transpile the main content (template expressions are transpiled recursively during StringLiteral creation)
-    full_content = transpile_rogalang("".join(processed_lines), _reset_state=True)
-    print(full_content)
+    sys.exit(main())